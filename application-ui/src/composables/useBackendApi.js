@@ -5,7 +5,11 @@ import { ref } from 'vue'
  * @typedef {Object} BackendApi
  * @property {Function} captureImage - Captures an image and performs detection
  * @property {Array} detectedObjects - Detected objects in the latest capture
- * @property {Function} fetchLogs - Fetches all logs from the database
+ * @property {Function} fetchLogs - Fetches a page of logs (filters, cursor, fields) from the database
+ * @property {Function} fetchAllLogs - Fetches every log matching the filters, page by page
+ * @property {Function} imageUrl - Turns an image path returned by the backend into a full URL
+ * @property {Function} getStats - Fetches aggregated inspection statistics
+ * @property {Function} payloadImage - Gets an image from an event or response, inline or by reference
  * @property {Function} checkCarExists - Checks if a car exists in the database
  * @property {Function} updateItem - Updates an item in the database
  * @property {Function} addLog - Adds a new log to the database
@@ -73,15 +77,17 @@ export function useBackendApi() {
         console.warn(responseData.error || responseData.warning);
       }
       
-      // Update refs with base64 images directly
-      if (responseData.image) capturedImage.value = `data:image/jpeg;base64,${responseData.image}`;
-      if (responseData.result_image) resultImage.value = `data:image/jpeg;base64,${responseData.result_image}`;
+      // Images come inline (base64) or by reference (URL), depending on the backend's image_transport
+      const image = responseData.image ? `data:image/jpeg;base64,${responseData.image}` : payloadImage(responseData, 'original_image');
+      const result = payloadImage(responseData, 'result_image');
+      if (image) capturedImage.value = image;
+      if (result) resultImage.value = result;
       if (responseData.objects?.length) detectedObjects.value = responseData.objects;
       
       return {
-        image: responseData.image ? `data:image/jpeg;base64,${responseData.image}` : null,
+        image: image || null,
         objects: responseData.objects || [],
-        resultImage: responseData.result_image ? `data:image/jpeg;base64,${responseData.result_image}` : null,
+        resultImage: result || null,
         gray_percentage: responseData.gray_percentage,
         error: responseData.error,
         processing_time: responseData.processing_time,
@@ -104,17 +110,69 @@ export function useBackendApi() {
     }
   }
 
-  const fetchLogs = async () => {
+  /**
+   * Fetch a page of logs, newest first. Images are not included; use the
+   * original_image_url / result_image_url fields with imageUrl().
+   * @param {Object} filters - limit, cursor, outcome, expected_part, car_id, date_from, date_to, fields, include_images
+   * @returns {Promise<{items: Array, total: number, next_cursor: number|null, limit: number}>}
+   */
+  const fetchLogs = async (filters = {}) => {
     try {
-      const response = await axios.get(`${baseUrl}/logs`)
-      logs.value = response.data
-      return logs.value
+      const params = {}
+      for (const [key, value] of Object.entries(filters)) {
+        if (value !== undefined && value !== null && value !== '') params[key] = value
+      }
+      const response = await axios.get(`${baseUrl}/logs`, { params })
+      logs.value = response.data.items
+      return response.data
     } catch (error) {
       console.error('Error fetching logs:', error)
       throw error
     }
   }
 
+  const fetchAllLogs = async (filters = {}) => {
+    const items = []
+    let cursor = null
+    do {
+      const page = await fetchLogs({ ...filters, limit: 1000, cursor, count: cursor ? 'false' : 'true' })
+      items.push(...page.items)
+      cursor = page.next_cursor
+    } while (cursor)
+    logs.value = items
+    return items
+  }
+
+  const imageUrl = (path) => (path ? `${baseUrl}${path}` : '')
+
+  /**
+   * Image from a socket event or API response: the inline base64 image when the
+   * backend sends it, otherwise the cacheable URL of the referenced image
+   * @param {Object} payload - Event or response data
+   * @param {string} prefix - 'original_image' or 'result_image'
+   * @param {boolean} thumbnail - Return the embedded thumbnail instead of the full image URL
+   */
+  const payloadImage = (payload, prefix, thumbnail = false) => {
+    if (!payload) return ''
+    if (payload[prefix]) return `data:image/jpeg;base64,${payload[prefix]}`
+    if (thumbnail && payload[`${prefix}_thumb`]) return `data:image/jpeg;base64,${payload[`${prefix}_thumb`]}`
+    return imageUrl(payload[`${prefix}_url`])
+  }
+
+  /**
+   * Fetch aggregated statistics (per-bucket counts, confusion matrix, gray histogram)
+   * @param {Object} params - granularity ('hour' | 'shift' | 'day'), date_from, date_to, range ('all')
+   */
+  const getStats = async (params = {}) => {
+    try {
+      const response = await axios.get(`${baseUrl}/stats`, { params })
+      return response.data
+    } catch (error) {
+      console.error('Error fetching stats:', error)
+      throw error
+    }
+  }
+
   const checkCarExists = async (carId) => {
     try {
       const response = await axios.get(`${baseUrl}/check-car/${carId}`)
@@ -265,6 +323,10 @@ export function useBackendApi() {
     detectedObjects,
     resultImage,
     fetchLogs,
+    fetchAllLogs,
+    imageUrl,
+    payloadImage,
+    getStats,
     logs,
     checkCarExists,
     updateItem,
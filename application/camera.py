@@ -1,4 +1,3 @@
-import base64
 import cv2
 import os
 import numpy as np
@@ -7,7 +6,9 @@ import platform
 import uuid
 import sys
 import subprocess
-from PIL import Image, ImageDraw, ImageFont
+import threading
+from collections import deque
+from frame import Frame
 
 def list_available_cameras():
     """List all available camera devices to help with troubleshooting"""
@@ -59,11 +60,188 @@ def list_available_cameras():
     
     return available_cameras
 
-def capture_image():
+def open_camera(indices=(0, 1)):
+    """
+    Open the first camera that works from the given device indices.
+    Returns (cap, index), or (None, None) if no camera could be opened.
+    """
+    for index in indices:
+        cap = cv2.VideoCapture(index)
+        if cap.isOpened():
+            return cap, index
+        print(f"Failed to open camera with index ({index})")
+        cap.release()
+    return None, None
+
+class CaptureService:
+    """
+    Long-lived camera capture service.
+    Keeps the camera open in a background thread and grabs frames continuously
+    into a small ring buffer, so a PLC trigger gets the freshest frame
+    immediately instead of opening the device and waiting for auto-exposure.
+    Reconnects automatically when the device stops delivering frames.
+    """
+
+    def __init__(self, indices=(0, 1), buffer_size=3, warmup_seconds=1.0,
+                 reconnect_delay=2.0, max_read_failures=10):
+        self.indices = indices
+        self.warmup_seconds = warmup_seconds
+        self.reconnect_delay = reconnect_delay
+        self.max_read_failures = max_read_failures
+        self._buffer = deque(maxlen=buffer_size)  # (timestamp, ndarray)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._state = 'stopped'
+        self._device_index = None
+        self._started_at = None
+        self._frames_grabbed = 0
+        self._read_failures = 0
+        self._reconnects = 0
+        self._frames_served = 0
+        self._total_served_age_ms = 0.0
+        self._max_served_age_ms = 0.0
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background grab thread (no-op if already running)."""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='camera-capture', daemon=True)
+        self._thread.start()
+        print("Camera capture service started")
+
+    def stop(self, timeout=3.0):
+        """Stop the grab thread and release the camera."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        with self._condition:
+            self._buffer.clear()
+        self._state = 'stopped'
+        print("Camera capture service stopped")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._state = 'connecting'
+            cap, index = open_camera(self.indices)
+            if cap is None:
+                self._state = 'disconnected'
+                self._stop_event.wait(self.reconnect_delay)
+                self._reconnects += 1
+                continue
+
+            self._device_index = index
+            print(f"Camera capture service using camera index ({index})")
+            # Let auto-exposure settle once per connection, not once per car
+            self._state = 'warming_up'
+            self._stop_event.wait(self.warmup_seconds)
+            self._state = 'running'
+
+            consecutive_failures = 0
+            try:
+                while not self._stop_event.is_set():
+                    ret, frame = cap.read()
+                    if not ret or frame is None or frame.size == 0:
+                        self._read_failures += 1
+                        consecutive_failures += 1
+                        if consecutive_failures >= self.max_read_failures:
+                            print("Camera stopped delivering frames, reconnecting...")
+                            break
+                        time.sleep(0.05)
+                        continue
+                    consecutive_failures = 0
+                    with self._condition:
+                        self._buffer.append((time.time(), frame))
+                        self._frames_grabbed += 1
+                        self._condition.notify_all()
+            finally:
+                cap.release()
+                self._device_index = None
+
+            if not self._stop_event.is_set():
+                self._state = 'disconnected'
+                self._reconnects += 1
+                self._stop_event.wait(self.reconnect_delay)
+
+    def latest_frame(self, max_age=0.5, timeout=1.0):
+        """
+        Return the freshest buffered frame as a Frame.
+
+        Args:
+            max_age (float): Maximum accepted age in seconds; older frames wait for a new one
+            timeout (float): Seconds to wait for a fresh enough frame
+
+        Returns:
+            Frame or None if no fresh frame is available
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                if self._buffer:
+                    timestamp, image = self._buffer[-1]
+                    age = time.time() - timestamp
+                    if max_age is None or age <= max_age:
+                        age_ms = age * 1000
+                        self._frames_served += 1
+                        self._total_served_age_ms += age_ms
+                        self._max_served_age_ms = max(self._max_served_age_ms, age_ms)
+                        return Frame.from_array(image)
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.is_running:
+                    return None
+                self._condition.wait(remaining)
+
+    def stats(self):
+        """Return capture state and frame-age statistics."""
+        with self._condition:
+            last_age_ms = (time.time() - self._buffer[-1][0]) * 1000 if self._buffer else None
+            uptime = time.time() - self._started_at if self._started_at and self.is_running else 0
+            return {
+                'state': self._state,
+                'running': self.is_running,
+                'device_index': self._device_index,
+                'buffered_frames': len(self._buffer),
+                'frames_grabbed': self._frames_grabbed,
+                'grab_fps': self._frames_grabbed / uptime if uptime > 0 else 0.0,
+                'last_frame_age_ms': last_age_ms,
+                'frames_served': self._frames_served,
+                'avg_served_age_ms': self._total_served_age_ms / self._frames_served if self._frames_served else 0.0,
+                'max_served_age_ms': self._max_served_age_ms,
+                'read_failures': self._read_failures,
+                'reconnects': self._reconnects,
+            }
+
+# Process-wide capture service, started by the backend when the camera is the image source
+capture_service = CaptureService()
+
+def capture_frame():
+    """
+    Get a frame from the camera.
+    Uses the freshest frame from the capture service when it is running
+    (waiting briefly for the next one) and a one-shot capture otherwise.
+    The service holds the device open, so while it runs there is no one-shot
+    fallback: if it is reconnecting or stalled, None is returned.
+    Returns the image as an in-memory Frame (raw BGR ndarray, encoded lazily).
+    """
+    if capture_service.is_running:
+        frame = capture_service.latest_frame()
+        if frame is None:
+            print(f"Capture service has no fresh frame (state: {capture_service.stats()['state']})")
+        return frame
+    return capture_single_frame()
+
+def capture_single_frame():
     """
     Simplified function to capture an image from the camera.
     Uses a basic approach with some error handling.
-    Returns the image as a base64 encoded string.
+    Returns the image as an in-memory Frame (raw BGR ndarray, encoded lazily).
     """
     print("Attempting to capture image from camera")
     
@@ -77,7 +255,7 @@ def capture_image():
         cap = cv2.VideoCapture(1)
         if not cap.isOpened():
             print("Failed to open camera with fallback index (1)")
-            return create_placeholder_image("Camera not available - Could not open camera")
+            return create_placeholder_frame("Camera not available - Could not open camera")
     
     # Wait for 1 second to allow camera to initialize and adjust
     time.sleep(1)
@@ -91,32 +269,13 @@ def capture_image():
     # Check if we got a valid frame
     if not ret or frame is None or frame.size == 0:
         print("Failed to capture a valid frame")
-        return create_placeholder_image("Camera not available - No valid frame captured")
+        return create_placeholder_frame("Camera not available - No valid frame captured")
     
-    # Process and return the image
-    return process_image(frame)
-
-def process_image(frame):
-    """Process the captured image and return as base64"""
-    try:
-        # Convert the frame to JPEG
-        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        if not success:
-            print("Failed to encode image to JPEG")
-            return create_placeholder_image("Failed to encode image")
-        
-        # Convert to base64
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        print(f"Successfully encoded image, size: {len(image_base64) / 1024:.2f} KB")
-        return image_base64
-        
-    except Exception as e:
-        print(f"Error processing image: {str(e)}")
-        return create_placeholder_image(f"Error: {str(e)}")
-
-def create_placeholder_image(message="Camera not available"):
-    """Create a placeholder image with error message when camera fails"""
+    # Hand the raw frame to the pipeline; it is only encoded when stored or sent
+    return Frame.from_array(frame)
+
+def create_placeholder_frame(message="Camera not available"):
+    """Create a placeholder Frame with error message when camera fails"""
     # Create a blank image with text
     width, height = 640, 480
     img = np.zeros((height, width, 3), dtype=np.uint8)
@@ -138,8 +297,4 @@ def create_placeholder_image(message="Camera not available"):
     instruction = "Please check camera connection"
     cv2.putText(img, instruction, (width//2 - 120, height - 30), font, 0.6, (200, 200, 200), 1)
     
-    # Convert to base64
-    success, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-    image_base64 = base64.b64encode(buffer).decode('utf-8')
-    
-    return image_base64
\ No newline at end of file
+    return Frame.from_array(img)
\ No newline at end of file
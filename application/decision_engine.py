@@ -0,0 +1,311 @@
+import time
+import numpy as np
+
+# Default classification rules; config['decision_rules'] overrides them.
+# Rules are checked in order and the first one that matches gives the part:
+#   any:  at least one of these classes was detected
+#   all:  every one of these classes was detected
+#   none: none of these classes was detected
+#   gray: 'high' / 'low' to also require gray_percentage >= / < gray_threshold
+DEFAULT_DECISION_RULES = {
+    "gray_threshold": 89.0,
+    "below_gray_part": "No hay capo",       # Gray check enabled and below threshold: no detection runs
+    "default_part": "Capo no identificado",  # No rule matched
+    "rules": [
+        {"part": "Capo tipo 2", "any": ["amorfo"]},
+        {"part": "Capo tipo 3", "all": ["chico", "mediano", "grande"]},
+        {"part": "Capo tipo 1", "none": ["chico", "mediano", "grande"], "gray": "high"},
+        {"part": "No hay capo", "none": ["chico", "mediano", "grande"], "gray": "low"},
+    ],
+}
+
+# Bitmask lookup tables grow as 2^classes, so keep the rule vocabulary small
+MAX_RULE_CLASSES = 16
+
+class DecisionEngine:
+    """
+    Compiled capo classification rules.
+    The rules are compiled once into a lookup table indexed by
+    (bitmask of detected classes, gray above threshold). Classifying a car is
+    then one vectorized pass over the detector's class/score tensors to build
+    the bitmask, followed by a single table lookup; batches of cars are
+    classified the same way in one call.
+    """
+
+    def __init__(self, rules=None):
+        """
+        Args:
+            rules (dict): Rules in the DEFAULT_DECISION_RULES format (None for the defaults)
+
+        Raises:
+            ValueError: If the rules are malformed
+        """
+        rules = rules or DEFAULT_DECISION_RULES
+        self.rules = rules
+        try:
+            self.gray_threshold = float(rules.get('gray_threshold', DEFAULT_DECISION_RULES['gray_threshold']))
+        except (TypeError, ValueError):
+            raise ValueError("gray_threshold must be a number")
+        self.below_gray_part = str(rules.get('below_gray_part', DEFAULT_DECISION_RULES['below_gray_part']))
+        self.default_part = str(rules.get('default_part', DEFAULT_DECISION_RULES['default_part']))
+        rule_list = rules.get('rules')
+        if not isinstance(rule_list, list) or not rule_list:
+            raise ValueError("rules must be a non-empty list")
+
+        # Class vocabulary: every class name a rule mentions gets one bit
+        self.classes = []
+        for rule in rule_list:
+            if not isinstance(rule, dict) or not rule.get('part'):
+                raise ValueError("each rule needs a 'part'")
+            if rule.get('gray') not in (None, 'high', 'low'):
+                raise ValueError("rule 'gray' must be 'high' or 'low'")
+            for key in ('any', 'all', 'none'):
+                names = rule.get(key, [])
+                if not isinstance(names, list):
+                    raise ValueError(f"rule '{key}' must be a list of class names")
+                for name in names:
+                    name = str(name).lower()
+                    if name not in self.classes:
+                        self.classes.append(name)
+        if len(self.classes) > MAX_RULE_CLASSES:
+            raise ValueError(f"rules may use at most {MAX_RULE_CLASSES} classes")
+        self.bits = {name: 1 << i for i, name in enumerate(self.classes)}
+
+        # Part names; index 0 is the default part
+        self.parts = [self.default_part]
+        for rule in rule_list:
+            if rule['part'] not in self.parts:
+                self.parts.append(rule['part'])
+        if self.below_gray_part not in self.parts:
+            self.parts.append(self.below_gray_part)
+        self.parts_array = np.array(self.parts, dtype=object)
+        self.below_gray_index = self.parts.index(self.below_gray_part)
+
+        # Lookup table: table[mask, gray_high] -> part index
+        self.table = np.zeros((1 << len(self.classes), 2), dtype=np.int16)
+        compiled = [self._compile_rule(rule) for rule in rule_list]
+        for mask in range(1 << len(self.classes)):
+            for gray_high in (0, 1):
+                for any_mask, all_mask, none_mask, gray, part_index in compiled:
+                    if any_mask and not mask & any_mask:
+                        continue
+                    if mask & all_mask != all_mask:
+                        continue
+                    if mask & none_mask:
+                        continue
+                    if gray == 'high' and not gray_high or gray == 'low' and gray_high:
+                        continue
+                    self.table[mask, gray_high] = part_index
+                    break
+        # The same table as nested lists of part names, for the per-car path
+        self.part_table = [[self.parts[i] for i in row] for row in self.table.tolist()]
+
+        self._label_luts = {}
+        self._label_bits = {}
+
+    def _compile_rule(self, rule):
+        def mask_of(key):
+            mask = 0
+            for name in rule.get(key, []):
+                mask |= self.bits[str(name).lower()]
+            return mask
+        return mask_of('any'), mask_of('all'), mask_of('none'), rule.get('gray'), self.parts.index(rule['part'])
+
+    def label_lut(self, labels):
+        """
+        Return an array mapping the model's class index to the class bit
+        (0 for classes the rules don't use), cached per label list.
+        """
+        key = tuple(labels)
+        lut = self._label_luts.get(key)
+        if lut is None:
+            # Trailing 0 entry: out-of-range class ids are clipped onto it
+            lut = np.array([self.bits.get(str(label).strip().lower(), 0) for label in labels] + [0],
+                           dtype=np.int64)
+            self._label_luts[key] = lut
+        return lut
+
+    def label_bits(self, labels):
+        """label_lut() as a plain list (without the trailing entry), for the per-car path."""
+        key = tuple(labels)
+        bits = self._label_bits.get(key)
+        if bits is None:
+            bits = self.label_lut(labels)[:-1].tolist()
+            self._label_bits[key] = bits
+        return bits
+
+    def class_mask(self, class_ids, scores, labels, min_conf):
+        """
+        Bitmask of the rule classes detected above min_conf for one car.
+        A car has only a handful of detections, so this is a plain loop over
+        Python values: numpy call overhead would cost more than the work
+        (classify_batch is the vectorized path for many cars).
+
+        Args:
+            class_ids (array): Class index per detection (the detector's float output is fine)
+            scores (array): Score per detection
+            labels (list): Model labels
+            min_conf (float): Scores must be strictly above this
+        """
+        bits = self.label_bits(labels)
+        num_labels = len(bits)
+        mask = 0
+        for class_id, score in zip(np.asarray(class_ids).tolist(), np.asarray(scores).tolist()):
+            if score > min_conf:
+                class_id = int(class_id)
+                if 0 <= class_id < num_labels:
+                    mask |= bits[class_id]
+        return mask
+
+    def needs_detection(self, gray_percentage, gray_check_enabled=True):
+        """Whether the detector has to run (the gray check may already decide 'no capo')."""
+        return not gray_check_enabled or gray_percentage >= self.gray_threshold
+
+    def classify(self, class_ids, scores, labels, min_conf, gray_percentage, gray_check_enabled=True):
+        """
+        Classify one car from the detector's class/score outputs.
+
+        Returns:
+            str: The actual part
+        """
+        if not self.needs_detection(gray_percentage, gray_check_enabled):
+            return self.below_gray_part
+        mask = self.class_mask(class_ids, scores, labels, min_conf)
+        return self.part_table[mask][1 if gray_percentage >= self.gray_threshold else 0]
+
+    def classify_objects(self, detected_objects, labels, min_conf, gray_percentage, gray_check_enabled=True):
+        """Classify one car from a detected-objects list (each with 'class_id' and 'score')."""
+        class_ids = np.fromiter((obj['class_id'] for obj in detected_objects), dtype=np.int64,
+                                count=len(detected_objects))
+        scores = np.fromiter((obj['score'] for obj in detected_objects), dtype=np.float64,
+                             count=len(detected_objects))
+        return self.classify(class_ids, scores, labels, min_conf, gray_percentage, gray_check_enabled)
+
+    def classify_batch(self, class_ids, scores, labels, min_conf, gray_percentages, gray_check_enabled=True):
+        """
+        Classify many cars at once.
+
+        Args:
+            class_ids (array): (cars, detections) class indices; pad with any value
+            scores (array): (cars, detections) scores; pad with 0 so padding never passes min_conf
+            labels (list): Model labels
+            min_conf (float or array): Score threshold (scalar, or one per car)
+            gray_percentages (array): (cars,) gray percentages
+            gray_check_enabled (bool): Whether the gray gate applies
+
+        Returns:
+            np.ndarray: Part index per car (look names up in self.parts / self.parts_array)
+        """
+        lut = self.label_lut(labels)
+        class_ids = np.asarray(class_ids).astype(np.intp, copy=False)
+        scores = np.asarray(scores)
+        gray = np.asarray(gray_percentages, dtype=np.float64)
+        threshold = np.asarray(min_conf, dtype=np.float64)
+        if threshold.ndim == 1:
+            threshold = threshold[:, None]
+        bits = np.where(scores > threshold, np.take(lut, class_ids, mode='clip'), 0)
+        masks = np.bitwise_or.reduce(bits, axis=1) if bits.shape[1] else np.zeros(len(bits), dtype=np.int64)
+        gray_high = gray >= self.gray_threshold
+        result = self.table[masks, gray_high.astype(np.int64)]
+        if gray_check_enabled:
+            result = np.where(gray_high, result, self.below_gray_index)
+        return result
+
+    def classify_sweep(self, class_ids, scores, labels, min_confs, gray_percentages, gray_thresholds,
+                       gray_check_enabled=True):
+        """
+        Classify many cars under every combination of score threshold and gray threshold.
+        The class lookup is done once; each score threshold is one vectorized
+        pass building the masks of all cars, and all gray thresholds are then
+        a single table lookup.
+
+        Args:
+            class_ids (array): (cars, detections) class indices
+            scores (array): (cars, detections) scores; pad with 0
+            labels (list): Model labels
+            min_confs (array): Score thresholds to try
+            gray_percentages (array): (cars,) gray percentages
+            gray_thresholds (array): Gray thresholds to try (in place of self.gray_threshold)
+            gray_check_enabled (bool): Whether the gray gate applies
+
+        Returns:
+            np.ndarray: (thresholds, gray thresholds, cars) part indices
+        """
+        lut = self.label_lut(labels)
+        class_bits = np.take(lut, np.asarray(class_ids).astype(np.intp, copy=False), mode='clip')
+        scores = np.asarray(scores)
+        gray_high = (np.asarray(gray_percentages, dtype=np.float64)[None, :]
+                     >= np.asarray(gray_thresholds, dtype=np.float64)[:, None])
+        gray_index = gray_high.astype(np.intp)
+        result = np.empty((len(min_confs), len(gray_thresholds), len(scores)), dtype=self.table.dtype)
+        for i, min_conf in enumerate(min_confs):
+            bits = np.where(scores > min_conf, class_bits, 0)
+            masks = np.bitwise_or.reduce(bits, axis=1) if bits.shape[1] else np.zeros(len(bits), dtype=np.int64)
+            parts = self.table[masks[None, :], gray_index]
+            if gray_check_enabled:
+                parts = np.where(gray_high, parts, self.below_gray_index)
+            result[i] = parts
+        return result
+
+    def describe(self, mask):
+        """Return the rule classes present in a bitmask (for logging)."""
+        return [name for name, bit in self.bits.items() if mask & bit]
+
+def legacy_classify(detected_objects, min_conf, gray_percentage, gray_check_enabled=True):
+    """The original string-comparing rules, kept as the reference for the benchmark."""
+    if gray_check_enabled and gray_percentage < 89:
+        return "No hay capo"
+    has_amorfo = any(obj['class'].lower() == 'amorfo' and obj['score'] > min_conf for obj in detected_objects)
+    has_chico = any(obj['class'].lower() == 'chico' and obj['score'] > min_conf for obj in detected_objects)
+    has_mediano = any(obj['class'].lower() == 'mediano' and obj['score'] > min_conf for obj in detected_objects)
+    has_grande = any(obj['class'].lower() == 'grande' and obj['score'] > min_conf for obj in detected_objects)
+    if has_amorfo:
+        return "Capo tipo 2"
+    if has_chico and has_mediano and has_grande:
+        return "Capo tipo 3"
+    if not has_chico and not has_mediano and not has_grande:
+        return "Capo tipo 1" if gray_percentage >= 89 else "No hay capo"
+    return "Capo no identificado"
+
+def benchmark(cars=20000, detections=10, min_conf=0.7, seed=0):
+    """
+    Compare the legacy rules with the decision engine on random detector outputs
+    and check that every car gets the same part.
+    """
+    labels = ['grande', 'mediano', 'chico', 'amorfo']
+    rng = np.random.default_rng(seed)
+    class_ids = rng.integers(0, len(labels), size=(cars, detections)).astype(np.float32)
+    scores = rng.random((cars, detections)).astype(np.float32) ** 3  # Mostly low scores, like a real detector
+    gray = rng.uniform(80, 100, size=cars)
+    engine = DecisionEngine()
+
+    # Both paths get every raw detection and apply min_conf themselves
+    objects = [
+        [{'class': labels[int(c)], 'class_id': int(c), 'score': float(s)}
+         for c, s in zip(class_ids[i], scores[i])]
+        for i in range(cars)
+    ]
+
+    start = time.perf_counter()
+    legacy = [legacy_classify(objects[i], min_conf, gray[i]) for i in range(cars)]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [engine.classify(class_ids[i], scores[i], labels, min_conf, gray[i]) for i in range(cars)]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = engine.parts_array[engine.classify_batch(class_ids, scores, labels, min_conf, gray)]
+    batch_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b, c in zip(legacy, single, batch) if not a == b == c)
+    print(f"Cars: {cars}, detections per car: {detections}")
+    print(f"Legacy rules:        {legacy_time * 1e6 / cars:8.2f} us/car")
+    print(f"Engine (per car):    {single_time * 1e6 / cars:8.2f} us/car")
+    print(f"Engine (batch):      {batch_time * 1e6 / cars:8.2f} us/car")
+    print(f"Mismatches: {mismatches}")
+    return mismatches == 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if benchmark() else 1)
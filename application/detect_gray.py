@@ -1,26 +1,35 @@
 import cv2
 import numpy as np
-import base64
+from frame import Frame
 import time
 
-def detect_gray_percentage(base64_image):
+GRAY_PIXEL_THRESHOLD = 100  # Separates the light gray capot from the darker background
+
+def bright_pixel_percentage(gray, threshold_value=GRAY_PIXEL_THRESHOLD):
+    """
+    Percentage of grayscale pixels brighter than threshold_value (the capot check).
+
+    Args:
+        gray (ndarray): Grayscale image or region
+        threshold_value (int): Pixels above this value count as gray/white
+
+    Returns:
+        float: Percentage of pixels that are gray/white
     """
-    Detects the percentage of gray pixels in a base64 encoded image.
+    _, thresh = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY)
+    total_pixels = thresh.shape[0] * thresh.shape[1]
+    return (cv2.countNonZero(thresh) / total_pixels) * 100
+
+def detect_gray_percentage(image):
+    """
+    Detects the percentage of gray pixels in a Frame or base64 encoded image.
     Returns the percentage of gray pixels in the image.
     """
     try:
         start_time = time.time()
         
-        # Decode base64 image - optimize by skipping prefix if present
-        if isinstance(base64_image, str) and ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
-            
-        image_data = base64.b64decode(base64_image)
-        np_arr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            raise ValueError("Failed to decode image")
+        # Use the frame's decoded pixels (a base64 string is wrapped and decoded once)
+        image = Frame.coerce(image).image
         
         # Convert to HSV - this is faster than processing in RGB
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
@@ -0,0 +1,197 @@
+import base64
+import threading
+import cv2
+import numpy as np
+
+JPEG_QUALITY = 95
+THUMBNAIL_MAX_SIZE = 160  # Longest side of thumbnails, in pixels
+THUMBNAIL_QUALITY = 70
+FULL_ROI = (0.0, 0.0, 1.0, 1.0)  # Regions of interest are fractional (xmin, ymin, xmax, ymax)
+REDUCED_GRAYSCALE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def normalize_roi(roi):
+    """
+    Validate a region of interest.
+
+    Args:
+        roi: [xmin, ymin, xmax, ymax] as fractions of the frame size, or None for the full frame
+
+    Returns:
+        tuple: The ROI as four floats
+
+    Raises:
+        ValueError: If the ROI is malformed or empty
+    """
+    if roi is None:
+        return FULL_ROI
+    try:
+        xmin, ymin, xmax, ymax = (float(v) for v in roi)
+    except (TypeError, ValueError):
+        raise ValueError("ROI must be [xmin, ymin, xmax, ymax]")
+    if not (0.0 <= xmin < xmax <= 1.0 and 0.0 <= ymin < ymax <= 1.0):
+        raise ValueError("ROI values must be fractions between 0 and 1 with xmin < xmax and ymin < ymax")
+    return (xmin, ymin, xmax, ymax)
+
+def roi_bounds(roi, shape):
+    """Pixel bounds (x0, y0, x1, y1) of a fractional ROI in an image of the given shape (at least 1 pixel)."""
+    height, width = shape[:2]
+    xmin, ymin, xmax, ymax = normalize_roi(roi)
+    x0 = min(int(xmin * width), width - 1)
+    y0 = min(int(ymin * height), height - 1)
+    x1 = max(int(round(xmax * width)), x0 + 1)
+    y1 = max(int(round(ymax * height)), y0 + 1)
+    return x0, y0, x1, y1
+
+class Frame:
+    """
+    In-memory image that travels through the inspection pipeline.
+    Holds the raw BGR ndarray plus lazily computed JPEG bytes and base64 string,
+    so gray analysis, inference and annotation work on the array and encoding
+    only happens at the storage and transport edges (and only once).
+    """
+
+    def __init__(self, image=None, jpeg=None, b64=None, quality=JPEG_QUALITY):
+        if image is None and jpeg is None and b64 is None:
+            raise ValueError("Frame needs an image array, JPEG bytes or a base64 string")
+        self._image = image
+        self._jpeg = jpeg
+        self._b64 = b64
+        self.quality = quality
+        self._thumbnails = {}
+        self._reduced_gray = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_array(cls, image, quality=JPEG_QUALITY):
+        """Wrap a BGR ndarray (e.g. a camera frame)."""
+        return cls(image=image, quality=quality)
+
+    @classmethod
+    def from_jpeg(cls, jpeg_bytes):
+        """Wrap encoded JPEG bytes; decoding happens on first access to .image."""
+        return cls(jpeg=bytes(jpeg_bytes))
+
+    @classmethod
+    def from_base64(cls, base64_image):
+        """Wrap a base64 string, with or without a data:image/...;base64, prefix."""
+        if isinstance(base64_image, str) and ',' in base64_image:
+            base64_image = base64_image.split(',')[1]
+        return cls(b64=base64_image)
+
+    @classmethod
+    def coerce(cls, image):
+        """Return a Frame for a Frame, BGR ndarray, JPEG bytes or base64 string."""
+        if isinstance(image, Frame):
+            return image
+        if isinstance(image, np.ndarray):
+            return cls.from_array(image)
+        if isinstance(image, (bytes, bytearray)):
+            return cls.from_jpeg(image)
+        if isinstance(image, str):
+            return cls.from_base64(image)
+        raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+    @property
+    def image(self):
+        """The decoded BGR ndarray (decoded once, then cached)."""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    np_arr = np.frombuffer(self.jpeg, np.uint8)
+                    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                    if image is None:
+                        raise ValueError("Failed to decode image")
+                    self._image = image
+        return self._image
+
+    @property
+    def jpeg(self):
+        """JPEG-encoded bytes (encoded once, then cached)."""
+        if self._jpeg is None:
+            with self._lock:
+                if self._jpeg is None:
+                    if self._b64 is not None:
+                        self._jpeg = base64.b64decode(self._b64)
+                    else:
+                        success, buffer = cv2.imencode('.jpg', self._image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                        if not success:
+                            raise ValueError("Failed to encode image to JPEG")
+                        self._jpeg = buffer.tobytes()
+        return self._jpeg
+
+    @property
+    def base64(self):
+        """Base64 string of the JPEG bytes (computed once, then cached)."""
+        if self._b64 is None:
+            jpeg = self.jpeg
+            with self._lock:
+                if self._b64 is None:
+                    self._b64 = base64.b64encode(jpeg).decode('utf-8')
+        return self._b64
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def thumbnail(self, max_size=THUMBNAIL_MAX_SIZE, quality=THUMBNAIL_QUALITY):
+        """Return a downscaled Frame for previews (computed once per size)."""
+        with self._lock:
+            thumb = self._thumbnails.get((max_size, quality))
+            if thumb is None:
+                image = self.image
+                height, width = image.shape[:2]
+                scale = max_size / max(height, width)
+                if scale < 1:
+                    image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                       interpolation=cv2.INTER_AREA)
+                thumb = Frame.from_array(image, quality=quality)
+                self._thumbnails[(max_size, quality)] = thumb
+        return thumb
+
+    def crop(self, roi=None):
+        """
+        Return the pixels inside a fractional ROI as a view (no copy) and its pixel bounds.
+
+        Returns:
+            tuple: (BGR ndarray view, (x0, y0, x1, y1))
+        """
+        image = self.image
+        if roi is None or normalize_roi(roi) == FULL_ROI:
+            height, width = image.shape[:2]
+            return image, (0, 0, width, height)
+        x0, y0, x1, y1 = roi_bounds(roi, image.shape)
+        return image[y0:y1, x0:x1], (x0, y0, x1, y1)
+
+    def gray(self, roi=None, reduction=1):
+        """
+        Grayscale pixels of a fractional ROI, optionally at 1/2, 1/4 or 1/8 resolution.
+        A frame that hasn't been decoded yet is decoded straight to a reduced
+        grayscale image (IMREAD_REDUCED_GRAYSCALE_*), which is much cheaper than
+        a full color decode; an already decoded frame is subsampled instead.
+        """
+        if reduction not in REDUCED_GRAYSCALE_FLAGS:
+            bgr, _ = self.crop(roi)
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        if self._image is None:
+            with self._lock:
+                reduced = self._reduced_gray.get(reduction)
+                if reduced is None and self._image is None:
+                    reduced = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), REDUCED_GRAYSCALE_FLAGS[reduction])
+                    if reduced is None:
+                        raise ValueError("Failed to decode image")
+                    self._reduced_gray[reduction] = reduced
+            if reduced is not None:
+                if roi is None or normalize_roi(roi) == FULL_ROI:
+                    return reduced
+                x0, y0, x1, y1 = roi_bounds(roi, reduced.shape)
+                return reduced[y0:y1, x0:x1]
+        bgr, _ = self.crop(roi)
+        return cv2.cvtColor(np.ascontiguousarray(bgr[::reduction, ::reduction]), cv2.COLOR_BGR2GRAY)
+
+    def copy(self):
+        """Return a new Frame with a writable copy of the pixel data (for drawing)."""
+        return Frame.from_array(self.image.copy(), quality=self.quality)
@@ -1,29 +1,149 @@
+import os
 import requests
 import xml.etree.ElementTree as ET
 import json
 import base64
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = 'http://192.168.102.93'  # Plant ICS server; ICS_BASE_URL overrides it (e.g. the fake ics.py)
+VIN_PATH = '/icsQueryService/api/Query/Results/?format=xml&query_name=GET_VIN&SERVICE_KEY=68R82WSPO199XW1VE6LX4V8'
+DEFECT_PATH = '/icsexternalinterface/vehicledataservice.svc/AddDeviceDefectsWithImage'
+DEFAULT_CONNECT_TIMEOUT = 3.05  # Seconds to open the TCP connection
+DEFAULT_READ_TIMEOUT = 10       # Seconds to wait for the response
+DEFAULT_POOL_SIZE = 4           # Keep-alive connections kept per host
+DEFAULT_ASYNC_WORKERS = 2       # Threads behind the *_async calls; more calls queue instead of adding threads
+LATENCY_WINDOW = 500            # Recent calls per endpoint used for the latency percentiles
+
+class EndpointStats:
+    """Call count, errors and recent latencies of one ICS endpoint."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_error = None
+        self.last_call_at = None
+
+    def record(self, latency_ms, error=None, timeout=False):
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency_ms)
+            self.last_call_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            if error is not None:
+                self.errors += 1
+                self.timeouts += int(timeout)
+                self.last_error = error
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'calls': self.calls,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'error_rate': self.errors / self.calls if self.calls else 0.0,
+                'last_error': self.last_error,
+                'last_call_at': self.last_call_at,
+            }
+        if latencies:
+            stats['p50_ms'] = latencies[len(latencies) // 2]
+            stats['p95_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['max_ms'] = latencies[-1]
+        return stats
 
 class ICSIntegration:
-    def __init__(self):
-        self.vin_url = 'http://192.168.102.93/icsQueryService/api/Query/Results/?format=xml&query_name=GET_VIN&SERVICE_KEY=68R82WSPO199XW1VE6LX4V8'
-        self.defect_url = "http://192.168.102.93/icsexternalinterface/vehicledataservice.svc/AddDeviceDefectsWithImage"
-        
+    """
+    Client for the ICS VIN query and defect services.
+    All calls go through one pooled requests.Session (keep-alive, so repeated
+    calls reuse the TCP connection) with connect/read timeouts, so a slow or
+    unreachable ICS fails fast instead of hanging the calling thread. Latency
+    and errors are recorded per endpoint. The *_async variants run on a small
+    fixed thread pool and return a Future, so callers never block on ICS and
+    latency spikes queue calls instead of piling up threads.
+    """
+
+    def __init__(self, base_url=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE, async_workers=DEFAULT_ASYNC_WORKERS):
+        self.set_base_url(base_url)
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.async_workers = async_workers
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {name: EndpointStats() for name in ('vin', 'defect', 'image')}
+
+    def set_base_url(self, base_url=None):
+        """Point the client at an ICS server; None uses ICS_BASE_URL from the environment, or the plant server."""
+        self.base_url = (base_url or os.environ.get('ICS_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.vin_url = self.base_url + VIN_PATH
+        self.defect_url = self.base_url + DEFECT_PATH
+
+    def configure(self, connect_timeout=None, read_timeout=None):
+        """Change the timeouts; applies to the next call."""
+        self.timeout = (
+            float(connect_timeout) if connect_timeout is not None else self.timeout[0],
+            float(read_timeout) if read_timeout is not None else self.timeout[1],
+        )
+
+    @property
+    def session(self):
+        """The pooled session, created on first use."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """
+        Make one HTTP call through the session and record its latency.
+
+        Returns:
+            requests.Response: The response (any status code)
+
+        Raises:
+            requests.RequestException: On connection errors and timeouts
+        """
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.Timeout as e:
+            self._stats[endpoint].record((time.perf_counter() - start_time) * 1000, error=str(e), timeout=True)
+            raise
+        except requests.RequestException as e:
+            self._stats[endpoint].record((time.perf_counter() - start_time) * 1000, error=str(e))
+            raise
+        error = f"HTTP {response.status_code}" if response.status_code != 200 else None
+        self._stats[endpoint].record((time.perf_counter() - start_time) * 1000, error=error)
+        return response
+
     def request_vin(self, body_num):
         """Request VIN from ICS system"""
         try:
             api_url = self.vin_url + f'&BODY_NUM={body_num}'
-            response = requests.get(api_url)
+            response = self._request('vin', 'GET', api_url)
             if response.status_code != 200:
                 print(f"Error getting VIN: {response.status_code}")
                 return None
-                
+
             # Parse XML response
             root = ET.fromstring(response.text)
             xml_vin = root.find('DATA/VIN')
             if xml_vin is None:
                 print("VIN not found in response")
                 return None
-                
+
             return xml_vin.text
         except Exception as e:
             print(f"Error requesting VIN: {e}")
@@ -35,17 +155,17 @@ class ICSIntegration:
             # If image_base64 is a URL, fetch the image content
             if isinstance(image_base64, str) and image_base64.startswith('http'):
                 try:
-                    response = requests.get(image_base64)
+                    response = self._request('image', 'GET', image_base64)
                     response.raise_for_status()
                     image_base64 = base64.b64encode(response.content).decode('utf-8')
                 except Exception as e:
                     print(f"Error fetching image from URL: {e}")
                     return False
-            
+
             # Ensure image_base64 doesn't include the data:image prefix
             if isinstance(image_base64, str) and ',' in image_base64:
                 image_base64 = image_base64.split(',')[1]
-            
+
             defect_data = {
                 "DeviceId": "EI_CAMARITA",
                 "CardId": "00.00.00.00.87.92.B4.1A",
@@ -65,12 +185,7 @@ class ICSIntegration:
 
             print(f"Sending defect data to ICS for VIN: {vin}")
             headers = {"Content-Type": "application/json"}
-            response = requests.post(
-                self.defect_url,
-                data=json.dumps(defect_data),
-                headers=headers,
-                timeout=30  # Add timeout
-            )
+            response = self._request('defect', 'POST', self.defect_url, data=json.dumps(defect_data), headers=headers)
 
             if response.status_code != 200:
                 print(f"Error sending defect data: {response.status_code}")
@@ -80,4 +195,40 @@ class ICSIntegration:
             return True
         except Exception as e:
             print(f"Error sending defect data: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    def _submit(self, fn, *args, **kwargs):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.async_workers, thread_name_prefix='ics')
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def request_vin_async(self, body_num):
+        """request_vin() on the ICS thread pool; returns a Future with the VIN or None."""
+        return self._submit(self.request_vin, body_num)
+
+    def send_defect_data_async(self, vin, image_base64, expected_part, actual_part):
+        """send_defect_data() on the ICS thread pool; returns a Future with True/False."""
+        return self._submit(self.send_defect_data, vin, image_base64, expected_part, actual_part)
+
+    def stats(self):
+        """Per-endpoint calls, errors, timeouts and p50/p95 latency, plus the client settings."""
+        return {
+            'base_url': self.base_url,
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'pool_size': self.pool_size,
+            'session_open': self._session is not None,
+            'endpoints': {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+    def close(self):
+        """Close pooled connections and stop the async workers."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
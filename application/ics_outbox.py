@@ -0,0 +1,248 @@
+import random
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+
+DEFAULT_BASE_DELAY = 5.0    # Seconds before the first retry; doubles on every failed attempt
+DEFAULT_MAX_DELAY = 600.0   # Longest wait between attempts
+DEFAULT_MAX_ATTEMPTS = 100  # About 16 hours of retries at the longest wait before giving up
+DEFAULT_POLL_INTERVAL = 5.0
+RETRY_JITTER = 0.1          # +-10% so retries don't line up after an outage
+
+STATES = ('pending', 'delivered', 'failed')
+
+def retry_delay(attempts, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Seconds to wait after the given number of failed attempts (exponential, capped, with jitter)."""
+    delay = min(max_delay, base_delay * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(1 - RETRY_JITTER, 1 + RETRY_JITTER)
+
+class IcsOutbox:
+    """
+    Durable queue of NOGOOD defects waiting to be reported to ICS.
+    Inspections and requests only insert a row (one per car_id, so a car
+    reported by both the PLC path and the UI is sent once); a single delivery
+    thread looks up the VIN, sends the defect and retries failures with
+    exponential backoff. Pending rows survive ICS outages and restarts.
+    """
+
+    def __init__(self, table, get_engine, ics, load_image, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, vin_lookup=None):
+        """
+        Args:
+            table: Table with car_id, expected_part, actual_part, image_hash, vin, status, attempts,
+                created_at, next_attempt_at, last_attempt_at, delivered_at, last_error
+            get_engine (callable): Returns the SQLAlchemy engine
+            ics (ICSIntegration): Client with request_vin() and send_defect_data()
+            load_image (callable): load_image(image_hash) -> base64 JPEG or None
+            base_delay (float): Seconds before the first retry
+            max_delay (float): Longest wait between attempts
+            max_attempts (int): Attempts before a defect is marked failed
+            poll_interval (float): Longest sleep between checks for due rows
+            vin_lookup (callable): vin_lookup(car_id) -> VIN or None (default: ics.request_vin)
+        """
+        self.table = table
+        self.get_engine = get_engine
+        self.ics = ics
+        self.load_image = load_image
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.vin_lookup = vin_lookup or ics.request_vin
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'delivered': 0, 'failed_attempts': 0, 'last_delivery_at': None,
+                       'last_attempt_at': None, 'last_error': None}
+
+    def enqueue(self, car_id, expected_part, actual_part, image_hash=None):
+        """
+        Queue a defect for delivery; never blocks on ICS.
+        A car already queued gets its parts and image refreshed, a car that
+        gave up is queued again, and a car already delivered is left alone.
+
+        Returns:
+            dict: The outbox entry, plus 'queued' (False if it was already delivered)
+        """
+        now = datetime.now()
+        values = {'expected_part': expected_part, 'actual_part': actual_part}
+        if image_hash:
+            values['image_hash'] = image_hash
+        queued = True
+        for _ in range(2):
+            try:
+                with self.get_engine().begin() as conn:
+                    row = conn.execute(select(self.table).where(self.table.c.car_id == car_id)).mappings().first()
+                    if row is None:
+                        conn.execute(self.table.insert().values(
+                            car_id=car_id, status='pending', attempts=0, created_at=now, next_attempt_at=now,
+                            **values
+                        ))
+                    elif row['status'] == 'delivered':
+                        queued = False
+                    else:
+                        if row['status'] == 'failed':
+                            values.update(status='pending', attempts=0, next_attempt_at=now, last_error=None)
+                        conn.execute(update(self.table).where(self.table.c.car_id == car_id).values(**values))
+                break
+            except IntegrityError:
+                continue  # Queued concurrently by another thread; update that row instead
+        if queued:
+            print(f"Queued ICS defect for car {car_id}")
+            self._wake.set()
+        else:
+            print(f"ICS defect for car {car_id} was already delivered, not queued again")
+        entry = self.entry(car_id) or {'car_id': car_id}
+        entry['queued'] = queued
+        return entry
+
+    def retry(self, car_id):
+        """Queue a failed (or pending) defect for an immediate attempt. Returns False if unknown or delivered."""
+        with self.get_engine().begin() as conn:
+            result = conn.execute(
+                update(self.table)
+                .where(self.table.c.car_id == car_id, self.table.c.status != 'delivered')
+                .values(status='pending', next_attempt_at=datetime.now())
+            )
+        if result.rowcount:
+            self._wake.set()
+        return bool(result.rowcount)
+
+    def entry(self, car_id):
+        with self.get_engine().connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.car_id == car_id)).mappings().first()
+        return self._serialize(row) if row is not None else None
+
+    @staticmethod
+    def _serialize(row):
+        entry = dict(row)
+        for key, value in entry.items():
+            if isinstance(value, datetime):
+                entry[key] = value.strftime("%Y-%m-%d %H:%M:%S")
+        return entry
+
+    def start(self):
+        """Start the delivery thread (once)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ics-outbox', daemon=True)
+        self._thread.start()
+        print("ICS outbox delivery worker started")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                row = self._next_due()
+                if row is not None:
+                    self._deliver(row)
+                    continue
+                wait = self._seconds_until_next()
+            except Exception as e:
+                print(f"Error in ICS outbox worker: {str(e)}")
+                wait = self.poll_interval
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _next_due(self):
+        with self.get_engine().connect() as conn:
+            return conn.execute(
+                select(self.table)
+                .where(self.table.c.status == 'pending', self.table.c.next_attempt_at <= datetime.now())
+                .order_by(self.table.c.next_attempt_at)
+                .limit(1)
+            ).mappings().first()
+
+    def _seconds_until_next(self):
+        with self.get_engine().connect() as conn:
+            next_at = conn.execute(
+                select(func.min(self.table.c.next_attempt_at)).where(self.table.c.status == 'pending')
+            ).scalar()
+        if next_at is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, (next_at - datetime.now()).total_seconds()))
+
+    def _deliver(self, row):
+        """One delivery attempt: VIN lookup (kept once found), then the defect with its image."""
+        car_id = row['car_id']
+        attempts = row['attempts'] + 1
+        started = datetime.now()
+        vin = row['vin']
+        error = None
+        try:
+            if not vin:
+                vin = self.vin_lookup(car_id)
+            if not vin:
+                error = "Could not get VIN"
+            else:
+                image_base64 = self.load_image(row['image_hash']) if row['image_hash'] else None
+                if not self.ics.send_defect_data(vin=vin, image_base64=image_base64,
+                                                 expected_part=row['expected_part'], actual_part=row['actual_part']):
+                    error = "ICS did not accept the defect data"
+        except Exception as e:
+            error = str(e)
+
+        values = {'attempts': attempts, 'last_attempt_at': started, 'vin': vin or None}
+        if error is None:
+            values.update(status='delivered', delivered_at=datetime.now(), last_error=None)
+            print(f"Delivered ICS defect for car {car_id} (VIN {vin}) on attempt {attempts}")
+        elif self.max_attempts and attempts >= self.max_attempts:
+            values.update(status='failed', last_error=error)
+            print(f"Giving up on ICS defect for car {car_id} after {attempts} attempts: {error}")
+        else:
+            delay = retry_delay(attempts, self.base_delay, self.max_delay)
+            values.update(next_attempt_at=datetime.now() + timedelta(seconds=delay), last_error=error)
+            print(f"ICS delivery for car {car_id} failed ({error}), retrying in {delay:.0f}s")
+        with self.get_engine().begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == row['id']).values(**values))
+
+        with self._lock:
+            self._stats['last_attempt_at'] = started.strftime("%Y-%m-%d %H:%M:%S")
+            if error is None:
+                self._stats['delivered'] += 1
+                self._stats['last_delivery_at'] = values['delivered_at'].strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                self._stats['failed_attempts'] += 1
+                self._stats['last_error'] = f"{car_id}: {error}"
+
+    def status(self, recent=20):
+        """
+        Outbox counts per state, delivery lag and the most recent entries.
+        The lag is the age of the oldest pending defect, i.e. how far behind ICS is.
+        """
+        with self.get_engine().connect() as conn:
+            counts = dict(conn.execute(
+                select(self.table.c.status, func.count()).group_by(self.table.c.status)
+            ).all())
+            oldest_pending, next_attempt = conn.execute(
+                select(func.min(self.table.c.created_at), func.min(self.table.c.next_attempt_at))
+                .where(self.table.c.status == 'pending')
+            ).one()
+            rows = conn.execute(
+                select(self.table).order_by(self.table.c.id.desc()).limit(recent)
+            ).mappings().all()
+        now = datetime.now()
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            'worker_running': self.is_running,
+            'counts': {state: counts.get(state, 0) for state in STATES},
+            'lag_seconds': round((now - oldest_pending).total_seconds(), 1) if oldest_pending else 0.0,
+            'oldest_pending_at': oldest_pending.strftime("%Y-%m-%d %H:%M:%S") if oldest_pending else None,
+            'next_attempt_at': next_attempt.strftime("%Y-%m-%d %H:%M:%S") if next_attempt else None,
+            **stats,
+            'recent': [self._serialize(row) for row in rows],
+        }
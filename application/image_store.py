@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class ImageStore:
+    """
+    Content-addressed store for JPEG images.
+    Images are written once under their SHA-256 hash in sharded directories
+    (image_store/ab/cd/abcd...jpg), so database rows only keep the hash and
+    size, and identical images are stored a single time.
+    """
+
+    def __init__(self, root, shard_levels=2, shard_width=2):
+        self.root = root
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def is_valid_hash(image_hash):
+        return isinstance(image_hash, str) and bool(HASH_PATTERN.match(image_hash))
+
+    def path_for(self, image_hash):
+        """Return the file path for a hash (raises ValueError for malformed hashes)."""
+        if not self.is_valid_hash(image_hash):
+            raise ValueError(f"Invalid image hash: {image_hash!r}")
+        shards = [image_hash[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_levels)]
+        return os.path.join(self.root, *shards, f"{image_hash}.jpg")
+
+    def exists(self, image_hash):
+        try:
+            return os.path.exists(self.path_for(image_hash))
+        except ValueError:
+            return False
+
+    def put(self, jpeg_bytes):
+        """
+        Store JPEG bytes.
+
+        Returns:
+            tuple: (hash, size)
+        """
+        jpeg_bytes = bytes(jpeg_bytes)
+        image_hash = hashlib.sha256(jpeg_bytes).hexdigest()
+        path = self.path_for(image_hash)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file and rename, so readers never see a partial image
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(jpeg_bytes)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return image_hash, len(jpeg_bytes)
+
+    def put_base64(self, base64_image, strict=False):
+        """
+        Store a base64 JPEG (with or without a data:image/...;base64, prefix).
+        With strict=True (images sent by clients) anything that isn't valid
+        base64 of a JPEG raises ValueError.
+        """
+        if isinstance(base64_image, str) and ',' in base64_image:
+            base64_image = base64_image.split(',')[1]
+        data = base64.b64decode(base64_image, validate=strict)
+        if strict and not data.startswith(b'\xff\xd8'):
+            raise ValueError("Not a JPEG image")
+        return self.put(data)
+
+    def get(self, image_hash):
+        """Return the JPEG bytes for a hash, or None if it isn't stored."""
+        try:
+            with open(self.path_for(image_hash), 'rb') as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def get_base64(self, image_hash):
+        """Return the image for a hash as a base64 string, or None."""
+        data = self.get(image_hash)
+        return base64.b64encode(data).decode('utf-8') if data is not None else None
+
+    def stats(self):
+        """Count stored images and their total size."""
+        count = 0
+        total_bytes = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.jpg'):
+                    count += 1
+                    total_bytes += os.path.getsize(os.path.join(directory, name))
+        return {'root': self.root, 'images': count, 'total_bytes': total_bytes}
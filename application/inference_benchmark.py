@@ -0,0 +1,201 @@
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from frame import Frame
+from model_registry import ModelRegistry, MODEL_VARIANTS
+from tflite_detector import load_tflite_model, get_input_writer, INTERPRETER_BACKEND
+
+DEFAULT_RUNS = 30
+WARMUP_INVOKES = 3
+BENCHMARK_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_images', 'capo_tipo_1.jpg')
+
+def default_thread_counts():
+    """1, 2, 4, ... up to the number of CPU cores."""
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+def load_benchmark_image(path=BENCHMARK_IMAGE):
+    """A sample image as a BGR array (random pixels if the sample is missing)."""
+    try:
+        with open(path, 'rb') as f:
+            return Frame.from_jpeg(f.read()).image
+    except (OSError, ValueError):
+        return np.random.default_rng(0).integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+
+def benchmark_setting(model_path, num_threads, xnnpack, runs=DEFAULT_RUNS, image=None):
+    """
+    Time invoke() for one interpreter setting.
+    A fresh interpreter is built for the setting (the serving pool is not
+    touched); the first invokes are reported separately since they include
+    one-time kernel setup.
+
+    Returns:
+        dict: load_ms, first_invoke_ms and p50/p95/mean/min/max invoke time in ms
+    """
+    start_time = time.perf_counter()
+    interpreter = load_tflite_model(model_path, num_threads=num_threads, xnnpack=xnnpack)
+    load_ms = (time.perf_counter() - start_time) * 1000
+
+    get_input_writer(interpreter).write(image if image is not None else load_benchmark_image())
+    start_time = time.perf_counter()
+    interpreter.invoke()
+    first_invoke_ms = (time.perf_counter() - start_time) * 1000
+    for _ in range(WARMUP_INVOKES - 1):
+        interpreter.invoke()
+
+    timings = np.empty(runs)
+    for i in range(runs):
+        start_time = time.perf_counter()
+        interpreter.invoke()
+        timings[i] = (time.perf_counter() - start_time) * 1000
+
+    return {
+        'num_threads': num_threads,
+        'xnnpack': xnnpack,
+        'runs': runs,
+        'load_ms': load_ms,
+        'first_invoke_ms': first_invoke_ms,
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'mean_ms': float(timings.mean()),
+        'min_ms': float(timings.min()),
+        'max_ms': float(timings.max()),
+    }
+
+def run_benchmark(registry, variants=None, thread_counts=None, xnnpack_options=(True, False),
+                  runs=DEFAULT_RUNS, progress=None):
+    """
+    Benchmark every combination of model variant, thread count and XNNPACK setting.
+
+    Args:
+        registry (ModelRegistry): Resolves the model file of each variant
+        variants (list): Model variants (default: those whose model file exists)
+        thread_counts (list): Thread counts (default: 1, 2, 4, ... up to the core count)
+        xnnpack_options (tuple): XNNPACK settings to try
+        runs (int): Timed invokes per setting
+        progress (callable): progress(done, total, result) after each setting
+
+    Returns:
+        list: One result dict per setting, fastest p50 first; failed settings carry an 'error'
+    """
+    if variants is None:
+        variants = [v for v in MODEL_VARIANTS if os.path.exists(registry.variant_path(v))] or [registry.model_variant]
+    thread_counts = thread_counts or default_thread_counts()
+    image = load_benchmark_image()
+    settings = [(v, t, x) for v in variants for t in thread_counts for x in xnnpack_options]
+
+    results = []
+    for i, (variant, num_threads, xnnpack) in enumerate(settings):
+        try:
+            result = benchmark_setting(registry.variant_path(variant), num_threads, xnnpack, runs=runs, image=image)
+        except Exception as e:
+            result = {'num_threads': num_threads, 'xnnpack': xnnpack, 'error': str(e)}
+        result['model_variant'] = variant
+        results.append(result)
+        if 'error' in result:
+            print(f"Benchmark {variant}, {num_threads} thread(s), xnnpack={xnnpack}: {result['error']}")
+        else:
+            print(f"Benchmark {variant}, {num_threads} thread(s), xnnpack={xnnpack}: "
+                  f"p50 {result['p50_ms']:.2f}ms, p95 {result['p95_ms']:.2f}ms")
+        if progress is not None:
+            progress(i + 1, len(settings), result)
+    return sorted(results, key=lambda r: r.get('p50_ms', float('inf')))
+
+class BenchmarkJob:
+    """Runs run_benchmark() on a background thread so the HTTP request returns right away."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {'state': 'idle'}
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self._status['state'] == 'running'
+
+    def start(self, registry, **kwargs):
+        """
+        Start a benchmark.
+
+        Returns:
+            bool: False if one is already running
+        """
+        with self._lock:
+            if self._status['state'] == 'running':
+                return False
+            self._status = {
+                'state': 'running',
+                'started_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'finished_at': None,
+                'done': 0,
+                'total': None,
+                'results': [],
+                'error': None,
+            }
+
+        def progress(done, total, result):
+            with self._lock:
+                self._status['done'] = done
+                self._status['total'] = total
+                self._status['results'].append(result)
+
+        def run():
+            try:
+                results = run_benchmark(registry, progress=progress, **kwargs)
+                with self._lock:
+                    self._status['results'] = results
+                    self._status['state'] = 'finished'
+            except Exception as e:
+                print(f"Error running inference benchmark: {str(e)}")
+                with self._lock:
+                    self._status['error'] = str(e)
+                    self._status['state'] = 'failed'
+            finally:
+                with self._lock:
+                    self._status['finished_at'] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        threading.Thread(target=run, name='inference-benchmark', daemon=True).start()
+        return True
+
+    def status(self):
+        with self._lock:
+            status = dict(self._status)
+            status['results'] = list(status.get('results', []))
+        status['interpreter_backend'] = dict(INTERPRETER_BACKEND)
+        return status
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TFLite invoke time per interpreter setting')
+    parser.add_argument('--variants', nargs='+', choices=list(MODEL_VARIANTS),
+                        help='Model variants (default: all with a model file)')
+    parser.add_argument('--threads', nargs='+', type=int, help='Thread counts (default: 1, 2, 4, ... cores)')
+    parser.add_argument('--xnnpack', nargs='+', choices=['on', 'off'], default=['on', 'off'],
+                        help='XNNPACK settings to try')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Timed invokes per setting')
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        ModelRegistry(),
+        variants=args.variants,
+        thread_counts=args.threads,
+        xnnpack_options=tuple(option == 'on' for option in args.xnnpack),
+        runs=args.runs
+    )
+    print(f"\nBackend: {INTERPRETER_BACKEND['backend']} {INTERPRETER_BACKEND['version'] or ''}")
+    print(f"{'variant':<8} {'threads':>7} {'xnnpack':>7} {'p50 ms':>9} {'p95 ms':>9} {'first ms':>9}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['model_variant']:<8} {r['num_threads']:>7} {str(r['xnnpack']):>7}  error: {r['error']}")
+        else:
+            print(f"{r['model_variant']:<8} {r['num_threads']:>7} {str(r['xnnpack']):>7} "
+                  f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['first_invoke_ms']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.sqlite import insert
+
+GRANULARITIES = ('hour', 'shift', 'day')
+DEFAULT_SHIFT_START_HOURS = (6, 14, 22)
+GRAY_BIN_WIDTH = 5  # gray_percentage histogram bin width, in percentage points
+BUCKET_FORMAT = '%Y-%m-%d %H:%M:%S'
+DAY_FORMAT = '%Y-%m-%d'
+
+# Outcomes counted in the statistics; anything else (e.g. "Pendiente") is not final yet
+OUTCOME_CATEGORIES = {
+    'GOOD': 'good',
+    'NOGOOD': 'nogood',
+    'Error': 'error',
+}
+
+def outcome_category(outcome):
+    """Return 'good', 'nogood' or 'error' for a final outcome, None otherwise."""
+    return OUTCOME_CATEGORIES.get(outcome)
+
+def shift_start(timestamp, shift_start_hours=DEFAULT_SHIFT_START_HOURS):
+    """
+    Return the start of the shift a timestamp belongs to.
+    Shifts start at the given hours; the last shift of the day runs past
+    midnight into the next day until the first shift starts.
+    """
+    hours = sorted(shift_start_hours)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    starts = [h for h in hours if h <= timestamp.hour]
+    if starts:
+        return day.replace(hour=starts[-1])
+    return (day - timedelta(days=1)).replace(hour=hours[-1])
+
+def bucket_starts(timestamp, shift_start_hours=DEFAULT_SHIFT_START_HOURS):
+    """Return the start of the hour, shift and day buckets for a timestamp, as strings."""
+    return {
+        'hour': timestamp.replace(minute=0, second=0, microsecond=0).strftime(BUCKET_FORMAT),
+        'shift': shift_start(timestamp, shift_start_hours).strftime(BUCKET_FORMAT),
+        'day': timestamp.replace(hour=0, minute=0, second=0, microsecond=0).strftime(BUCKET_FORMAT),
+    }
+
+def gray_bin(gray_percentage):
+    """Return the lower edge of the histogram bin for a gray percentage (None if unknown)."""
+    if gray_percentage is None:
+        return None
+    value = min(max(float(gray_percentage), 0.0), 100.0)
+    return min(int(value // GRAY_BIN_WIDTH) * GRAY_BIN_WIDTH, 100 - GRAY_BIN_WIDTH)
+
+class StatsAggregator:
+    """
+    Incrementally maintained inspection statistics.
+    Every time a car's outcome is written, its contribution is added to (and
+    any previous contribution removed from) three aggregate tables:
+    per-bucket outcome counts, a daily expected_part x actual_part confusion
+    matrix and a daily gray_percentage histogram. Reading the dashboard then
+    costs O(buckets) instead of scanning every car.
+    """
+
+    def __init__(self, bucket_table, confusion_table, gray_table, shift_start_hours=DEFAULT_SHIFT_START_HOURS):
+        """
+        Args:
+            bucket_table: Table with granularity, bucket_start, good, nogood, error, gray_sum, gray_count
+            confusion_table: Table with day, expected_part, actual_part, count
+            gray_table: Table with day, bin_start, count
+            shift_start_hours (tuple): Hours at which shifts start
+        """
+        self.bucket_table = bucket_table
+        self.confusion_table = confusion_table
+        self.gray_table = gray_table
+        self.shift_start_hours = tuple(shift_start_hours)
+
+    def contribution(self, created_at, outcome, expected_part, actual_part, gray_percentage):
+        """
+        Describe what a car adds to the statistics.
+
+        Returns:
+            dict or None: None if the outcome isn't final
+        """
+        category = outcome_category(outcome)
+        if category is None:
+            return None
+        created_at = created_at or datetime.now()
+        return {
+            'buckets': bucket_starts(created_at, self.shift_start_hours),
+            'day': created_at.strftime(DAY_FORMAT),
+            'category': category,
+            'expected_part': expected_part or '',
+            'actual_part': actual_part or '',
+            'gray_percentage': gray_percentage,
+            'gray_bin': gray_bin(gray_percentage),
+        }
+
+    def apply(self, connection, contribution, sign=1):
+        """Add (sign=1) or remove (sign=-1) a contribution with atomic upserts."""
+        if contribution is None:
+            return
+        category = contribution['category']
+        gray = contribution['gray_percentage']
+        gray_sum = sign * float(gray) if gray is not None else 0.0
+        gray_count = sign if gray is not None else 0
+
+        for granularity, bucket_start in contribution['buckets'].items():
+            values = {'good': 0, 'nogood': 0, 'error': 0}
+            values[category] = sign
+            stmt = insert(self.bucket_table).values(
+                granularity=granularity, bucket_start=bucket_start,
+                gray_sum=gray_sum, gray_count=gray_count, **values
+            )
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=['granularity', 'bucket_start'],
+                set_={
+                    category: getattr(self.bucket_table.c, category) + sign,
+                    'gray_sum': self.bucket_table.c.gray_sum + gray_sum,
+                    'gray_count': self.bucket_table.c.gray_count + gray_count,
+                }
+            ))
+
+        stmt = insert(self.confusion_table).values(
+            day=contribution['day'], expected_part=contribution['expected_part'],
+            actual_part=contribution['actual_part'], count=sign
+        )
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['day', 'expected_part', 'actual_part'],
+            set_={'count': self.confusion_table.c.count + sign}
+        ))
+
+        if contribution['gray_bin'] is not None:
+            stmt = insert(self.gray_table).values(
+                day=contribution['day'], bin_start=contribution['gray_bin'], count=sign
+            )
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=['day', 'bin_start'],
+                set_={'count': self.gray_table.c.count + sign}
+            ))
+
+    def rebuild(self, connection, rows):
+        """
+        Recompute all aggregates from scratch.
+
+        Args:
+            connection: SQLAlchemy connection (inside a transaction)
+            rows: Iterable of (created_at, outcome, expected_part, actual_part, gray_percentage)
+
+        Returns:
+            int: Number of cars counted
+        """
+        buckets = {}
+        confusion = Counter()
+        gray_bins = Counter()
+        counted = 0
+        for row in rows:
+            contribution = self.contribution(*row)
+            if contribution is None:
+                continue
+            counted += 1
+            for granularity, bucket_start in contribution['buckets'].items():
+                bucket = buckets.setdefault((granularity, bucket_start), {
+                    'good': 0, 'nogood': 0, 'error': 0, 'gray_sum': 0.0, 'gray_count': 0
+                })
+                bucket[contribution['category']] += 1
+                if contribution['gray_percentage'] is not None:
+                    bucket['gray_sum'] += float(contribution['gray_percentage'])
+                    bucket['gray_count'] += 1
+            confusion[(contribution['day'], contribution['expected_part'], contribution['actual_part'])] += 1
+            if contribution['gray_bin'] is not None:
+                gray_bins[(contribution['day'], contribution['gray_bin'])] += 1
+
+        for table in (self.bucket_table, self.confusion_table, self.gray_table):
+            connection.execute(delete(table))
+        if buckets:
+            connection.execute(insert(self.bucket_table), [
+                {'granularity': granularity, 'bucket_start': bucket_start, **values}
+                for (granularity, bucket_start), values in buckets.items()
+            ])
+        if confusion:
+            connection.execute(insert(self.confusion_table), [
+                {'day': day, 'expected_part': expected, 'actual_part': actual, 'count': count}
+                for (day, expected, actual), count in confusion.items()
+            ])
+        if gray_bins:
+            connection.execute(insert(self.gray_table), [
+                {'day': day, 'bin_start': bin_start, 'count': count}
+                for (day, bin_start), count in gray_bins.items()
+            ])
+        return counted
+
+    def is_empty(self, connection):
+        return connection.execute(select(func.count()).select_from(self.bucket_table)).scalar() == 0
+
+    def query(self, connection, granularity='day', date_from=None, date_to=None):
+        """
+        Read the statistics for a date range.
+
+        Args:
+            granularity (str): 'hour', 'shift' or 'day'
+            date_from (datetime): Start of the range (inclusive), None for no limit
+            date_to (datetime): End of the range (inclusive), None for no limit
+
+        Buckets are counted whole: the bucket containing date_from is included,
+        like the one containing date_to.
+
+        Returns:
+            dict: buckets, totals, confusion matrix and gray histogram
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        buckets_t = self.bucket_table
+        confusion_t = self.confusion_table
+        gray_t = self.gray_table
+
+        bucket_query = select(buckets_t).where(buckets_t.c.granularity == granularity)
+        day_filters_confusion = []
+        day_filters_gray = []
+        if date_from is not None:
+            # Floor to the bucket date_from falls in, the same way contribution() assigns cars to buckets
+            first_bucket = bucket_starts(date_from, self.shift_start_hours)[granularity]
+            bucket_query = bucket_query.where(buckets_t.c.bucket_start >= first_bucket)
+            day_filters_confusion.append(confusion_t.c.day >= date_from.strftime(DAY_FORMAT))
+            day_filters_gray.append(gray_t.c.day >= date_from.strftime(DAY_FORMAT))
+        if date_to is not None:
+            bucket_query = bucket_query.where(buckets_t.c.bucket_start <= date_to.strftime(BUCKET_FORMAT))
+            day_filters_confusion.append(confusion_t.c.day <= date_to.strftime(DAY_FORMAT))
+            day_filters_gray.append(gray_t.c.day <= date_to.strftime(DAY_FORMAT))
+
+        buckets = []
+        totals = {'good': 0, 'nogood': 0, 'error': 0, 'total': 0}
+        gray_sum = 0.0
+        gray_count = 0
+        for row in connection.execute(bucket_query.order_by(buckets_t.c.bucket_start)).mappings():
+            total = row['good'] + row['nogood'] + row['error']
+            if total <= 0:
+                continue
+            buckets.append({
+                'start': row['bucket_start'],
+                'good': row['good'],
+                'nogood': row['nogood'],
+                'error': row['error'],
+                'total': total,
+                'gray_avg': row['gray_sum'] / row['gray_count'] if row['gray_count'] else None,
+            })
+            for key in ('good', 'nogood', 'error'):
+                totals[key] += row[key]
+            totals['total'] += total
+            gray_sum += row['gray_sum']
+            gray_count += row['gray_count']
+        totals['gray_avg'] = gray_sum / gray_count if gray_count else None
+
+        confusion_query = (
+            select(confusion_t.c.expected_part, confusion_t.c.actual_part, func.sum(confusion_t.c.count))
+            .where(*day_filters_confusion)
+            .group_by(confusion_t.c.expected_part, confusion_t.c.actual_part)
+        )
+        confusion = [
+            {'expected_part': expected, 'actual_part': actual, 'count': count}
+            for expected, actual, count in connection.execute(confusion_query)
+            if count
+        ]
+
+        gray_query = (
+            select(gray_t.c.bin_start, func.sum(gray_t.c.count))
+            .where(*day_filters_gray)
+            .group_by(gray_t.c.bin_start)
+        )
+        gray_counts = dict(connection.execute(gray_query).all())
+        gray_histogram = [
+            {'bin_start': start, 'bin_end': start + GRAY_BIN_WIDTH, 'count': gray_counts.get(start, 0) or 0}
+            for start in range(0, 100, GRAY_BIN_WIDTH)
+        ]
+
+        return {
+            'granularity': granularity,
+            'date_from': date_from.strftime(BUCKET_FORMAT) if date_from else None,
+            'date_to': date_to.strftime(BUCKET_FORMAT) if date_to else None,
+            'shift_start_hours': list(self.shift_start_hours),
+            'buckets': buckets,
+            'totals': totals,
+            'confusion': confusion,
+            'gray_histogram': gray_histogram,
+        }
@@ -1,30 +1,53 @@
-from flask import Flask, jsonify, request, send_from_directory
+# Imported first so the profile covers the rest of startup (see /startup-profile)
+from startup_profile import startup_profile
 import socket
 import threading
-from flask_socketio import SocketIO, emit
-from camera import capture_image, create_placeholder_image
-from flask_cors import CORS
-from tflite_detector import tflite_detect_image, load_tflite_model
-from flask_sqlalchemy import SQLAlchemy
-from flask_marshmallow import Marshmallow
-from marshmallow_sqlalchemy import SQLAlchemySchema, auto_field
-from dataclasses import dataclass
-from ics_integration import ICSIntegration
 import os
-import base64
+import copy
+import io
 import json
 import time
-from detect_gray import detect_gray_percentage
-import cv2
-import numpy as np
-import logging
-import subprocess
-from datetime import datetime
-import uuid
-import requests
 import traceback  # Add traceback import
 import random
 import string
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+with startup_profile.measure('import flask'):
+    from flask import Flask, jsonify, request, send_from_directory, send_file
+    from flask_cors import CORS
+with startup_profile.measure('import flask_socketio'):
+    from flask_socketio import SocketIO, emit
+with startup_profile.measure('import sqlalchemy and marshmallow'):
+    from flask_sqlalchemy import SQLAlchemy
+    from flask_marshmallow import Marshmallow
+    from marshmallow_sqlalchemy import SQLAlchemySchema, auto_field
+    from marshmallow import fields
+    from sqlalchemy.orm import column_property, load_only
+    from sqlalchemy import event, select, inspect as sa_inspect
+with startup_profile.measure('import opencv and numpy'):
+    import cv2
+    import numpy as np
+with startup_profile.measure('import application modules'):
+    # The TFLite runtime itself is imported lazily, on the warm-up thread, when the model is loaded
+    from camera import capture_frame, capture_single_frame, capture_service
+    from tflite_detector import tflite_detect, DetectionResult
+    from frame import Frame, normalize_roi, FULL_ROI
+    from model_registry import ModelRegistry, MODEL_VARIANTS
+    from model_spec import validate_output_order
+    from plc_pipeline import PlcPipeline
+    from warmup import WarmupTracker
+    from stream_framing import FrameDecoder, PLC_RECORD_SIZE, GALC_RECORD_SIZE, is_valid_plc_record, is_valid_galc_record
+    from image_store import ImageStore
+    from migrate_db import ensure_schema
+    from inspection_stats import StatsAggregator, GRANULARITIES
+    from decision_engine import DecisionEngine, DEFAULT_DECISION_RULES
+    from detect_gray import bright_pixel_percentage
+    from ics_integration import ICSIntegration
+    from ics_outbox import IcsOutbox
+    from vin_cache import VinCache
+    from inference_benchmark import BenchmarkJob, DEFAULT_RUNS as BENCHMARK_DEFAULT_RUNS
+    from reinference import ReinferenceJob, station_settings, find_databases
 
 app = Flask(__name__, static_folder='../application-ui', static_url_path='/')
 CORS(app)  # Allow specific frontend
@@ -39,44 +62,52 @@ app.config['UPLOAD_FOLDER'] = 'uploads/'
 db = SQLAlchemy(app)
 ma = Marshmallow(app)
 ics = ICSIntegration()  # Initialize ICS integration
+# VINs by body number, prefetched when the PLC message arrives (see vin_cache.py)
+vin_cache = VinCache(ics.request_vin_async)
 
-# Cache for TFLite model and labels
-model_cache = {
-    'interpreter': None,
-    'labels': None,
-    'last_loaded': 0
-}
+# Process-wide model registry: the TFLite model and labels are loaded once and
+# detections check out an interpreter from its pool with model_registry.checkout()
+model_registry = ModelRegistry()
 
-def get_model_and_labels():
-    """
-    Load the TFLite model and labels for object detection.
-    
-    Returns:
-        tuple: (model, class_names)
-    """
-    print("Loading TFLite model and labels...")
-    # Try with application path first, fallback to current directory
-    model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detect.tflite')
-    label_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'labelmap.txt')
-    
-    if not os.path.exists(model_path):
-        print(f"Model not found at {model_path}, trying current directory")
-        model_path = 'detect.tflite'
-        
-    if not os.path.exists(label_path):
-        print(f"Labels not found at {label_path}, trying current directory")
-        label_path = 'labelmap.txt'
-    
-    # Load labels
-    with open(label_path, 'r') as f:
-        class_names = [line.strip() for line in f.readlines()]
-        print(f"Loaded {len(class_names)} labels")
-    
-    # Load model using TFLite
-    model = load_tflite_model(model_path)
-    print("TFLite model loaded successfully")
-    
-    return model, class_names
+# Maximum time a detection waits for a free interpreter from the pool
+INTERPRETER_CHECKOUT_TIMEOUT = 20
+
+# Content-addressed image store: JPEG bytes live on disk under their SHA-256,
+# database rows only keep the hash and size
+image_store = ImageStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_store'))
+
+# How long browsers may cache an image (images never change for a given hash)
+IMAGE_CACHE_MAX_AGE = 31536000
+
+# Page size for /logs
+LOGS_DEFAULT_LIMIT = 100
+LOGS_MAX_LIMIT = 1000
+
+# Fields /logs returns by default; images are only sent when asked for
+LOG_LIST_FIELDS = ('id', 'car_id', 'date', 'created_at', 'expected_part', 'actual_part', 'outcome',
+                   'gray_percentage', 'original_image_url', 'result_image_url')
+LOG_IMAGE_FIELDS = ('original_image', 'result_image')
+
+def update_capture_service():
+    """Start or stop the background camera capture service to match the config."""
+    if config['image_source'] == 'camera' and config.get('camera_capture_service', True):
+        capture_service.start()
+    elif capture_service.is_running:
+        capture_service.stop()
+
+def preload_model():
+    """Load the TFLite model at startup so the first car doesn't pay for it."""
+    try:
+        model_registry.configure(
+            pool_size=config['interpreter_pool_size'],
+            num_threads=config['interpreter_num_threads'],
+            xnnpack_enabled=config['xnnpack_enabled'],
+            model_variant=config['model_variant'],
+            output_order=config['model_output_order'] or {}
+        )
+        model_registry.load()
+    except Exception as e:
+        print(f"Error preloading TFLite model: {str(e)}")
 
 # Define CarLog model
 class CarLog(db.Model):
@@ -85,16 +116,152 @@ class CarLog(db.Model):
     date = db.Column(db.String(50), nullable=False)
     expected_part = db.Column(db.String(200), nullable=False)
     actual_part = db.Column(db.String(200), nullable=False)
-    original_image = db.Column(db.Text, nullable=False)  # Store base64 image directly
-    result_image = db.Column(db.Text, nullable=False)    # Store base64 image directly
+    original_image = db.Column(db.Text, nullable=False)  # Legacy base64 image, empty once moved to the image store
+    result_image = db.Column(db.Text, nullable=False)    # Legacy base64 image, empty once moved to the image store
     outcome = db.Column(db.String(200), nullable=False)
     gray_percentage = db.Column(db.Float)
+    original_image_hash = db.Column(db.String(64))  # SHA-256 of the JPEG in the image store
+    original_image_size = db.Column(db.Integer)
+    result_image_hash = db.Column(db.String(64))
+    result_image_size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.now)  # Sortable timestamp (date is a display string)
+    detections = db.Column(db.Text)  # JSON list of detected objects; the result image is rendered from it on demand
+    
+    # Whether the legacy text columns still hold an image, computed in SQL so
+    # listing rows never loads the base64 text
+    has_legacy_original_image = column_property(db.func.coalesce(db.func.length(original_image), 0) > 0)
+    has_legacy_result_image = column_property(db.func.coalesce(db.func.length(result_image), 0) > 0)
+    has_detections = column_property(detections.isnot(None))
     
     # Add index for faster lookups
     __table_args__ = (
         db.Index('idx_car_id', 'car_id'),
+        db.Index('idx_car_log_created_at', 'created_at'),
+        db.Index('idx_car_log_outcome', 'outcome'),
+        db.Index('idx_car_log_expected_part', 'expected_part'),
     )
 
+# Aggregate tables behind /stats, kept up to date as car outcomes are written
+class InspectionStatBucket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, shift or day
+    bucket_start = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM:SS
+    good = db.Column(db.Integer, nullable=False, default=0)
+    nogood = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Integer, nullable=False, default=0)
+    gray_sum = db.Column(db.Float, nullable=False, default=0.0)
+    gray_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', name='uq_stat_bucket'),
+    )
+
+class InspectionConfusionStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.String(10), nullable=False)
+    expected_part = db.Column(db.String(200), nullable=False)
+    actual_part = db.Column(db.String(200), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'expected_part', 'actual_part', name='uq_confusion_stat'),
+    )
+
+class InspectionGrayStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.String(10), nullable=False)
+    bin_start = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'bin_start', name='uq_gray_stat'),
+    )
+
+stats_aggregator = StatsAggregator(
+    InspectionStatBucket.__table__,
+    InspectionConfusionStat.__table__,
+    InspectionGrayStat.__table__
+)
+
+# CarLog fields that affect the statistics
+STATS_FIELDS = ('created_at', 'outcome', 'expected_part', 'actual_part', 'gray_percentage')
+
+def car_log_stats_values(car_log, previous=False):
+    """Return a car's STATS_FIELDS values, before (previous=True) or after the pending changes."""
+    state = sa_inspect(car_log)
+    values = []
+    for name in STATS_FIELDS:
+        history = state.attrs[name].history
+        if previous and history.deleted:
+            values.append(history.deleted[0])
+        elif previous and history.added:
+            values.append(None)  # Previous value was never loaded
+        else:
+            values.append(getattr(car_log, name))
+    return values
+
+@event.listens_for(db.session, 'after_flush')
+def update_inspection_stats(session, flush_context):
+    """
+    Keep the aggregate tables in step with CarLog, in the same transaction.
+    Whatever code path writes an outcome (PLC, capture, /update-item, /log),
+    its previous contribution is removed and the new one added.
+    """
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, CarLog):
+            changes.append((None, car_log_stats_values(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, CarLog):
+            state = sa_inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in STATS_FIELDS):
+                changes.append((car_log_stats_values(obj, previous=True), car_log_stats_values(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, CarLog):
+            changes.append((car_log_stats_values(obj, previous=True), None))
+    if not changes:
+        return
+    
+    connection = session.connection()
+    for old_values, new_values in changes:
+        if old_values is not None:
+            stats_aggregator.apply(connection, stats_aggregator.contribution(*old_values), sign=-1)
+        if new_values is not None:
+            stats_aggregator.apply(connection, stats_aggregator.contribution(*new_values), sign=1)
+
+def rebuild_inspection_stats():
+    """Recompute the aggregate tables from every CarLog row."""
+    start_time = time.time()
+    with db.engine.begin() as connection:
+        rows = connection.execute(
+            select(CarLog.created_at, CarLog.outcome, CarLog.expected_part,
+                   CarLog.actual_part, CarLog.gray_percentage)
+            .execution_options(yield_per=1000)
+        )
+        counted = stats_aggregator.rebuild(connection, rows)
+    print(f"Rebuilt inspection statistics from {counted} cars in {(time.time() - start_time) * 1000:.0f}ms")
+    return counted
+
+def prime_inspection_stats():
+    """Build the aggregate tables on first start with an existing database."""
+    try:
+        stats_aggregator.shift_start_hours = tuple(config['stats_shift_start_hours'])
+        with app.app_context():
+            with db.engine.connect() as connection:
+                empty = stats_aggregator.is_empty(connection)
+            if empty and CarLog.query.first() is not None:
+                rebuild_inspection_stats()
+    except Exception as e:
+        print(f"Error building inspection statistics: {str(e)}")
+
+# Columns loaded when listing logs without images
+LOG_LIST_COLUMNS = (
+    CarLog.id, CarLog.car_id, CarLog.date, CarLog.created_at, CarLog.expected_part,
+    CarLog.actual_part, CarLog.outcome, CarLog.gray_percentage,
+    CarLog.original_image_hash, CarLog.result_image_hash,
+    CarLog.has_legacy_original_image, CarLog.has_legacy_result_image, CarLog.has_detections,
+)
+
 # Define QueuedCar model for GALC cars waiting to be processed
 class QueuedCar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -113,6 +280,10 @@ class FeedbackLog(db.Model):
     real_outcome = db.Column(db.String(50), nullable=False)
     original_image = db.Column(db.Text, nullable=True)
     result_image = db.Column(db.Text, nullable=True)
+    original_image_hash = db.Column(db.String(64))
+    original_image_size = db.Column(db.Integer)
+    result_image_hash = db.Column(db.String(64))
+    result_image_size = db.Column(db.Integer)
     feedback_date = db.Column(db.String(50), nullable=False)
     feedback_note = db.Column(db.Text, nullable=True)
     
@@ -121,6 +292,152 @@ class FeedbackLog(db.Model):
         db.Index('idx_feedback_car_id', 'car_id'),
     )
 
+# NOGOOD defects waiting to be reported to ICS, one per car (see ics_outbox.py)
+class IcsOutboxEntry(db.Model):
+    __tablename__ = 'ics_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    car_id = db.Column(db.String(50), unique=True, nullable=False)
+    expected_part = db.Column(db.String(200), nullable=False)
+    actual_part = db.Column(db.String(200), nullable=False)
+    image_hash = db.Column(db.String(64))  # Original image in the image store
+    vin = db.Column(db.String(50))          # Kept once looked up, so retries only resend the defect
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, delivered or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_attempt_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    
+    __table_args__ = (
+        db.Index('idx_ics_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+def get_db_engine():
+    with app.app_context():
+        return db.engine
+
+ics_outbox = IcsOutbox(IcsOutboxEntry.__table__, get_db_engine, ics, lambda image_hash: image_store.get_base64(image_hash),
+                       vin_lookup=lambda car_id: vin_cache.get(body_number(car_id)))
+
+def load_row_image(row, prefix):
+    """
+    Return a row's image as base64, reading it from the image store when the
+    row has a hash and falling back to the legacy text column otherwise.
+    
+    Args:
+        row: CarLog or FeedbackLog instance
+        prefix (str): 'original_image' or 'result_image'
+    """
+    image_hash = getattr(row, f'{prefix}_hash', None)
+    if not image_hash and prefix == 'result_image' and isinstance(row, CarLog):
+        image_hash = ensure_result_image(row)
+    if image_hash:
+        image_base64 = image_store.get_base64(image_hash)
+        if image_base64 is not None:
+            return image_base64
+        print(f"WARNING: Image {image_hash} not found in image store")
+    return getattr(row, prefix, None) or ""
+
+def ensure_result_image(car_log):
+    """
+    Render a car's annotated result image from its stored detections the
+    first time it is needed, store it and remember its hash on the row.
+    
+    Returns:
+        str: The result image hash, or None if it can't be rendered
+    """
+    if car_log.result_image_hash:
+        return car_log.result_image_hash
+    if not car_log.detections or not car_log.original_image_hash:
+        return None
+    jpeg = image_store.get(car_log.original_image_hash)
+    if jpeg is None:
+        return None
+    result = DetectionResult.from_objects(Frame.from_jpeg(jpeg), json.loads(car_log.detections))
+    image_hash, size = image_store.put(result.annotated.jpeg)
+    car_log.result_image_hash = image_hash
+    car_log.result_image_size = size
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving rendered result image for car {car_log.car_id}: {str(e)}")
+    return image_hash
+
+def image_url(row, prefix):
+    """
+    URL the frontend can load a row's image from, None if the row has no image.
+    Stored images are served by hash; rows that still keep the image in the
+    legacy text column are served through /car-image.
+    """
+    image_hash = getattr(row, f'{prefix}_hash', None)
+    if image_hash:
+        return f"/images/{image_hash}"
+    if getattr(row, f'has_legacy_{prefix}', False):
+        return f"/car-image/{row.car_id}/{prefix.split('_')[0]}"
+    if prefix == 'result_image' and getattr(row, 'has_detections', False):
+        return f"/car-image/{row.car_id}/result"  # Rendered on first request
+    return None
+
+def image_transport_fields(original, result, car_id=None):
+    """
+    Image fields for socket events and API responses.
+    With config['image_transport'] == 'inline' the full base64 images are sent.
+    With 'reference' only each image's ID (its hash in the image store), its
+    URL and a small thumbnail are sent; clients fetch the full image from
+    /images/<id>, which browsers cache, and only when they show it.
+    
+    Args:
+        original (Frame): Captured image, or None
+        result (DetectionResult or Frame): Detections or annotated image, or None
+        car_id (str): Car the images belong to; lets an unrendered result be
+            referenced through /car-image, which renders it on first request
+        
+    Returns:
+        dict: original_image/result_image, or *_id, *_url and *_thumb fields
+    """
+    fields = {}
+    if isinstance(result, DetectionResult):
+        if car_id and not result.is_rendered and config['image_transport'] != 'inline':
+            fields['result_image_url'] = f"/car-image/{car_id}/result"
+            result = None
+        else:
+            result = result.annotated
+    for prefix, frame in (('original_image', original), ('result_image', result)):
+        if frame is None:
+            continue
+        if config['image_transport'] == 'inline':
+            fields[prefix] = frame.base64
+        else:
+            image_hash, _ = image_store.put(frame.jpeg)
+            fields[f'{prefix}_id'] = image_hash
+            fields[f'{prefix}_url'] = f"/images/{image_hash}"
+            fields[f'{prefix}_thumb'] = frame.thumbnail().base64
+    return fields
+
+def store_row_images(row, original=None, result=None):
+    """
+    Write images to the image store and point the row at them.
+    Accepts Frames, JPEG bytes or base64 strings; the legacy text columns are
+    left empty so the row only carries the hash and size. For a CarLog the
+    result may be a DetectionResult: its detections are saved and the result
+    image is only stored if it has already been rendered.
+    """
+    if isinstance(result, DetectionResult):
+        if isinstance(row, CarLog):
+            row.detections = result.to_json()
+            row.result_image_hash = None
+            row.result_image_size = None
+        result = result.annotated if result.is_rendered else None
+    for prefix, image in (('original_image', original), ('result_image', result)):
+        if image is None or (isinstance(image, str) and not image):
+            continue
+        image_hash, size = image_store.put(Frame.coerce(image).jpeg)
+        setattr(row, f'{prefix}_hash', image_hash)
+        setattr(row, f'{prefix}_size', size)
+        setattr(row, prefix, "")
+
 class CarLogSchema(SQLAlchemySchema):
     class Meta:
         model = CarLog
@@ -131,10 +448,27 @@ class CarLogSchema(SQLAlchemySchema):
     date = auto_field()
     expected_part = auto_field()
     actual_part = auto_field()
-    original_image = auto_field()
-    result_image = auto_field()
+    original_image = fields.Method('get_original_image')
+    result_image = fields.Method('get_result_image')
+    original_image_hash = auto_field()
+    result_image_hash = auto_field()
+    original_image_url = fields.Method('get_original_image_url')
+    result_image_url = fields.Method('get_result_image_url')
     outcome = auto_field()
     gray_percentage = auto_field()
+    created_at = auto_field()
+
+    def get_original_image(self, obj):
+        return load_row_image(obj, 'original_image')
+
+    def get_result_image(self, obj):
+        return load_row_image(obj, 'result_image')
+
+    def get_original_image_url(self, obj):
+        return image_url(obj, 'original_image')
+
+    def get_result_image_url(self, obj):
+        return image_url(obj, 'result_image')
 
 class QueuedCarSchema(SQLAlchemySchema):
     class Meta:
@@ -158,11 +492,27 @@ class FeedbackLogSchema(SQLAlchemySchema):
     actual_part = auto_field()
     original_outcome = auto_field()
     real_outcome = auto_field()
-    original_image = auto_field()
-    result_image = auto_field()
+    original_image = fields.Method('get_original_image')
+    result_image = fields.Method('get_result_image')
+    original_image_hash = auto_field()
+    result_image_hash = auto_field()
+    original_image_url = fields.Method('get_original_image_url')
+    result_image_url = fields.Method('get_result_image_url')
     feedback_date = auto_field()
     feedback_note = auto_field()
 
+    def get_original_image(self, obj):
+        return load_row_image(obj, 'original_image') or None
+
+    def get_result_image(self, obj):
+        return load_row_image(obj, 'result_image') or None
+
+    def get_original_image_url(self, obj):
+        return image_url(obj, 'original_image')
+
+    def get_result_image_url(self, obj):
+        return image_url(obj, 'result_image')
+
 # Initialize schemas
 car_log_schema = CarLogSchema()
 car_logs_schema = CarLogSchema(many=True)
@@ -171,9 +521,16 @@ queued_cars_schema = QueuedCarSchema(many=True)
 feedback_log_schema = FeedbackLogSchema()
 feedback_logs_schema = FeedbackLogSchema(many=True)
 
-# Initialize the database tables
-with app.app_context():
-    db.create_all()  # Create tables if they don't exist
+def init_database():
+    """
+    Create missing tables and bring older databases up to date.
+    Called once at startup (not at import time), before the server starts.
+    """
+    with startup_profile.measure('database init'):
+        with app.app_context():
+            db.create_all()  # Create tables if they don't exist
+            # create_all() doesn't add columns to existing tables, so bring older databases up to date
+            ensure_schema(db.engine.url.database)
 
 @dataclass
 class LastSentMessage:
@@ -193,8 +550,93 @@ config = {
     "image_source": "camera",  # Options: "camera", "no_capo", "capo_tipo_1", "capo_tipo_2", "capo_tipo_3"
     "use_galc": False,        # Added for the new retry_connection method
     "gray_detection_enabled": True,  # New option to enable/disable gray detection
+    "interpreter_pool_size": 2,      # Number of pre-allocated TFLite interpreters
+    "interpreter_num_threads": 2,    # CPU threads used by each interpreter
+    "xnnpack_enabled": True,         # Let TFLite apply its XNNPACK delegate (False: builtin kernels only)
+    "model_variant": "float",        # "float" (detect.tflite) or "int8" (detect_int8.tflite)
+    "model_output_order": None,      # {"boxes": i, "classes": j, "scores": k} output positions (None: read from the model)
+    "camera_capture_service": True,  # Keep the camera open and grabbing frames in the background
+    "plc_pipeline_enabled": False,   # Read, inspect and answer PLC messages in a pipeline
+    "plc_pipeline_depth": 4,         # Maximum cars in flight in the PLC pipeline
+    "plc_pipeline_workers": 2,       # Worker threads running capture and inference
+    "plc_pipeline_backpressure": "block",  # "block" stops reading the socket when full, "reject" answers NOGOOD
+    "stats_shift_start_hours": [6, 14, 22],  # Hours at which shifts start, for /stats?granularity=shift
+    "image_transport": "reference",  # "reference" sends image IDs, URLs and thumbnails, "inline" sends base64 images
+    "decision_rules": copy.deepcopy(DEFAULT_DECISION_RULES),  # Capo classification rules, see decision_engine.py
+    "gray_roi": list(FULL_ROI),       # Fractional [xmin, ymin, xmax, ymax] region used for the gray check
+    "detection_roi": list(FULL_ROI),  # Fractional [xmin, ymin, xmax, ymax] region the detector runs on
+    "gray_decode_reduction": 1,       # 1 (full resolution), 2, 4 or 8: gray check on a reduced-resolution decode
+    "ics_connect_timeout": 3.05,      # Seconds to connect to ICS
+    "ics_read_timeout": 10,           # Seconds to wait for an ICS response
+    "ics_base_url": None,             # ICS server, e.g. "http://127.0.0.1:8090" for ics.py; None uses ICS_BASE_URL or the plant server
 }
 
+# Settings that rebuild the interpreter pool when they change
+INTERPRETER_CONFIG_KEYS = ('interpreter_pool_size', 'interpreter_num_threads', 'xnnpack_enabled', 'model_variant',
+                           'model_output_order')
+
+# Configuration saved by POST /config, reloaded at startup
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+# Values persisted across restarts are read back with the same types as the defaults
+def load_persisted_config(path=CONFIG_PATH):
+    """Apply the configuration saved in config.json, if any, on top of the defaults."""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading saved configuration {path}: {str(e)}")
+        return
+    for key, value in saved.items():
+        if key not in config:
+            continue  # Setting that no longer exists
+        if key in ('gray_roi', 'detection_roi'):
+            try:
+                value = list(normalize_roi(value))
+            except ValueError as e:
+                print(f"Ignoring saved {key}: {str(e)}")
+                continue
+        elif key == 'decision_rules':
+            try:
+                DecisionEngine(value)
+            except (ValueError, AttributeError) as e:
+                print(f"Ignoring saved decision_rules: {str(e)}")
+                continue
+        config[key] = value
+    print(f"Loaded saved configuration from {path}")
+
+def save_config(path=CONFIG_PATH):
+    """Write the current configuration to config.json (atomically)."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error saving configuration to {path}: {str(e)}")
+
+load_persisted_config()
+ics.configure(connect_timeout=config['ics_connect_timeout'], read_timeout=config['ics_read_timeout'])
+ics.set_base_url(config['ics_base_url'])
+
+# Compiled classification rules; rebuilt when config['decision_rules'] changes
+decision_engine = DecisionEngine(config['decision_rules'])
+
+# Seconds the PLC waits for a car's verdict before it is answered NOGOOD
+PLC_DETECTION_TIMEOUT = 30
+
+# Frame decoders of the current PLC/GALC connections, for /stream-stats
+stream_decoders = {'PLC': None, 'GALC': None}
+
+# Pipeline of the currently connected PLC (None in serial mode)
+active_plc_pipeline = None
+
+def set_active_plc_pipeline(pipeline):
+    global active_plc_pipeline
+    active_plc_pipeline = pipeline
+
 client_socket = None
 client_thread = None
 
@@ -216,84 +658,93 @@ def handle_galc_response(conn):
     # Set socket timeout for initial connection
     conn.settimeout(5.0)
     
+    galc_decoder = FrameDecoder(GALC_RECORD_SIZE, validator=is_valid_galc_record, name='GALC')
+    stream_decoders['GALC'] = galc_decoder
+    
     while True:
         try:
             socketio.emit('connection_status', {'status': True if is_connected else False})
             socketio.emit('connection_type', {'type': config['connection_type']})
 
-            # Receive the 45-byte GALC message
+            # Receive 45-byte GALC telegrams from the stream
             try:
-                data = conn.recv(45)
-                if not data:
+                chunk = conn.recv(4096)
+                if not chunk:
                     print("Connection closed by GALC server")
                     break
-                if len(data) != 45:
-                    print(f"Warning: Unexpected GALC message length: {len(data)}. Expected 45 bytes.")
-                    continue
-
-                print(f"Received GALC message: Receiver: {data[0:6].decode()}, "
-                      f"Sender: {data[6:12].decode()}, Serial: {data[12:16].decode()}, "
-                      f"Trigger: {data[44]:02d}")
-
-                # Extract and handle the last two bytes
-                last_two_bytes = data[43:45]
-                trigger_value = int.from_bytes(last_two_bytes, "big")  # Convert to integer
-                trigger_str = f"{trigger_value:02d}"  # Ensure it is a 2-digit string
-
-                # Only process non-empty messages (car data)
-                if trigger_str in ["01", "05", "08"]:
-                    # Get expected part based on trigger value
-                    expected_part = {
-                        "01": "Capo tipo 1",
-                        "05": "Capo tipo 2",
-                        "08": "Capo tipo 3"
-                    }.get(trigger_str)
-
-                    if expected_part:
-                        # Generate a unique car ID
-                        car_id = f"CAR_{int(time.time())}_{trigger_str}"
-                        current_date = time.strftime("%d-%m-%Y %H:%M:%S")
-
-                        # Create a new queued car entry
-                        new_queued_car = QueuedCar(
-                            car_id=car_id,
-                            date=current_date,
-                            expected_part=expected_part,
-                            is_processed=False
-                        )
+
+                send_failed = False
+                # A chunk may hold several telegrams or only part of one
+                for data in galc_decoder.feed(chunk):
+                    print(f"Received GALC message: Receiver: {data[0:6].decode()}, "
+                          f"Sender: {data[6:12].decode()}, Serial: {data[12:16].decode()}, "
+                          f"Trigger: {data[44]:02d}")
+
+                    # Extract and handle the last two bytes
+                    last_two_bytes = data[43:45]
+                    trigger_value = int.from_bytes(last_two_bytes, "big")  # Convert to integer
+                    trigger_str = f"{trigger_value:02d}"  # Ensure it is a 2-digit string
+
+                    # Only process non-empty messages (car data)
+                    if trigger_str in ["01", "05", "08"]:
+                        # Get expected part based on trigger value
+                        expected_part = {
+                            "01": "Capo tipo 1",
+                            "05": "Capo tipo 2",
+                            "08": "Capo tipo 3"
+                        }.get(trigger_str)
+
+                        if expected_part:
+                            # Generate a unique car ID; the telegram sequence number keeps
+                            # cars from the same burst (same second) apart
+                            sequence_num = data[29:32].decode(errors='ignore').strip() or "000"
+                            car_id = f"CAR_{int(time.time())}_{sequence_num}_{trigger_str}"
+                            current_date = time.strftime("%d-%m-%Y %H:%M:%S")
+
+                            # Create a new queued car entry
+                            new_queued_car = QueuedCar(
+                                car_id=car_id,
+                                date=current_date,
+                                expected_part=expected_part,
+                                is_processed=False
+                            )
                         
-                        # Use application context for database operations
-                        with app.app_context():
-                            try:
-                                db.session.add(new_queued_car)
-                                db.session.commit()
-                                # Create a dictionary representation for the socket emission
-                                car_data = {
-                                    'car_id': new_queued_car.car_id,
-                                    'date': new_queued_car.date,
-                                    'expected_part': new_queued_car.expected_part,
-                                    'is_processed': new_queued_car.is_processed
-                                }
-                                # Notify frontend about new queued car
-                                socketio.emit('new_queued_car', car_data)
-                            except Exception as e:
-                                print(f"Error adding queued car to database: {e}")
-                                db.session.rollback()
-
-                # Send a 26-byte response
-                response = bytearray(26)
-                response[:6] = data[6:12]  # Sender to receiver
-                response[6:12] = data[0:6]  # Receiver to sender
-                response[12:16] = data[12:16]  # Serial number
-                response[25] = 0  # Always send keep-alive flag since we're just queueing
+                            # Use application context for database operations
+                            with app.app_context():
+                                try:
+                                    db.session.add(new_queued_car)
+                                    db.session.commit()
+                                    # Create a dictionary representation for the socket emission
+                                    car_data = {
+                                        'car_id': new_queued_car.car_id,
+                                        'date': new_queued_car.date,
+                                        'expected_part': new_queued_car.expected_part,
+                                        'is_processed': new_queued_car.is_processed
+                                    }
+                                    # Notify frontend about new queued car
+                                    socketio.emit('new_queued_car', car_data)
+                                except Exception as e:
+                                    print(f"Error adding queued car to database: {e}")
+                                    db.session.rollback()
+
+                    # Send a 26-byte response
+                    response = bytearray(26)
+                    response[:6] = data[6:12]  # Sender to receiver
+                    response[6:12] = data[0:6]  # Receiver to sender
+                    response[12:16] = data[12:16]  # Serial number
+                    response[25] = 0  # Always send keep-alive flag since we're just queueing
                 
-                try:
-                    conn.sendall(response)
-                    print(f"Sent GALC response: Receiver: {response[0:6].decode()}, "
-                          f"Sender: {response[6:12].decode()}, Serial: {response[12:16].decode()}, "
-                          f"Status: {response[25]}")
-                except socket.error as e:
-                    print(f"Error sending response to GALC: {e}")
+                    try:
+                        conn.sendall(response)
+                        print(f"Sent GALC response: Receiver: {response[0:6].decode()}, "
+                              f"Sender: {response[6:12].decode()}, Serial: {response[12:16].decode()}, "
+                              f"Status: {response[25]}")
+                    except socket.error as e:
+                        print(f"Error sending response to GALC: {e}")
+                        send_failed = True
+                        break
+
+                if send_failed:
                     break
 
             except socket.timeout:
@@ -363,8 +814,254 @@ def send_plc_response(socket, is_good):
         print(f"Error sending response to PLC: {str(e)}")
         return False
 
+# Map PLC/GALC capot codes to expected parts
+CAPOT_TYPES = {
+    "01": "Capo tipo 1",
+    "05": "Capo tipo 2",
+    "08": "Capo tipo 3"
+}
+
+def parse_plc_message(message):
+    """
+    Parse a PLC message: 3-digit sequence + 5-char body + 2-digit capot type.
+    
+    Returns:
+        tuple: (sequence, body, capot, expected_part), or None if the message is invalid
+    """
+    if len(message) < 10:  # Minimum length: 3 (sequence) + 5 (body) + 2 (capot)
+        print(f"WARNING: Invalid message format (too short): {message}")
+        return None
+
+    print("\n=== Parsing message ===")
+    sequence = message[:3]  # First 3 digits
+    body = message[3:8]     # Next 5 characters (letter + 4 digits)
+    capot = message[8:10]   # Last 2 digits (01, 05, or 08)
+    
+    print(f"Extracted sequence: {sequence}")
+    print(f"Extracted body: {body}")
+    print(f"Extracted capot type: {capot}")
+    
+    expected_part = CAPOT_TYPES.get(capot)
+    if not expected_part:
+        print(f"ERROR: Unknown capot type: {capot}")
+        return None
+
+    return sequence, body, capot, expected_part
+
+def body_number(car_id):
+    """
+    Body number used for the ICS VIN lookup.
+    PLC car IDs are sequence-body-capot-suffix (see generate_plc_car_id); any
+    other car ID is passed through as it is.
+    """
+    parts = car_id.split('-')
+    if len(parts) == 4 and len(parts[1]) == 5:
+        return parts[1]
+    return car_id
+
+def generate_plc_car_id(sequence, body, capot, max_attempts=10):
+    """
+    Generate a unique car ID using the PLC message and a random component.
+    
+    Returns:
+        str: The car ID, or None if no unique ID could be generated
+    """
+    for attempt in range(max_attempts):
+        random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+        temp_car_id = f"{sequence}-{body}-{capot}-{random_suffix}"
+        
+        # Check if this ID already exists in both CarLog and QueuedCar
+        with app.app_context():
+            try:
+                existing_car = db.session.query(CarLog).filter_by(car_id=temp_car_id).first()
+                existing_queued = db.session.query(QueuedCar).filter_by(car_id=temp_car_id).first()
+                
+                if not existing_car and not existing_queued:
+                    return temp_car_id
+            except Exception as e:
+                print(f"Error checking for existing car ID: {e}")
+                db.session.rollback()
+    
+    print(f"ERROR: Could not generate unique car ID after {max_attempts} attempts")
+    return None
+
+def register_plc_car(car_id, expected_part, current_time):
+    """
+    Create the pending CarLog entry for a PLC car and notify the frontend.
+    
+    Returns:
+        bool: True if the car was registered
+    """
+    with app.app_context():
+        try:
+            # Double check that the car doesn't exist before inserting
+            existing_car = db.session.query(CarLog).filter_by(car_id=car_id).first()
+            if existing_car:
+                print(f"WARNING: Car {car_id} already exists in database, skipping creation")
+                return False
+                
+            new_car = CarLog(
+                car_id=car_id,
+                date=current_time,
+                expected_part=expected_part,
+                actual_part="Pendiente",
+                original_image="",
+                result_image="",
+                outcome="Pendiente"
+            )
+            db.session.add(new_car)
+            db.session.commit()
+            print(f"Successfully added car {car_id} to database")
+        except Exception as e:
+            print(f"ERROR during database operations: {str(e)}")
+            db.session.rollback()
+            return False
+    
+    print("Notifying frontend about new car...")
+    socketio.emit('new_car', {
+        'car_id': car_id,
+        'date': current_time,
+        'expected_part': expected_part
+    })
+    return True
+
+def inspect_plc_car(car_id, expected_part, on_verdict=None):
+    """
+    Capture, detect and record the result for a PLC car.
+    Does not answer the PLC; the caller sends the verdict.
+    
+    Args:
+        car_id (str): Car body number
+        expected_part (str): Part the car should have
+        on_verdict (callable): on_verdict(is_good), called as soon as the
+            outcome is known, before the result is stored, sent to the UI or
+            drawn, so the PLC can be answered without waiting for them
+    
+    Returns:
+        bool: True if the car is GOOD, False for NOGOOD or errors
+    """
+    try:
+        print(f"\n=== Starting detection for car {car_id} ===")
+        # Get image based on configured source
+        print(f"Image source configured as: {config['image_source']}")
+        if config['image_source'] == 'camera':
+            print("Capturing image from camera...")
+            frame = capture_frame()
+        else:
+            print(f"Loading sample image: {config['image_source']}")
+            frame = load_sample_frame(config['image_source'])
+
+        if frame is None:
+            raise Exception("Failed to get image")
+
+        actual_part, detection_result, gray_percentage = process_detection(frame)
+        
+        # Determine outcome
+        outcome = "GOOD" if actual_part == expected_part else "NOGOOD"
+        print(f"\n=== Final Result ===")
+        print(f"Expected part: {expected_part}")
+        print(f"Actual part: {actual_part}")
+        print(f"Outcome: {outcome}")
+        if on_verdict is not None:
+            on_verdict(outcome == "GOOD")
+    except Exception as e:
+        print(f"ERROR during detection process: {str(e)}")
+        # Update database with error status
+        with app.app_context():
+            car = CarLog.query.filter_by(car_id=car_id).first()
+            if car:
+                car.actual_part = "Error en detección"
+                car.outcome = "Error"
+                db.session.commit()
+                print(f"Database updated with error status for car {car_id}")
+        # Notify frontend of error
+        socketio.emit('detection_error', {
+            'car_id': car_id,
+            'error': str(e)
+        })
+        # Errors are answered NOGOOD
+        return False
+
+    record_plc_result(car_id, expected_part, actual_part, outcome, frame, detection_result, gray_percentage)
+    return outcome == "GOOD"
+
+def report_storage_error(car_id, step, error):
+    """Log and notify the frontend of a failure after the verdict was already sent to the PLC."""
+    print(f"ERROR {step} for car {car_id} (verdict already sent): {str(error)}")
+    socketio.emit('storage_error', {
+        'car_id': car_id,
+        'step': step,
+        'error': str(error)
+    })
+
+def record_plc_result(car_id, expected_part, actual_part, outcome, frame, detection_result, gray_percentage):
+    """
+    Store a PLC car's result, send it to the UI and queue NOGOOD defects for ICS.
+    The PLC has already acted on the outcome, so failures here are reported
+    as storage errors and never turn the row into a detection error; each
+    step runs even if an earlier one failed.
+    """
+    # Update car in database with results; the annotated image is drawn later, when first requested
+    with app.app_context():
+        try:
+            car = CarLog.query.filter_by(car_id=car_id).first()
+            if car:
+                car.actual_part = actual_part
+                car.outcome = outcome
+                store_row_images(car, frame, detection_result)
+                car.gray_percentage = gray_percentage
+                db.session.commit()
+                print(f"Database updated with detection results for car {car_id}")
+            else:
+                print(f"WARNING: Car {car_id} not found in database")
+        except Exception as e:
+            db.session.rollback()
+            report_storage_error(car_id, "storing result", e)
+            # Keep at least the verdict the PLC acted on
+            try:
+                car = CarLog.query.filter_by(car_id=car_id).first()
+                if car:
+                    car.actual_part = actual_part
+                    car.outcome = outcome
+                    car.gray_percentage = gray_percentage
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"ERROR saving outcome for car {car_id}: {str(e)}")
+
+    # Notify frontend of completion
+    try:
+        socketio.emit('detection_complete', {
+            'car_id': car_id,
+            'actual_part': actual_part,
+            'outcome': outcome,
+            'gray_percentage': gray_percentage,
+            **image_transport_fields(frame, detection_result, car_id=car_id)
+        })
+    except Exception as e:
+        report_storage_error(car_id, "sending result to the UI", e)
+
+    if outcome == "NOGOOD" and 'capo' in actual_part.lower():
+        print(f"Queueing NOGOOD result for ICS for car {car_id}")
+        try:
+            # Content-addressed: the image stored with the car above, so this only hashes it
+            image_hash, _ = image_store.put(frame.jpeg)
+        except Exception as e:
+            print(f"ERROR storing ICS image for car {car_id}, queueing the defect without it: {str(e)}")
+            image_hash = None
+        try:
+            ics_outbox.enqueue(car_id, expected_part, actual_part, image_hash=image_hash)
+        except Exception as e:
+            report_storage_error(car_id, "queueing the ICS defect", e)
+
 def handle_plc_response(plc_socket):
-    """Handle responses from the PLC socket."""
+    """
+    Handle messages from the PLC socket.
+    In serial mode each car is inspected and answered before the next message
+    is read. In pipelined mode (config['plc_pipeline_enabled']) this loop only
+    reads, parses and enqueues messages; a PlcPipeline inspects cars on worker
+    threads and answers the PLC in arrival order.
+    """
     global is_connected, plc_connection
     print("\n=== Starting PLC response handler ===")
     print(f"Initial connection status: {is_connected}")
@@ -377,8 +1074,21 @@ def handle_plc_response(plc_socket):
     print("Socket timeout set to 2.0 seconds")
     
     message_count = 0
-    processed_cars = set()  # Keep track of processed car IDs
-    ics_timeout = 10  # Timeout for ICS operations in seconds
+    plc_decoder = FrameDecoder(PLC_RECORD_SIZE, validator=is_valid_plc_record, filler=b'\x00', name='PLC')
+    stream_decoders['PLC'] = plc_decoder
+    
+    pipeline = None
+    if config.get('plc_pipeline_enabled', False):
+        pipeline = PlcPipeline(
+            process_fn=lambda car, report: inspect_plc_car(car['car_id'], car['expected_part'], on_verdict=report),
+            respond_fn=lambda is_good: send_plc_response(plc_socket, is_good),
+            depth=config['plc_pipeline_depth'],
+            workers=config['plc_pipeline_workers'],
+            result_timeout=PLC_DETECTION_TIMEOUT,
+            backpressure=config['plc_pipeline_backpressure']
+        )
+        pipeline.start()
+        set_active_plc_pipeline(pipeline)
     
     while True:
         try:
@@ -400,301 +1110,75 @@ def handle_plc_response(plc_socket):
                     break
 
                 print(f"Raw data received from PLC: {data}")
-                message = data.decode('UTF-8')
-                print(f"Decoded PLC message: {message}")
-                message_count += 1
-                
-                if len(message) < 10:  # Minimum length: 3 (sequence) + 5 (body) + 2 (capot)
-                    print(f"WARNING: Invalid message format (too short): {message}")
-                    continue
+                # A chunk may hold several messages or only part of one
+                for record in plc_decoder.feed(data):
+                    message = record.decode('UTF-8')
+                    print(f"Decoded PLC message: {message}")
+                    message_count += 1
                 
-                # Extract components from message
-                try:
-                    print("\n=== Parsing message ===")
-                    sequence = message[:3]  # First 3 digits
-                    body = message[3:8]     # Next 5 characters (letter + 4 digits)
-                    capot = message[8:10]   # Last 2 digits (01, 05, or 08)
-                    
-                    print(f"Extracted sequence: {sequence}")
-                    print(f"Extracted body: {body}")
-                    print(f"Extracted capot type: {capot}")
-                    
-                    # Map capot type to expected part
-                    expected_part = {
-                        "01": "Capo tipo 1",
-                        "05": "Capo tipo 2",
-                        "08": "Capo tipo 3"
-                    }.get(capot)
-                    
-                    if not expected_part:
-                        print(f"ERROR: Unknown capot type: {capot}")
-                        continue
+                    try:
+                        parsed = parse_plc_message(message)
+                        if not parsed:
+                            continue
+                        sequence, body, capot, expected_part = parsed
+                        # Look the VIN up while the car is inspected, so a NOGOOD is reported without waiting on ICS
+                        vin_cache.prefetch(body)
 
-                    # Generate a unique car ID using timestamp and random component
-                    max_attempts = 10  # Maximum number of attempts to generate a unique ID
-                    attempt = 0
-                    car_id = None
-                    
-                    while attempt < max_attempts:
-                        random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-                        temp_car_id = f"{sequence}-{body}-{capot}-{random_suffix}"
-                        
-                        # Check if this ID already exists in both CarLog and QueuedCar
-                        with app.app_context():
-                            try:
-                                existing_car = db.session.query(CarLog).filter_by(car_id=temp_car_id).first()
-                                existing_queued = db.session.query(QueuedCar).filter_by(car_id=temp_car_id).first()
-                                
-                                if not existing_car and not existing_queued:
-                                    car_id = temp_car_id
-                                    break
-                            except Exception as e:
-                                print(f"Error checking for existing car ID: {e}")
-                                db.session.rollback()
-                        attempt += 1
-                    
-                    if not car_id:
-                        print(f"ERROR: Could not generate unique car ID after {max_attempts} attempts")
-                        continue
-                    
-                    current_time = time.strftime("%d-%m-%Y %H:%M:%S")
-                    print(f"\n=== Processing car ===")
-                    print(f"Generated car_id: {car_id}")
-                    print(f"Expected part: {expected_part}")
-                    print(f"Timestamp: {current_time}")
-
-                    # Create an event for synchronization
-                    detection_complete = threading.Event()
+                        car_id = generate_plc_car_id(sequence, body, capot)
+                        if not car_id:
+                            continue
                     
-                    # Start detection in a separate thread to not block the PLC handler
-                    def process_detection_thread():
-                        try:
-                            print(f"\n=== Starting detection for car {car_id} ===")
-                            # Get image based on configured source
-                            print(f"Image source configured as: {config['image_source']}")
-                            if config['image_source'] == 'camera':
-                                print("Capturing image from camera...")
-                                image_base64 = capture_image()
-                            else:
-                                print(f"Loading sample image: {config['image_source']}")
-                                image_base64 = load_sample_image(config['image_source'])
-
-                            if not image_base64:
-                                raise Exception("Failed to get image")
-
-                            print("Calculating gray percentage...")
-                            gray_percentage = calculate_gray_percentage(image_base64)
-                            print(f"Gray percentage calculated: {gray_percentage:.2f}%")
-                            
-                            # Initialize variables
-                            actual_part = None
-                            detected_objects = []
-                            result_image = image_base64
-                            
-                            # If gray detection is disabled or gray percentage is high enough, proceed with object detection
-                            if not config.get("gray_detection_enabled", True) or gray_percentage >= 89:
-                                print("Proceeding with detection...")
-                                # Load model and labels
-                                model, labels = get_model_and_labels()
-                                
-                                # Perform detection
-                                print("Running object detection...")
-                                result_image, detected_objects = tflite_detect_image(
-                                    model, 
-                                    image_base64, 
-                                    labels, 
-                                    min_conf=config['min_conf_threshold'],
-                                    early_exit=False
-                                )
-                                
-                                print(f"Detection complete. Found {len(detected_objects)} objects")
-                                
-                                # Count specific objects
-                                has_amorfo = any(obj['class'].lower() == 'amorfo' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-                                has_chico = any(obj['class'].lower() == 'chico' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-                                has_mediano = any(obj['class'].lower() == 'mediano' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-                                has_grande = any(obj['class'].lower() == 'grande' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-                                
-                                print("\n=== Detection Results ===")
-                                print(f"Detected objects: {[obj['class'] for obj in detected_objects]}")
-                                print(f"Scores: {[obj['score'] for obj in detected_objects]}")
-                                print(f"Amorfo detected: {has_amorfo}")
-                                print(f"Chico detected: {has_chico}")
-                                print(f"Mediano detected: {has_mediano}")
-                                print(f"Grande detected: {has_grande}")
-                                
-                                # Apply detection rules
-                                if has_amorfo:  # If any amorfo object is detected, it's tipo 2
-                                    actual_part = "Capo tipo 2"
-                                    print("Classified as: Capo tipo 2 (has amorfo)")
-                                elif has_chico and has_mediano and has_grande:
-                                    actual_part = "Capo tipo 3"
-                                    print("Classified as: Capo tipo 3 (has all three holes)")
-                                elif not has_chico and not has_mediano and not has_grande:
-                                    if gray_percentage >= 89:
-                                        actual_part = "Capo tipo 1"  # High gray, no holes = Capo tipo 1
-                                    else:
-                                        actual_part = "No hay capo"  # Low gray, no holes = No hay capo
-                                else:
-                                    actual_part = "Capo no identificado"
-                                    print("Classified as: Capo no identificado (ambiguous pattern)")
-                                    print("Detected objects:", [f"{obj['class']} (score: {obj['score']:.2f})" for obj in detected_objects])
-                            else:
-                                print("No capo detected - gray percentage below 89%")
-                                actual_part = "No hay capo"
-                            
-                            # Determine outcome
-                            outcome = "GOOD" if actual_part == expected_part else "NOGOOD"
-                            print(f"\n=== Final Result ===")
-                            print(f"Expected part: {expected_part}")
-                            print(f"Actual part: {actual_part}")
-                            print(f"Outcome: {outcome}")
-                            
-                            # Update car in database with results
-                            with app.app_context():
-                                car = CarLog.query.filter_by(car_id=car_id).first()
-                                if car:
-                                    car.actual_part = actual_part
-                                    car.outcome = outcome
-                                    car.original_image = image_base64
-                                    car.result_image = result_image
-                                    car.gray_percentage = gray_percentage
-                                    db.session.commit()
-                                    print(f"Database updated with detection results for car {car_id}")
-                                else:
-                                    print(f"WARNING: Car {car_id} not found in database")
-                            
-                            # Notify frontend of completion
-                            socketio.emit('detection_complete', {
-                                'car_id': car_id,
-                                'actual_part': actual_part,
-                                'outcome': outcome,
-                                'original_image': image_base64,
-                                'result_image': result_image,
-                                'gray_percentage': gray_percentage
-                            })
-                            
-                            # Send final response to PLC based on detection result
-                            print("Sending final response to PLC based on detection result...")
-                            if outcome == "NOGOOD" and 'capo' in actual_part.lower():
-                                print(f"Sending NOGOOD result to ICS for car {car_id}")
-                                
-                                # Send PLC response (NOGOOD)
-                                print("Sending PLC response (NOGOOD)")
-                                send_plc_response(plc_socket, False)
-                                
-                                # Send data to ICS in a separate thread
-                                def send_to_ics_thread():
-                                    try:
-                                        # Set a timeout for ICS operations
-                                        start_time = time.time()
-                                        ics_success = False
-                                        
-                                        while time.time() - start_time < ics_timeout:
-                                            try:
-                                                vin = ics.request_vin(car_id)
-                                                if vin:
-                                                    print(f"Retrieved VIN for car_id {car_id}: {vin}")
-                                                    result = ics.send_defect_data(
-                                                        vin=vin,
-                                                        image_base64=image_base64,
-                                                        expected_part=expected_part,
-                                                        actual_part=actual_part
-                                                    )
-                                                    if result:
-                                                        print(f"Successfully sent defect data to ICS for car_id: {car_id}")
-                                                        ics_success = True
-                                                        break
-                                            except Exception as ics_error:
-                                                print(f"ICS communication error: {str(ics_error)}")
-                                                time.sleep(0.5)  # Brief pause before retry
-                                        
-                                        if not ics_success:
-                                            print(f"Failed to send data to ICS for car {car_id} after {ics_timeout} seconds")
-                                    except Exception as e:
-                                        print(f"Error in ICS communication thread: {str(e)}")
-                                
-                                # Start ICS thread
-                                threading.Thread(target=send_to_ics_thread, daemon=True).start()
-                            else:
-                                # Send PLC response for non-NOGOOD cases
-                                print("Sending PLC response for non-NOGOOD case")
-                                send_plc_response(plc_socket, outcome == "GOOD")
-                            
-                            # Signal that detection is complete
-                            detection_complete.set()
-                                    
-                        except Exception as e:
-                            print(f"ERROR during detection process: {str(e)}")
-                            # Update database with error status
-                            with app.app_context():
-                                car = CarLog.query.filter_by(car_id=car_id).first()
-                                if car:
-                                    car.actual_part = "Error en detección"
-                                    car.outcome = "Error"
-                                    db.session.commit()
-                                    print(f"Database updated with error status for car {car_id}")
-                            # Notify frontend of error
-                            socketio.emit('detection_error', {
-                                'car_id': car_id,
-                                'error': str(e)
-                            })
-                            # Send error response to PLC
-                            send_plc_response(plc_socket, False)
+                        current_time = time.strftime("%d-%m-%Y %H:%M:%S")
+                        print(f"\n=== Processing car ===")
+                        print(f"Generated car_id: {car_id}")
+                        print(f"Expected part: {expected_part}")
+                        print(f"Timestamp: {current_time}")
+
+                        # Create new car entry in database
+                        if not register_plc_car(car_id, expected_part, current_time):
+                            continue
+
+                        if pipeline is not None:
+                            # Pipelined mode: enqueue and go straight back to reading the socket
+                            pipeline.submit({'car_id': car_id, 'expected_part': expected_part})
+                            continue
+
+                        # Serial mode: run detection in a separate thread and wait for it with a timeout
+                        car_result = {'is_good': False}
+                        detection_complete = threading.Event()
+
+                        # Pass state as arguments so a timed-out thread can't touch the next car's state
+                        def process_detection_thread(car_id, expected_part, car_result, detection_complete):
+                            def report_verdict(is_good):
+                                # Answer the PLC as soon as the verdict is known; storing and drawing continue here
+                                car_result['is_good'] = is_good
+                                detection_complete.set()
+                            is_good = inspect_plc_car(car_id, expected_part, on_verdict=report_verdict)
+                            if not detection_complete.is_set():
+                                car_result['is_good'] = is_good
                             # Signal that detection is complete (even if it failed)
                             detection_complete.set()
+
+                        detection_thread = threading.Thread(
+                            target=process_detection_thread,
+                            args=(car_id, expected_part, car_result, detection_complete),
+                            daemon=True
+                        )
+                        detection_thread.start()
+                        print("Detection thread started")
                     
-                    # Create new car entry in database
-                    with app.app_context():
-                        try:
-                            # Double check that the car doesn't exist before inserting
-                            existing_car = db.session.query(CarLog).filter_by(car_id=car_id).first()
-                            if existing_car:
-                                print(f"WARNING: Car {car_id} already exists in database, skipping creation")
-                                return
-                                
-                            new_car = CarLog(
-                                car_id=car_id,
-                                date=current_time,
-                                expected_part=expected_part,
-                                actual_part="Pendiente",
-                                original_image="",
-                                result_image="",
-                                outcome="Pendiente"
-                            )
-                            db.session.add(new_car)
-                            db.session.commit()
-                            processed_cars.add(car_id)  # Add to processed set
-                            print(f"Successfully added car {car_id} to database")
-                            
-                            print("Notifying frontend about new car...")
-                            socketio.emit('new_car', {
-                                'car_id': car_id,
-                                'date': current_time,
-                                'expected_part': expected_part
-                            })
-
-                            # Start the detection thread
-                            detection_thread = threading.Thread(target=process_detection_thread, daemon=True)
-                            detection_thread.start()
-                            print("Detection thread started")
-                            
-                            # Wait for detection to complete with timeout
-                            if detection_complete.wait(timeout=30):  # Wait up to 30 seconds
-                                print("Detection completed successfully")
-                            else:
-                                print("Detection timed out after 30 seconds")
-                                # Send timeout response to PLC
-                                send_plc_response(plc_socket, False)
-                            
-                        except Exception as e:
-                            print(f"ERROR during database operations: {str(e)}")
-                            db.session.rollback()
-                            continue
+                        if detection_complete.wait(timeout=PLC_DETECTION_TIMEOUT):
+                            print("Detection completed successfully")
+                            print(f"Sending PLC response ({'GOOD' if car_result['is_good'] else 'NOGOOD'})")
+                            send_plc_response(plc_socket, car_result['is_good'])
+                        else:
+                            print(f"Detection timed out after {PLC_DETECTION_TIMEOUT} seconds")
+                            # Send timeout response to PLC
+                            send_plc_response(plc_socket, False)
                             
-                except Exception as e:
-                    print(f"ERROR parsing message: {str(e)}")
-                    continue
+                    except Exception as e:
+                        print(f"ERROR parsing message: {str(e)}")
+                        continue
                     
             except socket.timeout:
                 # This is normal, just continue waiting
@@ -714,6 +1198,9 @@ def handle_plc_response(plc_socket):
             break
             
     print("PLC response handler exiting")
+    if pipeline is not None:
+        pipeline.stop()
+        set_active_plc_pipeline(None)
     try:
         plc_socket.close()
     except:
@@ -890,6 +1377,191 @@ def handle_disconnect():
 def get_status():
     return jsonify({'status': f'connected to {config["connection_type"]}'}), 200
 
+@app.route('/model-info', methods=['GET'])
+def get_model_info():
+    """Report model load time, memory footprint and interpreter pool stats"""
+    return jsonify(model_registry.stats()), 200
+
+inference_benchmark = BenchmarkJob()
+
+@app.route('/model-benchmark', methods=['GET', 'POST'])
+def handle_model_benchmark():
+    """
+    GET: status and results of the last inference benchmark (p50/p95 invoke time per setting).
+    POST: start one; optional JSON body with variants, thread_counts, xnnpack (list of bools) and runs.
+    """
+    if request.method == 'GET':
+        return jsonify(inference_benchmark.status()), 200
+
+    data = request.get_json(silent=True) or {}
+    options = {}
+    variants = data.get('variants')
+    if variants is not None:
+        if not isinstance(variants, list) or not variants or any(v not in MODEL_VARIANTS for v in variants):
+            return jsonify({"error": f"variants must be a list of: {', '.join(MODEL_VARIANTS)}"}), 400
+        options['variants'] = variants
+    thread_counts = data.get('thread_counts')
+    if thread_counts is not None:
+        if (not isinstance(thread_counts, list) or not thread_counts
+                or not all(isinstance(t, int) and t >= 1 for t in thread_counts)):
+            return jsonify({"error": "thread_counts must be a list of positive integers"}), 400
+        options['thread_counts'] = thread_counts
+    xnnpack = data.get('xnnpack')
+    if xnnpack is not None:
+        if not isinstance(xnnpack, list) or not xnnpack or not all(isinstance(x, bool) for x in xnnpack):
+            return jsonify({"error": "xnnpack must be a list of booleans"}), 400
+        options['xnnpack_options'] = tuple(xnnpack)
+    try:
+        options['runs'] = int(data.get('runs', BENCHMARK_DEFAULT_RUNS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "runs must be an integer"}), 400
+    if options['runs'] < 1:
+        return jsonify({"error": "runs must be at least 1"}), 400
+
+    if not inference_benchmark.start(model_registry, **options):
+        return jsonify({"error": "A benchmark is already running"}), 409
+    return jsonify({"message": "Benchmark started"}), 202
+
+# Re-runs the inspection over the stored car images (see reinference.py)
+reinference_job = ReinferenceJob()
+
+@app.route('/reinference', methods=['GET', 'POST'])
+def handle_reinference():
+    """
+    GET: progress and summary (agreement, confusion matrices) of the last re-inference run.
+    POST: start one with the current settings; the optional JSON body may override
+    model_variant, min_conf_threshold, decision_rules and gray_detection_enabled,
+    and set include_backups (default true), workers and limit.
+    """
+    if request.method == 'GET':
+        return jsonify(reinference_job.status()), 200
+
+    data = request.get_json(silent=True) or {}
+    try:
+        settings = station_settings(config, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    options = {}
+    for key in ('workers', 'limit'):
+        if data.get(key) is not None:
+            if not isinstance(data[key], int) or data[key] < 1:
+                return jsonify({"error": f"{key} must be a positive integer"}), 400
+            options[key] = data[key]
+    db_path = os.path.join(app.instance_path, 'car_logs.db')
+    db_paths = find_databases(db_path, include_backups=bool(data.get('include_backups', True)))
+    if not db_paths:
+        return jsonify({"error": "No car log database found"}), 404
+
+    if not reinference_job.start(settings, db_paths, result_db_path=db_path,
+                                 image_store_root=image_store.root, **options):
+        return jsonify({"error": "A re-inference run is already in progress"}), 409
+    return jsonify({"message": "Re-inference started", "databases": [os.path.basename(p) for p in db_paths]}), 202
+
+@app.route('/stream-stats', methods=['GET'])
+def get_stream_stats():
+    """Report PLC/GALC frame decoder counters (records, resyncs, partial frames)"""
+    return jsonify({name: decoder.stats() if decoder else None for name, decoder in stream_decoders.items()}), 200
+
+@app.route('/plc-pipeline-stats', methods=['GET'])
+def get_plc_pipeline_stats():
+    """Report PLC pipeline throughput, latency and backpressure stats"""
+    if active_plc_pipeline is None:
+        return jsonify({'enabled': config['plc_pipeline_enabled'], 'active': False}), 200
+    stats = active_plc_pipeline.stats()
+    stats.update({'enabled': config['plc_pipeline_enabled'], 'active': True})
+    return jsonify(stats), 200
+
+@app.route('/camera-stats', methods=['GET'])
+def get_camera_stats():
+    """Report camera capture service state and frame-age stats"""
+    return jsonify(capture_service.stats()), 200
+
+# Dummy inferences run at startup; at least one per pooled interpreter
+WARMUP_INFERENCES = 3
+WARMUP_SAMPLE_IMAGES = ("capo_tipo_1", "capo_tipo_2", "capo_tipo_3", "no_capo")
+# Seconds the warm-up waits for the first camera frame
+WARMUP_CAMERA_TIMEOUT = 10
+
+warmup = WarmupTracker()
+
+def warm_up_model():
+    preload_model()
+    stats = model_registry.stats()
+    if not stats['loaded']:
+        raise RuntimeError("TFLite model could not be loaded")
+    return {'load_time_ms': stats['load_time_ms'], 'pool_size': stats['pool']['size']}
+
+def warm_up_inference():
+    """
+    Run the whole inspection path on the bundled sample images, so every pooled
+    interpreter has done its first invoke (kernel setup, XNNPACK packing) and
+    the decode, gray, drawing and encoding code paths are hot.
+    """
+    runs = max(WARMUP_INFERENCES, model_registry.pool_size)
+    timings_ms = []
+    for i in range(runs):
+        frame = load_sample_frame(WARMUP_SAMPLE_IMAGES[i % len(WARMUP_SAMPLE_IMAGES)])
+        start_time = time.time()
+        gray_percentage = calculate_gray_percentage(
+            frame, roi=config['gray_roi'], reduction=config['gray_decode_reduction']
+        )
+        # The pool hands out interpreters in turn, so consecutive checkouts visit all of them
+        with model_registry.checkout(timeout=INTERPRETER_CHECKOUT_TIMEOUT) as (model, labels):
+            result = tflite_detect(
+                model, frame, labels, min_conf=config['min_conf_threshold'], roi=config['detection_roi']
+            )
+        decision_engine.classify(
+            result.detections['class_id'], result.detections['score'], labels,
+            config['min_conf_threshold'], gray_percentage
+        )
+        result.annotated.thumbnail()
+        result.annotated.jpeg
+        timings_ms.append((time.time() - start_time) * 1000)
+    return {'inferences': runs, 'first_ms': timings_ms[0], 'last_ms': timings_ms[-1]}
+
+def warm_up_camera():
+    if config['image_source'] != 'camera':
+        update_capture_service()
+        return f"skipped (image source: {config['image_source']})"
+    update_capture_service()
+    if capture_service.is_running:
+        frame = capture_service.latest_frame(max_age=None, timeout=WARMUP_CAMERA_TIMEOUT)
+        if frame is None:
+            raise RuntimeError(f"No camera frame after {WARMUP_CAMERA_TIMEOUT} seconds")
+    else:
+        frame = capture_single_frame()
+    return {'shape': list(frame.shape)}
+
+def warm_up_database():
+    with app.app_context():
+        db.session.execute(select(1))
+        CarLog.query.order_by(CarLog.id.desc()).first()
+        db.session.remove()
+    prime_inspection_stats()
+
+def start_warmup():
+    """Warm the detection stack up in the background; /ready reports when it is done."""
+    warmup.start([
+        ('model', warm_up_model, True),
+        ('inference', warm_up_inference, True),
+        ('camera', warm_up_camera, config['image_source'] == 'camera'),
+        ('database', warm_up_database, True),
+    ])
+
+@app.route('/startup-profile', methods=['GET'])
+def get_startup_profile():
+    """Report how long each import group and startup phase took, plus the warm-up steps"""
+    report = startup_profile.report()
+    report['warmup'] = warmup.status()
+    report['interpreter_backend'] = model_registry.stats()['interpreter_backend']
+    return jsonify(report), 200
+
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    """200 once the station is warmed up and can inspect cars at full speed, 503 until then"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 @app.route('/')
 def serve_frontend():
     return send_from_directory(app.static_folder, 'index.html')
@@ -899,59 +1571,51 @@ def handle_retry_connection():
     retry_connection()
     return jsonify({'message': 'Retrying connection...'}), 200
 
-def process_detection(image_base64, expected_part):
+def process_detection(image):
     """
-    Process image detection with consistent rules.
-    Returns tuple of (actual_part, result_image, detected_objects, gray_percentage)
+    Run the gray check, the detector and the classification rules on an image.
+    This is the single inspection path used by the PLC, /capture-image and
+    any other caller, so the rules can't drift between them.
+    
+    Args:
+        image: Frame (or anything Frame.coerce accepts)
+        
+    Returns:
+        tuple: (actual_part, detection_result, gray_percentage); the
+        DetectionResult draws its annotated frame only when asked for it
     """
-    # Calculate gray percentage only if enabled
-    gray_percentage = 0
-    if config.get("gray_detection_enabled", True):
-        gray_percentage = calculate_gray_percentage(image_base64)
-        print(f"Gray percentage: {gray_percentage:.2f}%")
+    frame = Frame.coerce(image)
+    engine = decision_engine
+    gray_check_enabled = config.get("gray_detection_enabled", True)
     
-    # Initialize variables
-    actual_part = None
-    detected_objects = []
-    result_image = image_base64  # Default to original image
+    print("Calculating gray percentage...")
+    gray_percentage = calculate_gray_percentage(
+        frame, roi=config['gray_roi'], reduction=config['gray_decode_reduction']
+    )
+    print(f"Gray percentage calculated: {gray_percentage:.2f}%")
     
-    # If gray detection is disabled or gray percentage is high enough, proceed with object detection
-    if not config.get("gray_detection_enabled", True) or gray_percentage >= 89:
-        # Load model and labels
-        model, labels = get_model_and_labels()
-        
-        # Perform detection
-        result_image, detected_objects = tflite_detect_image(
-            model, 
-            image_base64, 
-            labels, 
-            min_conf=config['min_conf_threshold'],
-            early_exit=False
+    if not engine.needs_detection(gray_percentage, gray_check_enabled):
+        print(f"No capo detected - gray percentage below {engine.gray_threshold:g}%")
+        return engine.below_gray_part, DetectionResult.empty(frame), gray_percentage
+    
+    print("Running object detection...")
+    # Check out an interpreter from the pool and perform detection
+    with model_registry.checkout(timeout=INTERPRETER_CHECKOUT_TIMEOUT) as (model, labels):
+        result = tflite_detect(
+            model, frame, labels, min_conf=config['min_conf_threshold'], roi=config['detection_roi']
         )
-        
-        # Count specific objects
-        has_amorfo = any(obj['class'].lower() == 'amorfo' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-        has_chico = any(obj['class'].lower() == 'chico' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-        has_mediano = any(obj['class'].lower() == 'mediano' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-        has_grande = any(obj['class'].lower() == 'grande' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-        
-        # Apply detection rules
-        if has_amorfo:  # If any amorfo object is detected, it's tipo 2
-            actual_part = "Capo tipo 2"
-        elif has_chico and has_mediano and has_grande:
-            actual_part = "Capo tipo 3"
-        elif not has_chico and not has_mediano and not has_grande:
-            if gray_percentage >= 89:
-                actual_part = "Capo tipo 1"  # High gray, no holes = Capo tipo 1
-            else:
-                actual_part = "No hay capo"  # Low gray, no holes = No hay capo
-        else:
-            actual_part = "Capo no identificado"
-    else:
-        print("No capo detected - gray percentage below 89%")
-        actual_part = "No hay capo"
+    print(f"Detection complete. Found {len(result.detections)} objects")
     
-    return actual_part, result_image, detected_objects, gray_percentage
+    # Classify straight from the detection arrays
+    actual_part = engine.classify(
+        result.detections['class_id'], result.detections['score'], labels,
+        config['min_conf_threshold'], gray_percentage, gray_check_enabled
+    )
+    print("Detected objects:", [f"{name} (score: {score:.2f})"
+                                for name, score in zip(result.names, result.detections['score'].tolist())])
+    print(f"Classified as: {actual_part}")
+    
+    return actual_part, result, gray_percentage
 
 @app.route("/capture-image", methods=['GET', 'POST'])
 def capture_and_detect():
@@ -972,60 +1636,24 @@ def capture_and_detect():
         # Get image based on configured source
         if config['image_source'] == 'camera':
             print("Using camera to capture image")
-            base64_image = capture_image()
+            frame = capture_frame()
         else:
             print(f"Using sample image: {config['image_source']}")
-            base64_image = load_sample_image(config['image_source'])
-        
-        # Calculate gray percentage
-        gray_percentage = calculate_gray_percentage(base64_image)
-        print(f"Gray percentage: {gray_percentage:.2f}%")
+            frame = load_sample_frame(config['image_source'])
         
-        # Initialize variables
-        actual_part = None
-        detected_objects = []
-        result_image = base64_image
-        
-        # If gray detection is disabled or gray percentage is high enough, proceed with object detection
-        if not config.get("gray_detection_enabled", True) or gray_percentage >= 89:
-            print("Proceeding with detection...")
-            # Load model and labels
-            model, labels = get_model_and_labels()
-            
-            # Perform detection
-            result_image, detected_objects = tflite_detect_image(
-                model, 
-                base64_image, 
-                labels, 
-                min_conf=config['min_conf_threshold'],
-                early_exit=False
-            )
-            
-            # Count specific objects
-            has_amorfo = any(obj['class'].lower() == 'amorfo' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-            has_chico = any(obj['class'].lower() == 'chico' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-            has_mediano = any(obj['class'].lower() == 'mediano' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-            has_grande = any(obj['class'].lower() == 'grande' and obj['score'] > config['min_conf_threshold'] for obj in detected_objects)
-            
-            # Apply detection rules
-            if has_amorfo:  # If any amorfo object is detected, it's tipo 2
-                actual_part = "Capo tipo 2"
-            elif has_chico and has_mediano and has_grande:
-                actual_part = "Capo tipo 3"
-            elif not has_chico and not has_mediano and not has_grande:
-                if gray_percentage >= 89:
-                    actual_part = "Capo tipo 1"  # High gray, no holes = Capo tipo 1
-                else:
-                    actual_part = "No hay capo"  # Low gray, no holes = No hay capo
-            else:
-                actual_part = "Capo no identificado"
-        else:
-            print("No capo detected - gray percentage below 89%")
-            actual_part = "No hay capo"
+        actual_part, detection_result, gray_percentage = process_detection(frame)
+        detected_objects = detection_result.objects
         
         # Determine outcome
         outcome = "GOOD" if expected_part == actual_part else "NOGOOD"
         
+        # Image fields for the response and the event; encoded once, at the transport edge.
+        # With a car_id the result image can be referenced and drawn on first request.
+        transport_fields = image_transport_fields(frame, detection_result, car_id=car_id or None)
+        image_fields = dict(transport_fields)
+        if 'original_image' in image_fields:
+            image_fields['image'] = image_fields.pop('original_image')  # /capture-image has always called it 'image'
+        
         # Log the detection in the database if car_id is provided
         if car_id:
             try:
@@ -1037,8 +1665,7 @@ def capture_and_detect():
                     existing_car.date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     existing_car.expected_part = expected_part
                     existing_car.actual_part = actual_part
-                    existing_car.original_image = base64_image
-                    existing_car.result_image = result_image
+                    store_row_images(existing_car, frame, detection_result)
                     existing_car.outcome = outcome
                     existing_car.gray_percentage = gray_percentage
                     db.session.commit()
@@ -1049,12 +1676,13 @@ def capture_and_detect():
                         'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         'expected_part': expected_part,
                         'actual_part': actual_part,
-                        'original_image': base64_image,
-                        'result_image': result_image,
+                        'original_image': "",
+                        'result_image': "",
                         'outcome': outcome,
                         'gray_percentage': gray_percentage
                     }
                     new_log = CarLog(**log_data)
+                    store_row_images(new_log, frame, detection_result)
                     db.session.add(new_log)
                     db.session.commit()
                     
@@ -1063,21 +1691,19 @@ def capture_and_detect():
                     'car_id': car_id,
                     'actual_part': actual_part,
                     'outcome': outcome,
-                    'original_image': base64_image,
-                    'result_image': result_image,
-                    'gray_percentage': gray_percentage
+                    'gray_percentage': gray_percentage,
+                    **transport_fields
                 })
             except Exception as e:
                 db.session.rollback()
                 print(f"Error saving to database: {e}")
                 return jsonify({
                     'error': f"Error saving to database: {str(e)}",
-                    'image': base64_image,
                     'objects': detected_objects,
-                    'result_image': result_image,
                     'gray_percentage': gray_percentage,
                     'actual_part': actual_part,
-                    'outcome': outcome
+                    'outcome': outcome,
+                    **image_fields
                 }), 500
         
         # Calculate processing time
@@ -1085,14 +1711,13 @@ def capture_and_detect():
         
         # Return the final results
         return jsonify({
-            'image': base64_image,
             'objects': detected_objects,
-            'result_image': result_image,
             'gray_percentage': gray_percentage,
             'processing_time': processing_time,
             'actual_part': actual_part,
             'outcome': outcome,
-            'skip_database_update': False
+            'skip_database_update': False,
+            **image_fields
         })
     
     except Exception as e:
@@ -1100,6 +1725,93 @@ def capture_and_detect():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    """Stream a stored JPEG by its hash (cacheable forever, since the content never changes)."""
+    if not image_store.is_valid_hash(image_hash):
+        return jsonify({'error': 'Invalid image hash'}), 400
+    path = image_store.path_for(image_hash)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(path, mimetype='image/jpeg', conditional=True, etag=image_hash,
+                         max_age=IMAGE_CACHE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMAGE_CACHE_MAX_AGE}, immutable'
+    return response
+
+@app.route('/car-image/<car_id>/<kind>', methods=['GET'])
+def get_car_image(car_id, kind):
+    """Serve a car's original or result image, wherever it is stored."""
+    if kind not in ('original', 'result'):
+        return jsonify({'error': "Image kind must be 'original' or 'result'"}), 400
+    prefix = f'{kind}_image'
+    car_log = CarLog.query.filter_by(car_id=car_id).first()
+    if not car_log:
+        return jsonify({'error': f"Car with ID {car_id} not found"}), 404
+    image_hash = getattr(car_log, f'{prefix}_hash')
+    if not image_hash and kind == 'result':
+        image_hash = ensure_result_image(car_log)
+    if image_hash:
+        return get_image(image_hash)
+    legacy_image = getattr(car_log, prefix)
+    if not legacy_image:
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(io.BytesIO(Frame.from_base64(legacy_image).jpeg), mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/image-store-stats', methods=['GET'])
+def get_image_store_stats():
+    """Number and total size of the images in the image store."""
+    return jsonify(image_store.stats())
+
+# Default time range of /stats for each granularity
+STATS_DEFAULT_RANGE = {
+    'hour': timedelta(hours=48),
+    'shift': timedelta(days=7),
+    'day': timedelta(days=30),
+}
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Inspection statistics from the aggregate tables.
+    
+    Query parameters:
+        granularity: 'hour', 'shift' or 'day' (default 'day')
+        date_from, date_to: Date range; defaults to the last 48 hours / 7 days / 30 days
+        range: 'all' to ignore the default range
+    
+    Returns:
+        Per-bucket GOOD/NOGOOD/error counts, totals, the expected x actual
+        confusion matrix and the gray_percentage histogram
+    """
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+        try:
+            date_from = parse_log_datetime(request.args['date_from']) if request.args.get('date_from') else None
+            date_to = parse_log_datetime(request.args['date_to'], end_of_day=True) if request.args.get('date_to') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if date_from is None and date_to is None and request.args.get('range') != 'all':
+            date_from = datetime.now() - STATS_DEFAULT_RANGE[granularity]
+        with db.engine.connect() as connection:
+            return jsonify(stats_aggregator.query(connection, granularity, date_from, date_to))
+    except Exception as e:
+        print(f"Error getting stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/stats/rebuild', methods=['POST'])
+def rebuild_stats():
+    """Recompute the statistics from the full car log (e.g. after restoring a backup)."""
+    try:
+        counted = rebuild_inspection_stats()
+        return jsonify({'message': 'Statistics rebuilt successfully', 'cars': counted})
+    except Exception as e:
+        print(f"Error rebuilding stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/check-car/<car_id>', methods=['GET'])
 def check_car(car_id):
     try:
@@ -1138,9 +1850,12 @@ def update_item():
         if not car_log:
             return jsonify({'error': f"Car with ID {data['car_id']} not found"}), 404
         
-        # Update fields
+        # Update fields; images go to the image store instead of the row
+        store_row_images(car_log, data.get('original_image'), data.get('result_image'))
         for key, value in data.items():
-            if hasattr(car_log, key) and key != 'id':
+            if key in ('original_image', 'result_image'):
+                continue
+            if hasattr(car_log, key) and key != 'id' and not key.endswith(('_hash', '_size')):
                 setattr(car_log, key, value)
                 print(f"Updated {key} to {value}")
         
@@ -1204,11 +1919,12 @@ def add_log():
             date=data['date'],
             expected_part=data['expected_part'],
             actual_part=data['actual_part'],
-            original_image=data['original_image'],
-            result_image=data['result_image'],
+            original_image="",
+            result_image="",
             outcome=data['outcome'],
             gray_percentage=data.get('gray_percentage')
         )
+        store_row_images(new_log, data['original_image'], data['result_image'])
         
         db.session.add(new_log)
         db.session.commit()
@@ -1219,13 +1935,108 @@ def add_log():
         return jsonify({'error': str(e)}), 500
 
 
+def parse_log_datetime(value, end_of_day=False):
+    """
+    Parse a date filter ('YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]' or ISO 8601).
+    A bare date used as an upper bound covers the whole day.
+    """
+    value = value.strip().replace('T', ' ').rstrip('Z')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(value[:19], fmt)
+        except ValueError:
+            continue
+        if fmt == '%Y-%m-%d' and end_of_day:
+            parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return parsed
+    raise ValueError(f"Invalid date: {value}")
+
 @app.route('/logs', methods=['GET'])
 def get_logs():
-    """Get all logs"""
+    """
+    Get a page of logs, newest first.
+    
+    Query parameters:
+        limit: Page size (default 100, max 1000)
+        cursor: next_cursor from the previous page (keyset pagination by id)
+        order: 'desc' (default) or 'asc'
+        fields: Comma-separated fields to return (default: everything except images)
+        include_images: 'true' to also return the base64 images
+        outcome, expected_part, car_id: Filters (outcome accepts a comma-separated list)
+        date_from, date_to: Date range filter on the inspection time
+        count: 'false' to skip computing the total
+    
+    Returns:
+        {items, total, next_cursor, limit}
+    """
     try:
-        logs = CarLog.query.all()
-        car_log_schema = CarLogSchema(many=True)
-        return jsonify(car_log_schema.dump(logs))
+        args = request.args
+        try:
+            limit = min(max(int(args.get('limit', LOGS_DEFAULT_LIMIT)), 1), LOGS_MAX_LIMIT)
+            cursor = int(args['cursor']) if args.get('cursor') else None
+            date_from = parse_log_datetime(args['date_from']) if args.get('date_from') else None
+            date_to = parse_log_datetime(args['date_to'], end_of_day=True) if args.get('date_to') else None
+        except ValueError as e:
+            return jsonify({'error': f"Invalid query parameter: {str(e)}"}), 400
+        order = args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': "order must be 'asc' or 'desc'"}), 400
+        include_images = args.get('include_images', 'false').lower() in ('1', 'true', 'yes')
+        
+        # Projection
+        if args.get('fields'):
+            fields_requested = [field.strip() for field in args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields_requested if field not in CarLogSchema._declared_fields]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        else:
+            fields_requested = list(LOG_LIST_FIELDS)
+        if include_images:
+            fields_requested += [field for field in LOG_IMAGE_FIELDS if field not in fields_requested]
+        if 'id' not in fields_requested:
+            fields_requested.append('id')  # Needed for the cursor
+        
+        # Filters
+        query = CarLog.query
+        if args.get('outcome'):
+            query = query.filter(CarLog.outcome.in_(args['outcome'].split(',')))
+        if args.get('expected_part'):
+            query = query.filter(CarLog.expected_part == args['expected_part'])
+        if args.get('car_id'):
+            query = query.filter(CarLog.car_id == args['car_id'])
+        if date_from:
+            query = query.filter(CarLog.created_at >= date_from)
+        if date_to:
+            query = query.filter(CarLog.created_at <= date_to)
+        
+        total = None
+        if args.get('count', 'true').lower() not in ('0', 'false', 'no'):
+            total = query.order_by(None).count()
+        
+        # Only read the base64 text columns when images were asked for
+        if not any(field in LOG_IMAGE_FIELDS for field in fields_requested):
+            query = query.options(load_only(*LOG_LIST_COLUMNS))
+        
+        # Keyset pagination: continue after the last id of the previous page
+        if order == 'desc':
+            if cursor is not None:
+                query = query.filter(CarLog.id < cursor)
+            query = query.order_by(CarLog.id.desc())
+        else:
+            if cursor is not None:
+                query = query.filter(CarLog.id > cursor)
+            query = query.order_by(CarLog.id.asc())
+        
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        return jsonify({
+            'items': CarLogSchema(many=True, only=fields_requested).dump(rows),
+            'total': total,
+            'next_cursor': rows[-1].id if has_more else None,
+            'limit': limit
+        })
     except Exception as e:
         print(f"Error getting logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1266,7 +2077,115 @@ def handle_config():
                 return jsonify({"error": f"image_source must be one of: {', '.join(valid_sources)}"}), 400
         if 'gray_detection_enabled' in data:
             config['gray_detection_enabled'] = bool(data['gray_detection_enabled'])
+        if 'camera_capture_service' in data:
+            config['camera_capture_service'] = bool(data['camera_capture_service'])
+        if 'image_source' in data or 'camera_capture_service' in data:
+            update_capture_service()
+        if 'plc_pipeline_enabled' in data:
+            config['plc_pipeline_enabled'] = bool(data['plc_pipeline_enabled'])
+        for key in ('plc_pipeline_depth', 'plc_pipeline_workers'):
+            if key in data:
+                try:
+                    value = int(data[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} must be an integer"}), 400
+                if value < 1:
+                    return jsonify({"error": f"{key} must be at least 1"}), 400
+                config[key] = value
+        if 'plc_pipeline_backpressure' in data:
+            if data['plc_pipeline_backpressure'] not in ('block', 'reject'):
+                return jsonify({"error": "plc_pipeline_backpressure must be one of: block, reject"}), 400
+            config['plc_pipeline_backpressure'] = data['plc_pipeline_backpressure']
+        for key in ('interpreter_pool_size', 'interpreter_num_threads'):
+            if key in data:
+                try:
+                    value = int(data[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} must be an integer"}), 400
+                if value < 1:
+                    return jsonify({"error": f"{key} must be at least 1"}), 400
+                config[key] = value
+        if 'xnnpack_enabled' in data:
+            config['xnnpack_enabled'] = bool(data['xnnpack_enabled'])
+        if 'model_variant' in data:
+            if data['model_variant'] not in MODEL_VARIANTS:
+                return jsonify({"error": f"model_variant must be one of: {', '.join(MODEL_VARIANTS)}"}), 400
+            config['model_variant'] = data['model_variant']
+        if 'model_output_order' in data:
+            try:
+                config['model_output_order'] = (validate_output_order(data['model_output_order'])
+                                                if data['model_output_order'] is not None else None)
+            except ValueError as e:
+                return jsonify({"error": f"Invalid model_output_order: {str(e)}"}), 400
+        if 'decision_rules' in data:
+            global decision_engine
+            try:
+                decision_engine = DecisionEngine(data['decision_rules'])
+            except (ValueError, AttributeError) as e:
+                return jsonify({"error": f"Invalid decision_rules: {str(e)}"}), 400
+            config['decision_rules'] = data['decision_rules']
+        if 'image_transport' in data:
+            if data['image_transport'] not in ('inline', 'reference'):
+                return jsonify({"error": "image_transport must be one of: inline, reference"}), 400
+            config['image_transport'] = data['image_transport']
+        for key in ('gray_roi', 'detection_roi'):
+            if key in data:
+                try:
+                    config[key] = list(normalize_roi(data[key]))
+                except ValueError as e:
+                    return jsonify({"error": f"Invalid {key}: {str(e)}"}), 400
+        if 'gray_decode_reduction' in data:
+            if data['gray_decode_reduction'] not in (1, 2, 4, 8):
+                return jsonify({"error": "gray_decode_reduction must be one of: 1, 2, 4, 8"}), 400
+            config['gray_decode_reduction'] = data['gray_decode_reduction']
+        for key in ('ics_connect_timeout', 'ics_read_timeout'):
+            if key in data:
+                try:
+                    value = float(data[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} must be a number"}), 400
+                if value <= 0:
+                    return jsonify({"error": f"{key} must be greater than 0"}), 400
+                config[key] = value
+        if 'ics_connect_timeout' in data or 'ics_read_timeout' in data:
+            ics.configure(connect_timeout=config['ics_connect_timeout'], read_timeout=config['ics_read_timeout'])
+        if 'ics_base_url' in data:
+            base_url = data['ics_base_url'] or None
+            if base_url is not None and (not isinstance(base_url, str)
+                                         or not base_url.startswith(('http://', 'https://'))):
+                return jsonify({"error": "ics_base_url must be an http:// or https:// URL, or null"}), 400
+            config['ics_base_url'] = base_url
+            ics.set_base_url(base_url)
+        if 'stats_shift_start_hours' in data:
+            hours = data['stats_shift_start_hours']
+            if (not isinstance(hours, list) or not hours
+                    or not all(isinstance(h, int) and 0 <= h <= 23 for h in hours)
+                    or len(set(hours)) != len(hours)):
+                return jsonify({"error": "stats_shift_start_hours must be a list of distinct hours between 0 and 23"}), 400
+            if sorted(hours) != sorted(config['stats_shift_start_hours']):
+                config['stats_shift_start_hours'] = sorted(hours)
+                # Shift buckets depend on the shift hours, so recompute them
+                stats_aggregator.shift_start_hours = tuple(config['stats_shift_start_hours'])
+                rebuild_inspection_stats()
+        if any(key in data for key in INTERPRETER_CONFIG_KEYS):
+            try:
+                model_registry.configure(
+                    pool_size=config['interpreter_pool_size'],
+                    num_threads=config['interpreter_num_threads'],
+                    xnnpack_enabled=config['xnnpack_enabled'],
+                    model_variant=config['model_variant'],
+                    output_order=config['model_output_order'] or {}
+                )
+            except Exception as e:
+                # The registry kept the previous pool; keep the config in line with it
+                config['interpreter_pool_size'] = model_registry.pool_size
+                config['interpreter_num_threads'] = model_registry.num_threads
+                config['xnnpack_enabled'] = model_registry.xnnpack_enabled
+                config['model_variant'] = model_registry.model_variant
+                config['model_output_order'] = model_registry.output_order
+                return jsonify({"error": f"Failed to rebuild interpreter pool: {str(e)}"}), 500
         
+        save_config()
         return jsonify({"message": "Configuration updated successfully"}), 200
 
 # Add new endpoint to get queued cars
@@ -1307,73 +2226,85 @@ def process_queued_car(car_id):
 
 @app.route('/send-to-ics', methods=['POST'])
 def send_to_ics():
+    """Queue a defect for ICS; the outbox worker delivers it (202 right away, no waiting on ICS)."""
     try:
         data = request.get_json()
         car_id = data['car_id']
         expected_part = data['expected_part']
         actual_part = data['actual_part']
         # Don't log the image_base64 content
-        print(f"Sending to ICS - car_id: {car_id}, expected_part: {expected_part}, actual_part: {actual_part}")
-        image_base64 = data['image']
-
-        # Get VIN and send to ICS
-        vin = ics.request_vin(car_id)
-        if vin:
-            print(f"Retrieved VIN for car_id {car_id}: {vin}")
-            result = ics.send_defect_data(
-                vin=vin,
-                image_base64=image_base64,
-                expected_part=expected_part,
-                actual_part=actual_part
-            )
-            if result:
-                print(f"Successfully sent defect data to ICS for car_id: {car_id}")
-            else:
-                print(f"Failed to send defect data to ICS for car_id: {car_id}")
-            return jsonify({'message': 'Sent to ICS successfully'}), 200
-        print(f"Could not get VIN for car_id: {car_id}")
-        return jsonify({'error': 'Could not get VIN'}), 400
+        print(f"Queueing for ICS - car_id: {car_id}, expected_part: {expected_part}, actual_part: {actual_part}")
+        image_base64 = data.get('image')
+        if image_base64 is not None and not isinstance(image_base64, str):
+            return jsonify({'error': 'image must be a base64 JPEG string'}), 400
+        # The car's stored image is what was inspected; the frontend often only has its URL
+        image_hash = None
+        car_log = CarLog.query.filter_by(car_id=car_id).first()
+        if car_log and car_log.original_image_hash:
+            image_hash = car_log.original_image_hash
+        elif car_log and car_log.has_legacy_original_image:
+            image_hash, _ = image_store.put_base64(load_row_image(car_log, 'original_image'))
+        elif image_base64:
+            # No stored image: use the one sent by the client
+            try:
+                image_hash, _ = image_store.put_base64(image_base64, strict=True)
+            except ValueError as e:
+                return jsonify({'error': f'image must be a base64 JPEG string: {str(e)}'}), 400
+
+        entry = ics_outbox.enqueue(car_id, expected_part, actual_part, image_hash=image_hash)
+        message = 'Queued for ICS' if entry['queued'] else 'Already sent to ICS'
+        return jsonify({'message': message, 'entry': entry}), 202
+    except KeyError as e:
+        return jsonify({'error': f"Missing field: {str(e)}"}), 400
     except Exception as e:
         print(f"Error in send_to_ics: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def calculate_gray_percentage(base64_image):
+@app.route('/ics-stats', methods=['GET'])
+def get_ics_stats():
+    """ICS client latency (p50/p95), errors and timeouts per endpoint, plus the VIN cache hit rate."""
+    stats = ics.stats()
+    stats['vin_cache'] = vin_cache.stats()
+    return jsonify(stats), 200
+
+@app.route('/ics-outbox', methods=['GET'])
+def get_ics_outbox():
+    """ICS outbox counts (pending, delivered, failed), delivery lag and the most recent entries."""
+    try:
+        recent = min(max(int(request.args.get('recent', 20)), 0), 200)
+    except ValueError:
+        return jsonify({'error': 'recent must be an integer'}), 400
+    return jsonify(ics_outbox.status(recent=recent)), 200
+
+@app.route('/ics-outbox/<car_id>/retry', methods=['POST'])
+def retry_ics_outbox_entry(car_id):
+    """Attempt a pending or failed defect again right away."""
+    if not ics_outbox.retry(car_id):
+        return jsonify({'error': 'No undelivered ICS defect for this car'}), 404
+    return jsonify({'message': 'Retry queued', 'entry': ics_outbox.entry(car_id)}), 202
+
+def calculate_gray_percentage(image, roi=None, reduction=1):
     """
     Calculate the percentage of the image that is gray/white (for detecting presence of a capot).
     
     Args:
-        base64_image (str): Base64 encoded image string
+        image (Frame | str): Frame to analyze (a base64 string is also accepted)
+        roi (list): Fractional [xmin, ymin, xmax, ymax] region to analyze (None for the whole image)
+        reduction (int): 2, 4 or 8 to analyze a reduced-resolution image (1 for full resolution)
         
     Returns:
         float: Percentage of pixels that are gray/white
     """
     try:
-        # Decode base64 image
-        if isinstance(base64_image, str) and ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
-        
-        img_data = base64.b64decode(base64_image)
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        
-        if img is None:
+        # Grayscale pixels of the region only; not yet decoded frames are decoded straight to reduced grayscale
+        try:
+            gray = Frame.coerce(image).gray(roi=roi, reduction=reduction)
+        except ValueError:
             print("Failed to decode image in calculate_gray_percentage")
             return 0.0
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply a threshold to identify gray/white pixels
-        # Threshold value is chosen to isolate the light gray capot from darker background
-        threshold_value = 100  # Adjust if needed for your specific application
-        _, thresh = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY)
-        
-        # Calculate percentage of white pixels
-        white_pixel_count = cv2.countNonZero(thresh)
-        total_pixels = thresh.shape[0] * thresh.shape[1]
-        percentage = (white_pixel_count / total_pixels) * 100
-        
-        return percentage
+        # Percentage of pixels light enough to be the gray capot
+        return bright_pixel_percentage(gray)
     except Exception as e:
         print(f"Error calculating gray percentage: {str(e)}")
         return 0.0
@@ -1405,7 +2336,7 @@ def reset_database():
         return jsonify({'error': str(e)}), 500
 
 # Add this function to load sample images
-def load_sample_image(image_type):
+def load_sample_frame(image_type):
     """
     Load a sample image based on the specified type.
     
@@ -1413,7 +2344,7 @@ def load_sample_image(image_type):
         image_type (str): Type of image to load ('no_capo', 'capo_tipo_1', 'capo_tipo_2', 'capo_tipo_3')
         
     Returns:
-        str: Base64 encoded image string
+        Frame: The sample image (the file's JPEG bytes are kept, so it is never re-encoded)
     """
     # Map image types to file paths
     image_paths = {
@@ -1432,8 +2363,7 @@ def load_sample_image(image_type):
         # Add text to indicate error
         font = cv2.FONT_HERSHEY_SIMPLEX
         cv2.putText(blank_img, f"Invalid image type: {image_type}", (50, 240), font, 1, (0, 0, 255), 2)
-        _, buffer = cv2.imencode('.jpg', blank_img)
-        return base64.b64encode(buffer).decode('utf-8')
+        return Frame.from_array(blank_img)
     
     image_path = image_paths[image_type]
     
@@ -1452,14 +2382,13 @@ def load_sample_image(image_type):
         cv2.putText(placeholder_img, f"Sample image not found: {image_type}", (50, 240), font, 1, (0, 0, 255), 2)
         cv2.putText(placeholder_img, f"Create file: {full_path}", (50, 280), font, 0.7, (0, 0, 255), 2)
         
-        _, buffer = cv2.imencode('.jpg', placeholder_img)
-        return base64.b64encode(buffer).decode('utf-8')
+        return Frame.from_array(placeholder_img)
     
-    # Read and encode the image
+    # Read the image; it is decoded once, when the pipeline first needs the pixels
     try:
         with open(full_path, 'rb') as f:
             image_data = f.read()
-        return base64.b64encode(image_data).decode('utf-8')
+        return Frame.from_jpeg(image_data)
     except Exception as e:
         print(f"Error loading sample image: {str(e)}")
         # Create an error image
@@ -1467,8 +2396,7 @@ def load_sample_image(image_type):
         error_img.fill(200)  # Light gray
         font = cv2.FONT_HERSHEY_SIMPLEX
         cv2.putText(error_img, f"Error loading image: {str(e)}", (50, 240), font, 0.8, (0, 0, 255), 2)
-        _, buffer = cv2.imencode('.jpg', error_img)
-        return base64.b64encode(buffer).decode('utf-8')
+        return Frame.from_array(error_img)
 
 # Add feedback for false positive/negative
 @app.route('/add-feedback', methods=['POST'])
@@ -1492,6 +2420,9 @@ def add_feedback():
         car_log = CarLog.query.filter_by(car_id=data['car_id']).first()
         if not car_log:
             return jsonify({'error': 'Car not found in logs'}), 404
+        # The result image is rendered on first use; make sure the feedback row gets it
+        if not car_log.result_image:
+            ensure_result_image(car_log)
         
         # Create new feedback log
         new_feedback = FeedbackLog(
@@ -1500,8 +2431,13 @@ def add_feedback():
             actual_part=data['actual_part'],
             original_outcome=data['original_outcome'],
             real_outcome=data['real_outcome'],
+            # Feedback rows point at the same stored images instead of copying them
             original_image=car_log.original_image if car_log.original_image else None,
             result_image=car_log.result_image if car_log.result_image else None,
+            original_image_hash=car_log.original_image_hash,
+            original_image_size=car_log.original_image_size,
+            result_image_hash=car_log.result_image_hash,
+            result_image_size=car_log.result_image_size,
             feedback_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             feedback_note=data.get('feedback_note', '')
         )
@@ -1557,4 +2493,10 @@ def check_feedback(car_id):
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    init_database()
+    ics_outbox.start()
+    start_warmup()
+    startup_profile.mark('server starting')
+    print(f"Server starting {startup_profile.elapsed_ms():.2f}ms after startup began")
+    # No reloader: it would start a second process that imports and warms up everything again
+    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
@@ -1,16 +1,115 @@
 import sqlite3
 import os
 import sys
+import time
+import binascii
 
-def migrate_database():
+# Columns added after the original schema, per table (column name -> SQL type)
+CAR_LOG_COLUMNS = {
+    'gray_percentage': 'FLOAT',
+    'original_image_hash': 'VARCHAR(64)',
+    'original_image_size': 'INTEGER',
+    'result_image_hash': 'VARCHAR(64)',
+    'result_image_size': 'INTEGER',
+    'created_at': 'DATETIME',
+    'detections': 'TEXT',
+}
+FEEDBACK_LOG_COLUMNS = {
+    'original_image_hash': 'VARCHAR(64)',
+    'original_image_size': 'INTEGER',
+    'result_image_hash': 'VARCHAR(64)',
+    'result_image_size': 'INTEGER',
+}
+TABLE_COLUMNS = {
+    'car_log': CAR_LOG_COLUMNS,
+    'feedback_log': FEEDBACK_LOG_COLUMNS,
+}
+
+# Indexes used by the paginated /logs queries (index name -> (table, columns))
+TABLE_INDEXES = {
+    'idx_car_log_created_at': ('car_log', 'created_at'),
+    'idx_car_log_outcome': ('car_log', 'outcome'),
+    'idx_car_log_expected_part': ('car_log', 'expected_part'),
+}
+
+DEFAULT_DB_PATHS = [
+    './instance/car_logs.db',
+    './application/instance/car_logs.db'
+]
+
+def add_missing_columns(conn, table_name, columns):
+    """
+    Add any of the given columns that don't exist yet in a table.
+    
+    Returns:
+        list: Names of the columns that were added
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    existing = {column[1] for column in cursor.fetchall()}
+    added = []
+    for column_name, column_type in columns.items():
+        if column_name not in existing:
+            print(f"Adding {column_name} column to {table_name} table...")
+            # Add the column with a default value of NULL
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+            added.append(column_name)
+    conn.commit()
+    return added
+
+def add_missing_indexes(conn, tables):
+    """Create the indexes in TABLE_INDEXES for the tables that exist."""
+    for index_name, (table_name, columns) in TABLE_INDEXES.items():
+        if table_name in tables:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
+    conn.commit()
+
+def backfill_created_at(conn):
+    """
+    Fill car_log.created_at for rows written before the column existed.
+    The legacy date column holds either 'YYYY-MM-DD HH:MM:SS' or
+    'DD-MM-YYYY HH:MM:SS' depending on which code path created the row.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE car_log SET created_at = substr(date, 1, 19) "
+        "WHERE created_at IS NULL AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+    )
+    updated = cursor.rowcount
+    cursor.execute(
+        "UPDATE car_log SET created_at = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || "
+        "substr(date, 1, 2) || substr(date, 11, 9) "
+        "WHERE created_at IS NULL AND date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]*'"
+    )
+    updated += cursor.rowcount
+    conn.commit()
+    if updated:
+        print(f"Backfilled created_at for {updated} car_log rows")
+    return updated
+
+def ensure_schema(db_path):
+    """Bring an existing database up to the current schema (adds missing columns and indexes)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = {row[0] for row in cursor.fetchall()}
+        for table_name, columns in TABLE_COLUMNS.items():
+            if table_name in tables:
+                add_missing_columns(conn, table_name, columns)
+        add_missing_indexes(conn, tables)
+        if 'car_log' in tables:
+            backfill_created_at(conn)
+    finally:
+        conn.close()
+
+def migrate_database(db_paths=None):
     """
-    Add gray_percentage column to car_log table if it doesn't exist.
+    Add columns introduced after the original schema (gray_percentage, image
+    hashes and sizes) to the car_log and feedback_log tables if they don't exist.
     """
     # Use the database file we found
-    db_paths = [
-        './instance/car_logs.db',
-        './application/instance/car_logs.db'
-    ]
+    db_paths = db_paths or DEFAULT_DB_PATHS
     
     for db_path in db_paths:
         if os.path.exists(db_path):
@@ -39,20 +138,17 @@ def migrate_database():
                 
                 print(f"Found table: {table_name}")
                 
-                # Check if gray_percentage column exists
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = cursor.fetchall()
-                column_names = [column[1] for column in columns]
-                print(f"Columns in {table_name}: {column_names}")
+                added = add_missing_columns(conn, table_name, CAR_LOG_COLUMNS)
+                if 'feedback_log' in [table[0] for table in tables]:
+                    added += add_missing_columns(conn, 'feedback_log', FEEDBACK_LOG_COLUMNS)
+                if table_name == 'car_log':
+                    add_missing_indexes(conn, {table[0] for table in tables})
+                    backfill_created_at(conn)
                 
-                if 'gray_percentage' not in column_names:
-                    print(f"Adding gray_percentage column to {table_name} table...")
-                    # Add the column with a default value of NULL
-                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN gray_percentage FLOAT")
-                    conn.commit()
-                    print("Successfully added gray_percentage column.")
+                if added:
+                    print(f"Successfully added columns: {', '.join(added)}")
                 else:
-                    print("Column gray_percentage already exists. No migration needed.")
+                    print("All columns already exist. No migration needed.")
                 
                 conn.close()
                 print(f"Successfully migrated database: {db_path}")
@@ -61,9 +157,108 @@ def migrate_database():
     
     return True
 
+def migrate_images_to_store(db_path, store, chunk_size=50, vacuum=True):
+    """
+    Move base64 images out of the car_log and feedback_log text columns into
+    the content-addressed image store, keeping only hash and size in each row.
+    Rows are converted in chunks so memory stays flat on large databases.
+    
+    Args:
+        db_path (str): Path to the SQLite database
+        store (ImageStore): Destination image store
+        chunk_size (int): Rows converted per transaction
+        vacuum (bool): Run VACUUM afterwards to give the space back
+        
+    Returns:
+        dict: Number of images moved and bytes freed per table
+    """
+    print(f"\n=== Moving images to {store.root} for {db_path} ===")
+    size_before = os.path.getsize(db_path)
+    ensure_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    summary = {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = {row[0] for row in cursor.fetchall()}
+        
+        for table_name in TABLE_COLUMNS:
+            if table_name not in tables:
+                continue
+            moved = 0
+            failed = 0
+            last_id = 0
+            start_time = time.time()
+            while True:
+                cursor.execute(
+                    f"SELECT id, original_image, result_image FROM {table_name} "
+                    f"WHERE id > ? AND ((original_image IS NOT NULL AND original_image != '') "
+                    f"OR (result_image IS NOT NULL AND result_image != '')) "
+                    f"ORDER BY id LIMIT ?",
+                    (last_id, chunk_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                
+                for row_id, original_image, result_image in rows:
+                    last_id = row_id
+                    updates = {}
+                    for prefix, value in (('original_image', original_image), ('result_image', result_image)):
+                        if not value:
+                            continue
+                        try:
+                            image_hash, size = store.put_base64(value)
+                        except (binascii.Error, ValueError) as e:
+                            print(f"Skipping undecodable {prefix} in {table_name} row {row_id}: {e}")
+                            failed += 1
+                            continue
+                        updates[prefix] = ''
+                        updates[f'{prefix}_hash'] = image_hash
+                        updates[f'{prefix}_size'] = size
+                        moved += 1
+                    if updates:
+                        assignments = ', '.join(f"{column} = ?" for column in updates)
+                        conn.execute(
+                            f"UPDATE {table_name} SET {assignments} WHERE id = ?",
+                            list(updates.values()) + [row_id]
+                        )
+                conn.commit()
+                print(f"{table_name}: moved {moved} images so far (last id {last_id})")
+            
+            summary[table_name] = {'moved': moved, 'failed': failed,
+                                   'seconds': round(time.time() - start_time, 2)}
+        
+        if vacuum:
+            print("Compacting database...")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    
+    size_after = os.path.getsize(db_path)
+    summary['db_bytes_before'] = size_before
+    summary['db_bytes_after'] = size_after
+    print(f"Database size: {size_before / 1024 / 1024:.2f} MB -> {size_after / 1024 / 1024:.2f} MB")
+    return summary
+
 if __name__ == "__main__":
-    if migrate_database():
-        print("Database migration completed successfully.")
-    else:
+    # Usage:
+    #   python migrate_db.py                      add missing columns to the default databases
+    #   python migrate_db.py --images [db ...]    also move images into the image store
+    args = sys.argv[1:]
+    move_images = '--images' in args
+    paths = [arg for arg in args if not arg.startswith('--')] or None
+    
+    if not migrate_database(paths):
         print("Database migration failed.")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+    
+    if move_images:
+        from image_store import ImageStore
+        store_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_store')
+        store = ImageStore(store_root)
+        for db_path in paths or DEFAULT_DB_PATHS:
+            if os.path.exists(db_path):
+                print(migrate_images_to_store(db_path, store))
+    
+    print("Database migration completed successfully.")
@@ -0,0 +1,320 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from tflite_detector import load_tflite_model, get_model_spec, INTERPRETER_BACKEND
+
+# Model files for each variant, in the application directory
+MODEL_VARIANTS = {
+    'float': 'detect.tflite',
+    'int8': 'detect_int8.tflite',
+}
+
+def get_process_rss_mb():
+    """
+    Return the resident set size of the current process in MB.
+    Reads /proc/self/status on Linux (Raspberry Pi) and falls back to the
+    peak RSS reported by the resource module on other platforms.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        import platform
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux reports KB
+        return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+    except Exception:
+        return None
+
+def estimate_tensor_bytes(interpreter):
+    """Estimate the size in bytes of all tensors allocated by an interpreter."""
+    total = 0
+    try:
+        for detail in interpreter.get_tensor_details():
+            shape = detail.get('shape')
+            if shape is None or len(shape) == 0:
+                continue
+            count = 1
+            for dim in shape:
+                count *= max(int(dim), 0)
+            total += count * np.dtype(detail['dtype']).itemsize
+    except Exception as e:
+        print(f"Could not estimate tensor memory: {e}")
+    return total
+
+class InterpreterPool:
+    """
+    Bounded pool of pre-allocated TFLite interpreters.
+    TFLite interpreters are not thread-safe, so each detection checks one out,
+    runs inference and returns it. Overlapping PLC and manual captures each get
+    their own interpreter instead of sharing (and corrupting) a single one.
+    """
+
+    def __init__(self, model_path, size=1, num_threads=None, xnnpack=True, output_order=None):
+        self.model_path = model_path
+        self.size = max(1, int(size))
+        self.num_threads = num_threads
+        self.xnnpack = xnnpack
+        self._available = queue.Queue(maxsize=self.size)
+        self._stats_lock = threading.Lock()
+        self._created_at = time.time()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+        self._busy_seconds = 0.0
+        self.interpreters = []
+
+        for i in range(self.size):
+            interpreter = load_tflite_model(model_path, num_threads=num_threads, xnnpack=xnnpack,
+                                            output_order=output_order)
+            self.interpreters.append(interpreter)
+            self._available.put(interpreter)
+        print(f"Interpreter pool ready with {self.size} interpreter(s), num_threads={num_threads}, xnnpack={xnnpack}")
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Check out an interpreter for the duration of a with-block.
+
+        Args:
+            timeout (float): Seconds to wait for a free interpreter (None = wait forever)
+
+        Raises:
+            TimeoutError: If no interpreter became available within the timeout
+        """
+        wait_start = time.time()
+        try:
+            interpreter = self._available.get(timeout=timeout)
+        except queue.Empty:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise TimeoutError(f"No TFLite interpreter available after {timeout} seconds")
+
+        checkout_time = time.time()
+        wait_ms = (checkout_time - wait_start) * 1000
+        with self._stats_lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait_ms += wait_ms
+            self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+        if wait_ms > 100:
+            print(f"Waited {wait_ms:.2f}ms for a free interpreter")
+
+        try:
+            yield interpreter
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+                self._busy_seconds += time.time() - checkout_time
+            self._available.put(interpreter)
+
+    def stats(self):
+        """Return wait-time and utilization statistics for the pool."""
+        with self._stats_lock:
+            elapsed = max(time.time() - self._created_at, 1e-6)
+            return {
+                'size': self.size,
+                'num_threads': self.num_threads,
+                'xnnpack': self.xnnpack,
+                'in_use': self._in_use,
+                'available': self._available.qsize(),
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': self._total_wait_ms / self._checkouts if self._checkouts else 0.0,
+                'max_wait_ms': self._max_wait_ms,
+                'utilization': self._busy_seconds / (elapsed * self.size),
+            }
+
+class ModelRegistry:
+    """
+    Process-wide holder for the TFLite model and its labels.
+    The model file and labelmap are read once; every detection path checks out
+    a ready interpreter from the registry's pool instead of reloading it per car.
+    """
+
+    def __init__(self, model_path=None, label_path=None, pool_size=1, num_threads=None,
+                 xnnpack_enabled=True, model_variant='float', output_order=None):
+        self.app_dir = os.path.dirname(os.path.abspath(__file__))
+        self.model_variant = model_variant
+        self.model_path = model_path or self.variant_path(model_variant)
+        self.label_path = label_path or os.path.join(self.app_dir, 'labelmap.txt')
+        self.pool_size = pool_size
+        self.num_threads = num_threads
+        self.xnnpack_enabled = xnnpack_enabled
+        self.output_order = output_order or None  # None: read the output order from the model
+        # Serializes load() and configure(): a rebuild from POST /config can't interleave with
+        # the initial load or another rebuild. Reentrant because configure() calls load().
+        self._lock = threading.RLock()
+        self._pool = None
+        self._labels = None
+        self._stats = {
+            'loaded': False,
+            'model_path': None,
+            'model_variant': None,
+            'label_path': None,
+            'num_labels': 0,
+            'model_file_bytes': 0,
+            'tensor_bytes': 0,
+            'load_time_ms': None,
+            'rss_before_mb': None,
+            'rss_after_mb': None,
+            'rss_delta_mb': None,
+            'loaded_at': None,
+            'load_count': 0,
+        }
+
+    def _resolve_paths(self):
+        """Resolve model and label paths, falling back to the current directory."""
+        model_path = self.model_path
+        label_path = self.label_path
+
+        if not os.path.exists(model_path):
+            print(f"Model not found at {model_path}, trying current directory")
+            model_path = os.path.basename(model_path)
+
+        if not os.path.exists(label_path):
+            print(f"Labels not found at {label_path}, trying current directory")
+            label_path = os.path.basename(label_path)
+
+        return model_path, label_path
+
+    def variant_path(self, model_variant):
+        """Return the model file for a variant ('float' or 'int8')."""
+        if model_variant not in MODEL_VARIANTS:
+            raise ValueError(f"model_variant must be one of: {', '.join(MODEL_VARIANTS)}")
+        return os.path.join(self.app_dir, MODEL_VARIANTS[model_variant])
+
+    def configure(self, pool_size=None, num_threads=None, xnnpack_enabled=None, model_variant=None,
+                  output_order=None):
+        """
+        Update pool size, per-interpreter thread count, XNNPACK, model variant and output order
+        (an empty dict reads the output order from the model again).
+        If the model is already loaded and a value changed, the pool is rebuilt;
+        if that fails the previous settings and pool are kept and the error is raised.
+        Waits for a load or rebuild already in progress.
+        """
+        with self._lock:
+            previous = (self.pool_size, self.num_threads, self.xnnpack_enabled, self.model_variant, self.model_path,
+                        self.output_order)
+            changed = False
+            if pool_size is not None and int(pool_size) != self.pool_size:
+                self.pool_size = int(pool_size)
+                changed = True
+            if num_threads is not None and int(num_threads) != self.num_threads:
+                self.num_threads = int(num_threads)
+                changed = True
+            if xnnpack_enabled is not None and bool(xnnpack_enabled) != self.xnnpack_enabled:
+                self.xnnpack_enabled = bool(xnnpack_enabled)
+                changed = True
+            if model_variant is not None and model_variant != self.model_variant:
+                self.model_path = self.variant_path(model_variant)
+                self.model_variant = model_variant
+                changed = True
+            if output_order is not None and (output_order or None) != self.output_order:
+                self.output_order = output_order or None
+                changed = True
+            if changed and self._pool is not None:
+                print(f"Rebuilding interpreter pool (size={self.pool_size}, num_threads={self.num_threads}, "
+                      f"xnnpack={self.xnnpack_enabled}, variant={self.model_variant})")
+                try:
+                    self.load(force=True)
+                except Exception:
+                    (self.pool_size, self.num_threads, self.xnnpack_enabled, self.model_variant, self.model_path,
+                     self.output_order) = previous
+                    raise
+
+    def load(self, force=False):
+        """
+        Load the labels and build the interpreter pool if not loaded yet.
+
+        Args:
+            force (bool): Reload even if the model is already loaded
+
+        Returns:
+            InterpreterPool: The ready interpreter pool
+        """
+        with self._lock:
+            if self._pool is not None and not force:
+                return self._pool
+
+            model_path, label_path = self._resolve_paths()
+            print("Loading TFLite model and labels...")
+            rss_before = get_process_rss_mb()
+            start_time = time.time()
+
+            with open(label_path, 'r') as f:
+                labels = [line.strip() for line in f.readlines()]
+            print(f"Loaded {len(labels)} labels")
+
+            pool = InterpreterPool(model_path, size=self.pool_size, num_threads=self.num_threads,
+                                   xnnpack=self.xnnpack_enabled, output_order=self.output_order)
+
+            load_time_ms = (time.time() - start_time) * 1000
+            rss_after = get_process_rss_mb()
+
+            # Swap atomically; interpreters checked out from the old pool are
+            # returned to it and discarded with it
+            self._pool = pool
+            self._labels = labels
+            self._stats.update({
+                'loaded': True,
+                'model_path': model_path,
+                'model_variant': self.model_variant,
+                'label_path': label_path,
+                'num_labels': len(labels),
+                'model_file_bytes': os.path.getsize(model_path),
+                'tensor_bytes': sum(estimate_tensor_bytes(i) for i in pool.interpreters),
+                'load_time_ms': load_time_ms,
+                'rss_before_mb': rss_before,
+                'rss_after_mb': rss_after,
+                'rss_delta_mb': (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+                'loaded_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'load_count': self._stats['load_count'] + 1,
+            })
+            print(f"Model registry ready in {load_time_ms:.2f}ms "
+                  f"(model: {self._stats['model_file_bytes'] / 1024:.1f} KB, "
+                  f"tensors: {self._stats['tensor_bytes'] / 1024:.1f} KB)")
+            return self._pool
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Check out an interpreter and the labels, loading the model on first use.
+
+        Usage:
+            with model_registry.checkout() as (interpreter, labels):
+                tflite_detect(interpreter, frame, labels)
+        """
+        # Lock-free once loaded: a rebuild swaps in a new pool, interpreters
+        # already checked out go back to the old one
+        pool, labels = self._pool, self._labels
+        if pool is None:
+            with self._lock:
+                pool, labels = self.load(), self._labels
+        with pool.checkout(timeout=timeout) as interpreter:
+            yield interpreter, labels
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self.load()
+        return self._labels
+
+    def stats(self):
+        """Return load time, memory footprint and pool statistics."""
+        stats = dict(self._stats)
+        stats['current_rss_mb'] = get_process_rss_mb()
+        stats['interpreter_backend'] = dict(INTERPRETER_BACKEND)
+        stats['pool'] = self._pool.stats() if self._pool is not None else None
+        stats['model_spec'] = get_model_spec(self._pool.interpreters[0]).describe() if self._pool is not None else None
+        return stats
@@ -0,0 +1,177 @@
+import numpy as np
+
+OUTPUT_NAMES = ('boxes', 'classes', 'scores')
+# Order of the detector outputs before it was read from the model (TF2 SSD exports)
+LEGACY_OUTPUT_ORDER = {'boxes': 1, 'classes': 3, 'scores': 0}
+# Normalization of float inputs: (pixel - mean) / std, i.e. [-1, 1]
+FLOAT_INPUT_MEAN = 127.5
+FLOAT_INPUT_STD = 127.5
+# Real range quantized inputs represent: (pixel - mean) / std, i.e. [-1, 1). With the
+# scale 1/128 and zero point 128 (uint8) or 0 (int8) of TF detection models this
+# quantizes back to the raw pixel (uint8) or pixel - 128 (int8)
+QUANT_INPUT_MEAN = 128.0
+QUANT_INPUT_STD = 128.0
+
+def quantization_params(details):
+    """Return (scale, zero_point) of a tensor, or None if it isn't quantized."""
+    quantization = details.get('quantization') or (0.0, 0)
+    scale, zero_point = float(quantization[0]), int(quantization[1])
+    return (scale, zero_point) if scale > 0 else None
+
+def detect_output_order(output_details):
+    """
+    Work out which output tensor holds boxes, classes and scores.
+    Tensor names are used when they say it (e.g. 'detection_boxes'), then the
+    TF1 post-processing names (TFLite_Detection_PostProcess, :1 classes, :2
+    scores), then shapes: boxes are (1, N, 4); of the two (1, N) tensors TF2
+    exports put scores before the boxes and TF1 exports put classes after them.
+
+    Returns:
+        tuple: ({'boxes': i, 'classes': j, 'scores': k} as positions in output_details, how it was found)
+
+    Raises:
+        ValueError: If the outputs don't look like an SSD detector
+    """
+    names = [str(d.get('name', '')) for d in output_details]
+
+    keywords = {'boxes': 'box', 'classes': 'class', 'scores': 'score'}
+    order = {}
+    for key, keyword in keywords.items():
+        matches = [i for i, name in enumerate(names) if keyword in name.lower()]
+        if len(matches) == 1:
+            order[key] = matches[0]
+    if len(order) == 3:
+        return order, 'names'
+
+    suffixes = {'': 'boxes', ':1': 'classes', ':2': 'scores'}
+    order = {}
+    for i, name in enumerate(names):
+        if name.startswith('TFLite_Detection_PostProcess'):
+            key = suffixes.get(name[len('TFLite_Detection_PostProcess'):])
+            if key:
+                order[key] = i
+    if len(order) == 3:
+        return order, 'names'
+
+    shapes = [tuple(int(n) for n in d.get('shape', ())) for d in output_details]
+    boxes = [i for i, shape in enumerate(shapes) if len(shape) == 3 and shape[-1] == 4]
+    vectors = [i for i, shape in enumerate(shapes) if len(shape) == 2 and shape[-1] > 1]
+    if len(boxes) == 1 and len(vectors) == 2:
+        if vectors[0] < boxes[0]:
+            scores, classes = vectors
+        else:
+            classes, scores = vectors
+        return {'boxes': boxes[0], 'classes': classes, 'scores': scores}, 'shapes'
+
+    raise ValueError(f"Can't tell the detector outputs apart (names: {names}, shapes: {shapes})")
+
+def validate_output_order(output_order, output_count=None):
+    """
+    Check a configured output order.
+
+    Raises:
+        ValueError: If it isn't a mapping of boxes/classes/scores to distinct output positions
+    """
+    if not isinstance(output_order, dict) or set(output_order) != set(OUTPUT_NAMES):
+        raise ValueError("output order must map boxes, classes and scores to output positions")
+    positions = list(output_order.values())
+    if not all(isinstance(p, int) and p >= 0 for p in positions) or len(set(positions)) != 3:
+        raise ValueError("output positions must be distinct non-negative integers")
+    if output_count is not None and max(positions) >= output_count:
+        raise ValueError(f"the model only has {output_count} outputs")
+    return {key: int(value) for key, value in output_order.items()}
+
+class ModelSpec:
+    """
+    Input and output layout of a detection model, read from the .tflite file.
+    Covers the input size and dtype, input quantization (a lookup table maps
+    each pixel value straight to the quantized input value), which output
+    tensor is which, and output dequantization. Float, uint8 and int8 models
+    then run through the same code path.
+    """
+
+    def __init__(self, interpreter, output_order=None, input_mean=None, input_std=None):
+        """
+        Args:
+            interpreter: TFLite interpreter with allocated tensors
+            output_order (dict): {'boxes': i, 'classes': j, 'scores': k} to override the detected order
+            input_mean (float): Pixel normalization mean (default: FLOAT_INPUT_MEAN or QUANT_INPUT_MEAN)
+            input_std (float): Pixel normalization std (default: FLOAT_INPUT_STD or QUANT_INPUT_STD)
+        """
+        input_details = interpreter.get_input_details()[0]
+        self.input_index = input_details['index']
+        self.height = int(input_details['shape'][1])
+        self.width = int(input_details['shape'][2])
+        self.input_dtype = np.dtype(input_details['dtype'])
+        self.input_quantization = quantization_params(input_details)
+        is_float = self.input_dtype == np.float32
+        self.input_mean = input_mean if input_mean is not None else FLOAT_INPUT_MEAN if is_float else QUANT_INPUT_MEAN
+        self.input_std = input_std if input_std is not None else FLOAT_INPUT_STD if is_float else QUANT_INPUT_STD
+        self.input_lut = self._input_lut()
+
+        output_details = interpreter.get_output_details()
+        if output_order is not None:
+            self.output_order = validate_output_order(output_order, len(output_details))
+            self.output_order_source = 'config'
+        else:
+            try:
+                self.output_order, self.output_order_source = detect_output_order(output_details)
+            except ValueError as e:
+                print(f"WARNING: {str(e)}; using the legacy output order")
+                self.output_order, self.output_order_source = dict(LEGACY_OUTPUT_ORDER), 'legacy'
+        self.outputs = {}
+        for key, position in self.output_order.items():
+            details = output_details[position]
+            self.outputs[key] = (details['index'], quantization_params(details)
+                                 if np.dtype(details.get('dtype', np.float32)) != np.float32 else None)
+
+    def _input_lut(self):
+        """
+        Table from pixel value (0-255) to input value, or None to copy pixels as-is.
+        Pixels are normalized to r = (pixel - input_mean) / input_std; float
+        inputs take r directly, quantized inputs q = round(r / scale + zero_point)
+        clipped to the dtype. Integer inputs without quantization parameters get
+        the pixel shifted onto the dtype's range.
+        """
+        pixels = np.arange(256, dtype=np.float64)
+        real = (pixels - self.input_mean) / self.input_std
+        if self.input_dtype == np.float32:
+            return real.astype(np.float32)
+        info = np.iinfo(self.input_dtype)
+        if self.input_quantization is None:
+            lut = np.clip(pixels + info.min, info.min, info.max)
+        else:
+            scale, zero_point = self.input_quantization
+            lut = np.clip(np.round(real / scale + zero_point), info.min, info.max)
+        lut = lut.astype(self.input_dtype)
+        if self.input_dtype == np.uint8 and np.array_equal(lut, pixels.astype(np.uint8)):
+            return None  # Raw pixels: write the color conversion straight into the tensor
+        return lut
+
+    def read_outputs(self, interpreter):
+        """
+        Read and dequantize the detector outputs for the first image in the batch.
+
+        Returns:
+            tuple: (boxes (N, 4) ymin/xmin/ymax/xmax, classes (N,), scores (N,)) as float arrays
+        """
+        results = []
+        for key in OUTPUT_NAMES:
+            index, quantization = self.outputs[key]
+            values = interpreter.get_tensor(index)[0]
+            if quantization is not None:
+                scale, zero_point = quantization
+                values = (values.astype(np.float32) - zero_point) * scale
+            results.append(values)
+        return tuple(results)
+
+    def describe(self):
+        return {
+            'input_size': [self.width, self.height],
+            'input_dtype': self.input_dtype.name,
+            'input_quantization': list(self.input_quantization) if self.input_quantization else None,
+            'input_normalization': [self.input_mean, self.input_std],
+            'output_order': dict(self.output_order),
+            'output_order_source': self.output_order_source,
+            'output_quantization': {key: list(q) if q else None for key, (_, q) in self.outputs.items()},
+        }
@@ -0,0 +1,198 @@
+import queue
+import threading
+import time
+
+class PlcJob:
+    """A single PLC message travelling through the pipeline."""
+
+    def __init__(self, seq, payload):
+        self.seq = seq
+        self.payload = payload
+        self.is_good = False
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def report(self, is_good):
+        """Record the verdict as soon as it is known; the responder can answer before processing ends."""
+        if not self.done.is_set():
+            self.is_good = bool(is_good)
+            self.done.set()
+
+class PlcPipeline:
+    """
+    Pipelined PLC handling.
+    The socket reader submits parsed messages, a bounded pool of worker threads
+    runs capture and inference, and a single responder writes the GOOD/NOGOOD
+    verdicts back in arrival order. At most `depth` cars are in flight; when the
+    pipeline is full the reader blocks (backpressure='block', which stops reading
+    the socket) or the car is answered NOGOOD immediately (backpressure='reject').
+    """
+
+    def __init__(self, process_fn, respond_fn, depth=4, workers=2,
+                 result_timeout=30, backpressure='block', submit_timeout=30):
+        """
+        Args:
+            process_fn (callable): process_fn(payload, report) -> bool, True if the car is GOOD.
+                It may call report(is_good) as soon as the verdict is known so the PLC
+                is answered while the rest of the processing (storage, drawing) continues
+            respond_fn (callable): respond_fn(is_good) sends the verdict to the PLC
+            depth (int): Maximum number of cars in flight (queued + processing + awaiting response)
+            workers (int): Number of worker threads running process_fn
+            result_timeout (float): Seconds the responder waits for a car before answering NOGOOD
+            backpressure (str): 'block' or 'reject' when the pipeline is full
+            submit_timeout (float): Seconds submit() blocks in 'block' mode before rejecting
+        """
+        if backpressure not in ('block', 'reject'):
+            raise ValueError("backpressure must be 'block' or 'reject'")
+        self.process_fn = process_fn
+        self.respond_fn = respond_fn
+        self.depth = max(1, int(depth))
+        self.workers = max(1, int(workers))
+        self.result_timeout = result_timeout
+        self.backpressure = backpressure
+        self.submit_timeout = submit_timeout
+
+        self._slots = threading.BoundedSemaphore(self.depth)
+        self._work_queue = queue.Queue()
+        self._response_queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._seq = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'responded': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'max_in_flight': 0,
+            'total_latency_ms': 0.0,
+            'max_latency_ms': 0.0,
+            'total_queue_wait_ms': 0.0,
+        }
+        self._in_flight = 0
+
+    def start(self):
+        """Start the worker and responder threads."""
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'plc-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        responder = threading.Thread(target=self._responder_loop, name='plc-responder', daemon=True)
+        responder.start()
+        self._threads.append(responder)
+        print(f"PLC pipeline started (depth={self.depth}, workers={self.workers}, backpressure={self.backpressure})")
+
+    def stop(self):
+        """Stop all stages. Cars still in flight are not answered."""
+        self._stop_event.set()
+        for _ in range(self.workers):
+            self._work_queue.put(None)
+        self._response_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        print("PLC pipeline stopped")
+
+    def submit(self, payload):
+        """
+        Enqueue a parsed PLC message. Called from the socket reader.
+
+        Returns:
+            bool: True if the car was accepted for inspection, False if it was rejected
+        """
+        if self.backpressure == 'block':
+            acquired = self._slots.acquire(timeout=self.submit_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+
+        with self._stats_lock:
+            self._seq += 1
+            job = PlcJob(self._seq, payload)
+            self._stats['submitted'] += 1
+            if acquired:
+                self._in_flight += 1
+                self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+
+        if not acquired:
+            # Keep the slot in the response order but answer NOGOOD without inspecting
+            print(f"PLC pipeline full ({self.depth} cars in flight), rejecting car")
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            job.error = 'rejected'
+            job.done.set()
+            self._response_queue.put((job, False))
+            return False
+
+        self._response_queue.put((job, True))
+        self._work_queue.put(job)
+        return True
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            job = self._work_queue.get()
+            if job is None:
+                break
+            job.started_at = time.time()
+            try:
+                is_good = bool(self.process_fn(job.payload, job.report))
+                job.report(is_good)  # No-op if the verdict was already reported
+            except Exception as e:
+                print(f"ERROR in PLC pipeline worker: {str(e)}")
+                job.error = str(e)
+                job.report(False)
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+            finally:
+                job.finished_at = time.time()
+                job.done.set()
+
+    def _responder_loop(self):
+        while not self._stop_event.is_set():
+            item = self._response_queue.get()
+            if item is None:
+                break
+            job, holds_slot = item
+            remaining = self.result_timeout - (time.time() - job.submitted_at)
+            if not job.done.wait(timeout=max(remaining, 0)):
+                print(f"Detection timed out after {self.result_timeout} seconds (pipeline seq {job.seq})")
+                with self._stats_lock:
+                    self._stats['timeouts'] += 1
+                is_good = False
+            else:
+                is_good = job.is_good
+
+            try:
+                self.respond_fn(is_good)
+            except Exception as e:
+                print(f"ERROR sending PLC response from pipeline: {str(e)}")
+
+            latency_ms = (time.time() - job.submitted_at) * 1000
+            with self._stats_lock:
+                self._stats['responded'] += 1
+                self._stats['total_latency_ms'] += latency_ms
+                self._stats['max_latency_ms'] = max(self._stats['max_latency_ms'], latency_ms)
+                if job.started_at is not None:
+                    self._stats['total_queue_wait_ms'] += (job.started_at - job.submitted_at) * 1000
+                if holds_slot:
+                    self._in_flight -= 1
+            if holds_slot:
+                self._slots.release()
+
+    def stats(self):
+        """Return throughput, latency and backpressure statistics."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        responded = stats['responded']
+        stats['depth'] = self.depth
+        stats['workers'] = self.workers
+        stats['backpressure'] = self.backpressure
+        stats['queued'] = self._work_queue.qsize()
+        stats['avg_latency_ms'] = stats['total_latency_ms'] / responded if responded else 0.0
+        stats['avg_queue_wait_ms'] = stats['total_queue_wait_ms'] / responded if responded else 0.0
+        return stats
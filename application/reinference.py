@@ -0,0 +1,563 @@
+import argparse
+import copy
+import glob
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from decision_engine import DecisionEngine, DEFAULT_DECISION_RULES
+from detect_gray import bright_pixel_percentage
+from frame import Frame, FULL_ROI
+from image_store import ImageStore
+from model_registry import ModelRegistry, MODEL_VARIANTS
+from tflite_detector import load_tflite_model, get_model_spec
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(APP_DIR, 'instance', 'car_logs.db')
+DEFAULT_IMAGE_STORE = os.path.join(APP_DIR, 'image_store')
+CONFIG_PATH = os.path.join(APP_DIR, 'config.json')
+# cleanup_database.py writes its backups to the directory it runs from
+BACKUP_PATTERNS = [
+    os.path.join(APP_DIR, 'car_logs_backup_*.db'),
+    os.path.join(os.path.dirname(APP_DIR), 'car_logs_backup_*.db'),
+]
+DEFAULT_CHUNK_SIZE = 64
+SCORE_FLOOR = 0.1  # Detections kept in the side table, so thresholds can be re-checked without re-running
+MAX_CHANGED_EXAMPLES = 50
+
+# Station settings a re-inference run uses, with the station defaults
+DEFAULT_SETTINGS = {
+    'model_variant': 'float',
+    'model_output_order': None,
+    'min_conf_threshold': 0.7,
+    'gray_detection_enabled': True,
+    'decision_rules': DEFAULT_DECISION_RULES,
+    'gray_roi': list(FULL_ROI),
+    'detection_roi': list(FULL_ROI),
+    'gray_decode_reduction': 1,
+}
+
+RESULT_TABLES = [
+    """CREATE TABLE IF NOT EXISTS reinference_run (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at DATETIME NOT NULL,
+        finished_at DATETIME,
+        settings TEXT NOT NULL,
+        summary TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS reinference_result (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL,
+        source_db VARCHAR(255) NOT NULL,
+        car_log_id INTEGER NOT NULL,
+        car_id VARCHAR(50) NOT NULL,
+        expected_part VARCHAR(200),
+        stored_part VARCHAR(200),
+        new_part VARCHAR(200),
+        stored_outcome VARCHAR(50),
+        new_outcome VARCHAR(50),
+        real_outcome VARCHAR(50),
+        gray_percentage FLOAT,
+        detections TEXT,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_reinference_result_run ON reinference_result (run_id)",
+]
+
+def load_saved_config(config_path=CONFIG_PATH):
+    """The configuration saved by POST /config, or an empty dict."""
+    if not os.path.exists(config_path):
+        return {}
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading saved configuration {config_path}: {str(e)}")
+        return {}
+
+def station_settings(config=None, overrides=None):
+    """
+    Settings for a run: the station defaults, then the station config, then overrides.
+
+    Args:
+        config (dict): Station configuration (the live config, or the saved config.json)
+        overrides (dict): Settings to change for this run (e.g. another model variant or threshold)
+
+    Raises:
+        ValueError: If the model variant, threshold or rules are invalid
+    """
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    settings.update({key: copy.deepcopy(value) for key, value in (config or {}).items() if key in settings})
+    settings.update({key: value for key, value in (overrides or {}).items() if key in settings and value is not None})
+    if settings['model_variant'] not in MODEL_VARIANTS:
+        raise ValueError(f"model_variant must be one of: {', '.join(MODEL_VARIANTS)}")
+    try:
+        settings['min_conf_threshold'] = float(settings['min_conf_threshold'])
+    except (TypeError, ValueError):
+        raise ValueError("min_conf_threshold must be a number")
+    try:
+        DecisionEngine(settings['decision_rules'])
+    except AttributeError as e:
+        raise ValueError(f"Invalid decision_rules: {str(e)}")
+    return settings
+
+def find_databases(db_path=DEFAULT_DB_PATH, include_backups=True):
+    """The station database followed by any car_logs_backup_*.db files, oldest backup last."""
+    paths = [db_path] if os.path.exists(db_path) else []
+    if include_backups:
+        backups = set()
+        for pattern in BACKUP_PATTERNS:
+            backups.update(os.path.abspath(path) for path in glob.glob(pattern))
+        paths += sorted(backups, key=os.path.basename, reverse=True)
+    return paths
+
+def _table_columns(conn, table_name):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+
+def open_readonly(db_path):
+    return sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, timeout=30)
+
+def count_cars(db_path):
+    conn = open_readonly(db_path)
+    try:
+        if 'id' not in _table_columns(conn, 'car_log'):
+            return 0
+        return conn.execute("SELECT COUNT(*) FROM car_log").fetchone()[0]
+    finally:
+        conn.close()
+
+def load_feedback(db_path):
+    """Latest operator verdict (FeedbackLog.real_outcome) per car_id."""
+    conn = open_readonly(db_path)
+    try:
+        if 'real_outcome' not in _table_columns(conn, 'feedback_log'):
+            return {}
+        rows = conn.execute("SELECT car_id, real_outcome FROM feedback_log ORDER BY id")
+        return {car_id: real_outcome for car_id, real_outcome in rows}
+    finally:
+        conn.close()
+
+def iter_car_chunks(db_path, chunk_size=DEFAULT_CHUNK_SIZE, table='car_log'):
+    """
+    Stream car_log (or feedback_log) rows in id order, chunk_size rows at a time.
+    Works on the current schema and on old backups without the image store
+    columns; the legacy base64 text is only read for rows without a hash.
+
+    Yields:
+        list: Row dicts (id, car_id, expected_part, actual_part, outcome, image_hash, image_base64);
+        feedback_log rows give original_outcome as outcome and add real_outcome
+    """
+    conn = open_readonly(db_path)
+    try:
+        columns = _table_columns(conn, table)
+        if not columns:
+            return
+        if 'original_image_hash' in columns:
+            image_columns = ("original_image_hash, CASE WHEN original_image_hash IS NULL "
+                             "OR original_image_hash = '' THEN original_image END")
+        else:
+            image_columns = "NULL, original_image"
+        outcome_columns = "original_outcome, real_outcome" if table == 'feedback_log' else "outcome, NULL"
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT id, car_id, expected_part, actual_part, {outcome_columns}, {image_columns} FROM {table} "
+                f"WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            chunk = []
+            for row_id, car_id, expected_part, actual_part, outcome, real_outcome, image_hash, image_base64 in rows:
+                row = {
+                    'id': row_id, 'car_id': car_id, 'expected_part': expected_part, 'actual_part': actual_part,
+                    'outcome': outcome, 'image_hash': image_hash, 'image_base64': image_base64,
+                }
+                if table == 'feedback_log':
+                    row['real_outcome'] = real_outcome
+                chunk.append(row)
+            yield chunk
+    finally:
+        conn.close()
+
+# Per-process state of the pool workers, set up once by init_worker
+_worker = {}
+
+def init_worker(settings, image_store_root):
+    """Load the model, labels and rules once per worker process."""
+    registry = ModelRegistry(model_variant=settings['model_variant'])
+    # One thread per interpreter: the parallelism comes from the worker processes
+    _worker['interpreter'] = load_tflite_model(registry.model_path, num_threads=1,
+                                               output_order=settings['model_output_order'])
+    with open(registry.label_path, 'r') as f:
+        _worker['labels'] = [line.strip() for line in f.readlines()]
+    _worker['engine'] = DecisionEngine(settings['decision_rules'])
+    _worker['settings'] = settings
+    _worker['store'] = ImageStore(image_store_root)
+
+def load_row_frame(row):
+    """The stored original image of a row, from the image store or the legacy base64 column."""
+    if row['image_hash']:
+        jpeg = _worker['store'].get(row['image_hash'])
+        if jpeg is None:
+            raise ValueError(f"image {row['image_hash']} is not in the image store")
+        return Frame.from_jpeg(jpeg)
+    if row['image_base64']:
+        return Frame.from_base64(row['image_base64'])
+    raise ValueError("car has no original image")
+
+def row_gray_percentage(frame):
+    settings = _worker['settings']
+    return bright_pixel_percentage(frame.gray(roi=settings['gray_roi'], reduction=settings['gray_decode_reduction']))
+
+def run_detector(frame):
+    """
+    Run the worker's interpreter on the detection ROI of a frame.
+
+    Returns:
+        tuple: (boxes, classes, scores) as returned by ModelSpec.read_outputs
+    """
+    interpreter = _worker['interpreter']
+    spec = get_model_spec(interpreter)
+    region, _ = frame.crop(_worker['settings']['detection_roi'])
+    spec.input_writer.write(region)
+    interpreter.invoke()
+    return spec.read_outputs(interpreter)
+
+def infer_car(row):
+    """
+    Run the station's inspection (gray check, detector, rules) on one stored car.
+
+    Returns:
+        dict: new_part, new_outcome, gray_percentage, detections ([class_id, score] above SCORE_FLOOR), error
+    """
+    settings = _worker['settings']
+    engine = _worker['engine']
+    result = {'new_part': None, 'new_outcome': None, 'gray_percentage': None, 'detections': None, 'error': None}
+    try:
+        frame = load_row_frame(row)
+        gray_enabled = settings['gray_detection_enabled']
+        gray_percentage = row_gray_percentage(frame)
+        result['gray_percentage'] = gray_percentage
+        if not engine.needs_detection(gray_percentage, gray_enabled):
+            result['new_part'] = engine.below_gray_part
+        else:
+            _, classes, scores = run_detector(frame)
+            result['new_part'] = engine.classify(classes, scores, _worker['labels'],
+                                                 settings['min_conf_threshold'], gray_percentage, gray_enabled)
+            kept = scores > SCORE_FLOOR
+            result['detections'] = [[int(c), round(float(s), 4)]
+                                    for c, s in zip(classes[kept].tolist(), scores[kept].tolist())]
+        result['new_outcome'] = "GOOD" if row['expected_part'] == result['new_part'] else "NOGOOD"
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def infer_chunk(rows):
+    """Worker task: infer a chunk of rows, returning (row, result) pairs without the image text."""
+    results = []
+    for row in rows:
+        result = infer_car(row)
+        row = dict(row)
+        row.pop('image_base64', None)
+        results.append((row, result))
+    return results
+
+def summarize(results, max_examples=MAX_CHANGED_EXAMPLES):
+    """
+    Agreement of the new parts with the stored ones, and of the new outcomes with operator feedback.
+
+    Args:
+        results (list): (row, result) pairs, rows carrying 'real_outcome' when the car has feedback
+
+    Returns:
+        dict: Counts, agreement rates and confusion matrices ({stored: {new: count}})
+    """
+    cars = 0
+    errors = 0
+    agree = 0
+    part_matrix = Counter()
+    feedback = 0
+    feedback_stored_correct = 0
+    feedback_new_correct = 0
+    outcome_matrix = Counter()
+    changed = []
+    for row, result in results:
+        cars += 1
+        if result['error']:
+            errors += 1
+            continue
+        part_matrix[(row['actual_part'], result['new_part'])] += 1
+        if row['actual_part'] == result['new_part']:
+            agree += 1
+        elif len(changed) < max_examples:
+            changed.append({'car_id': row['car_id'], 'expected_part': row['expected_part'],
+                            'stored_part': row['actual_part'], 'new_part': result['new_part']})
+        if row.get('real_outcome'):
+            feedback += 1
+            feedback_stored_correct += row['outcome'] == row['real_outcome']
+            feedback_new_correct += result['new_outcome'] == row['real_outcome']
+            outcome_matrix[(row['real_outcome'], result['new_outcome'])] += 1
+
+    def nested(counter):
+        matrix = {}
+        for (actual, predicted), count in sorted(counter.items()):
+            matrix.setdefault(actual, {})[predicted] = count
+        return matrix
+
+    inferred = cars - errors
+    return {
+        'cars': cars,
+        'errors': errors,
+        'agreement': agree / inferred if inferred else None,
+        'changed': inferred - agree,
+        'part_confusion': nested(part_matrix),
+        'feedback_cars': feedback,
+        'feedback_accuracy_stored': feedback_stored_correct / feedback if feedback else None,
+        'feedback_accuracy_new': feedback_new_correct / feedback if feedback else None,
+        'outcome_confusion': nested(outcome_matrix),
+        'changed_examples': changed,
+    }
+
+class ResultWriter:
+    """Writes a run and its per-car results to the side tables (next to car_log by default)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        for statement in RESULT_TABLES:
+            self.conn.execute(statement)
+        self.conn.commit()
+        self.run_id = None
+
+    def start_run(self, settings):
+        cursor = self.conn.execute(
+            "INSERT INTO reinference_run (started_at, settings) VALUES (?, ?)",
+            (time.strftime("%Y-%m-%d %H:%M:%S"), json.dumps(settings))
+        )
+        self.conn.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def write(self, source_db, results):
+        self.conn.executemany(
+            "INSERT INTO reinference_result (run_id, source_db, car_log_id, car_id, expected_part, stored_part, "
+            "new_part, stored_outcome, new_outcome, real_outcome, gray_percentage, detections, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(self.run_id, os.path.basename(source_db), row['id'], row['car_id'], row['expected_part'],
+              row['actual_part'], result['new_part'], row['outcome'], result['new_outcome'],
+              row.get('real_outcome'), result['gray_percentage'],
+              json.dumps(result['detections']) if result['detections'] is not None else None, result['error'])
+             for row, result in results]
+        )
+        self.conn.commit()
+
+    def finish_run(self, summary):
+        self.conn.execute(
+            "UPDATE reinference_run SET finished_at = ?, summary = ? WHERE id = ?",
+            (time.strftime("%Y-%m-%d %H:%M:%S"), json.dumps(summary), self.run_id)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def run_reinference(settings, db_paths, result_db_path=DEFAULT_DB_PATH, image_store_root=DEFAULT_IMAGE_STORE,
+                    workers=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=None, progress=None):
+    """
+    Re-run the inspection over stored cars with the given settings.
+    Rows are streamed from each database in chunks and inferred on a process
+    pool (one single-threaded interpreter per worker); only a few chunks are
+    in flight at a time so memory stays flat on large histories. A car found
+    in several databases (backups overlap) is inferred once, from the first.
+
+    Args:
+        settings (dict): Station settings, see station_settings()
+        db_paths (list): Databases to read, in order of preference
+        result_db_path (str): Database for the reinference_run/reinference_result tables
+        image_store_root (str): Image store holding the JPEGs referenced by hash
+        workers (int): Worker processes (default: CPU count)
+        chunk_size (int): Rows per worker task
+        limit (int): Stop after this many cars
+        progress (callable): progress(done, total) after each chunk
+
+    Returns:
+        dict: summarize() of the run plus run_id, timing and the databases read
+    """
+    workers = workers or os.cpu_count() or 1
+    total = sum(count_cars(path) for path in db_paths)
+    if limit:
+        total = min(total, limit)
+    feedback = {}
+    for path in reversed(db_paths):
+        feedback.update(load_feedback(path))
+
+    writer = ResultWriter(result_db_path)
+    run_id = writer.start_run(settings)
+    print(f"Re-inference run {run_id}: {total} cars from {len(db_paths)} database(s), {workers} worker(s)")
+    start_time = time.time()
+    results = []
+    seen = set()
+    submitted = 0
+    # spawn: the workers don't inherit the server's threads, sockets or interpreter pool
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(settings, image_store_root)) as executor:
+            pending = {}
+
+            def collect(done):
+                for future in done:
+                    source_db = pending.pop(future)
+                    chunk_results = future.result()
+                    for row, _ in chunk_results:
+                        row['real_outcome'] = feedback.get(row['car_id'])
+                    writer.write(source_db, chunk_results)
+                    results.extend(chunk_results)
+                    if progress is not None:
+                        progress(len(results), total)
+
+            for db_path in db_paths:
+                for rows in iter_car_chunks(db_path, chunk_size):
+                    if limit and submitted >= limit:
+                        break
+                    rows = [row for row in rows if row['car_id'] not in seen]
+                    if limit:
+                        rows = rows[:limit - submitted]
+                    if not rows:
+                        continue
+                    seen.update(row['car_id'] for row in rows)
+                    submitted += len(rows)
+                    pending[executor.submit(infer_chunk, rows)] = db_path
+                    if len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            collect(wait(pending).done)
+
+        summary = summarize(results)
+        summary['run_id'] = run_id
+        summary['seconds'] = round(time.time() - start_time, 2)
+        summary['cars_per_second'] = round(len(results) / summary['seconds'], 2) if summary['seconds'] else None
+        summary['databases'] = [os.path.basename(path) for path in db_paths]
+        writer.finish_run(summary)
+    finally:
+        writer.close()
+    print(f"Re-inference run {run_id} finished: {summary['cars']} cars in {summary['seconds']}s, "
+          f"agreement {format_rate(summary['agreement'])}")
+    return summary
+
+def format_rate(rate):
+    return f"{rate * 100:.2f}%" if rate is not None else "n/a"
+
+def print_matrix(title, matrix):
+    columns = sorted({predicted for row in matrix.values() for predicted in row})
+    if not columns:
+        return
+    width = max(12, max(len(str(c)) for c in list(columns) + list(matrix)) + 2)
+    print(f"\n{title}")
+    print(' ' * width + ''.join(f"{str(c):>{width}}" for c in columns))
+    for actual, row in matrix.items():
+        print(f"{str(actual):<{width}}" + ''.join(f"{row.get(c, 0):>{width}}" for c in columns))
+
+class ReinferenceJob:
+    """Runs run_reinference() on a background thread so the HTTP request returns right away."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {'state': 'idle'}
+
+    def start(self, settings, db_paths, **kwargs):
+        """
+        Start a run.
+
+        Returns:
+            bool: False if one is already running
+        """
+        with self._lock:
+            if self._status['state'] == 'running':
+                return False
+            self._status = {
+                'state': 'running',
+                'started_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'finished_at': None,
+                'done': 0,
+                'total': None,
+                'databases': [os.path.basename(path) for path in db_paths],
+                'summary': None,
+                'error': None,
+            }
+
+        def progress(done, total):
+            with self._lock:
+                self._status['done'] = done
+                self._status['total'] = total
+
+        def run():
+            try:
+                summary = run_reinference(settings, db_paths, progress=progress, **kwargs)
+                with self._lock:
+                    self._status['summary'] = summary
+                    self._status['state'] = 'finished'
+            except Exception as e:
+                print(f"Error running re-inference: {str(e)}")
+                with self._lock:
+                    self._status['error'] = str(e)
+                    self._status['state'] = 'failed'
+            finally:
+                with self._lock:
+                    self._status['finished_at'] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        threading.Thread(target=run, name='reinference', daemon=True).start()
+        return True
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run the inspection over the stored car images')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Station database (default: instance/car_logs.db)')
+    parser.add_argument('--no-backups', action='store_true', help='Skip the car_logs_backup_*.db files')
+    parser.add_argument('--extra-db', nargs='+', default=[], help='More databases to read')
+    parser.add_argument('--results-db', help='Database for the result tables (default: the station database)')
+    parser.add_argument('--variant', choices=list(MODEL_VARIANTS), help='Model variant (default: station setting)')
+    parser.add_argument('--min-conf', type=float, help='Detection threshold (default: station setting)')
+    parser.add_argument('--rules', help='JSON file with decision rules (default: station setting)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per worker task')
+    parser.add_argument('--limit', type=int, help='Stop after this many cars')
+    args = parser.parse_args()
+
+    overrides = {'model_variant': args.variant, 'min_conf_threshold': args.min_conf}
+    if args.rules:
+        with open(args.rules, 'r', encoding='utf-8') as f:
+            overrides['decision_rules'] = json.load(f)
+    settings = station_settings(load_saved_config(), overrides)
+    db_paths = find_databases(args.db, include_backups=not args.no_backups) + args.extra_db
+    if not db_paths:
+        parser.error(f"No database found at {args.db}")
+
+    summary = run_reinference(
+        settings, db_paths,
+        result_db_path=args.results_db or (args.db if os.path.exists(args.db) else db_paths[0]),
+        workers=args.workers, chunk_size=args.chunk_size, limit=args.limit,
+        progress=lambda done, total: print(f"  {done}/{total} cars")
+    )
+    print(f"\nRun {summary['run_id']}: {summary['cars']} cars ({summary['errors']} errors) "
+          f"in {summary['seconds']}s, {summary['cars_per_second']} cars/s")
+    print(f"Agreement with stored parts: {format_rate(summary['agreement'])} ({summary['changed']} changed)")
+    print_matrix("Stored part (rows) vs new part (columns)", summary['part_confusion'])
+    if summary['feedback_cars']:
+        print(f"\nCars with operator feedback: {summary['feedback_cars']}")
+        print(f"Outcome accuracy, stored: {format_rate(summary['feedback_accuracy_stored'])}, "
+              f"new: {format_rate(summary['feedback_accuracy_new'])}")
+        print_matrix("Real outcome (rows) vs new outcome (columns)", summary['outcome_confusion'])
+
+if __name__ == "__main__":
+    main()
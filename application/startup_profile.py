@@ -0,0 +1,65 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Standard library modules are left out of the new-package lists (the set exists on Python 3.10+)
+STDLIB_MODULES = getattr(sys, 'stdlib_module_names', frozenset())
+
+class StartupProfile:
+    """
+    Records how long each part of backend startup takes.
+    Import groups and setup phases are timed with measure(); for imports the
+    top-level packages that were loaded for the first time are listed too, so
+    the cost of each dependency shows up in /startup-profile.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._entries = []
+        self._marks = {}
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    @contextmanager
+    def measure(self, name):
+        """Time a block (an import group or a setup phase)."""
+        modules_before = set(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            new_packages = sorted({
+                module.split('.')[0] for module in set(sys.modules) - modules_before
+                if not module.startswith('_') and module.split('.')[0] not in STDLIB_MODULES
+            })
+            with self._lock:
+                self._entries.append({
+                    'name': name,
+                    'started_ms': (start - self._start) * 1000,
+                    'duration_ms': duration_ms,
+                    'new_packages': new_packages,
+                })
+
+    def mark(self, name):
+        """Record a milestone (e.g. 'server starting') at the current time."""
+        with self._lock:
+            self._marks[name] = self.elapsed_ms()
+
+    def report(self):
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries]
+            marks = dict(self._marks)
+        return {
+            'started_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            'entries': sorted(entries, key=lambda entry: entry['started_ms']),
+            'slowest': sorted(entries, key=lambda entry: entry['duration_ms'], reverse=True)[:5],
+            'marks': marks,
+        }
+
+# Process-wide profile; created by the first import, i.e. at the top of main.py
+startup_profile = StartupProfile()
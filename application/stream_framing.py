@@ -0,0 +1,110 @@
+PLC_RECORD_SIZE = 10   # 3 (sequence) + 5 (body) + 2 (capot)
+GALC_RECORD_SIZE = 45  # GALC telegram
+
+def is_valid_plc_record(record):
+    """Check that a 10-byte record looks like <3 digits><letter + 4 digits><2 digits>."""
+    try:
+        text = bytes(record).decode('ascii')
+    except UnicodeDecodeError:
+        return False
+    return text[:3].isdigit() and text[3:4].isalpha() and text[4:10].isdigit()
+
+def is_valid_galc_record(record):
+    """Check the GALC header: printable receiver/sender names and a numeric serial."""
+    header = bytes(record[0:16])
+    if not all(32 <= b < 127 for b in header):
+        return False
+    return header[12:16].isdigit()
+
+class FrameDecoder:
+    """
+    Incremental decoder for fixed-size records on a TCP stream.
+    TCP coalesces and splits segments, so a recv() may hold several records,
+    part of one, or both. feed() accepts arbitrary chunks and returns every
+    complete record; leftover bytes stay in a reusable buffer for the next call.
+    When a validator rejects a record the decoder drops one byte and retries
+    (a resync), so a corrupted byte can't misalign every following record.
+    """
+
+    def __init__(self, record_size, validator=None, filler=b'', name='stream'):
+        """
+        Args:
+            record_size (int): Size of each record in bytes
+            validator (callable): validator(record) -> bool, None to accept everything
+            filler (bytes): Byte values that may appear between records (e.g. keep-alive
+                null bytes) and are skipped without counting as a resync
+            name (str): Name used in log messages
+        """
+        self.record_size = record_size
+        self.validator = validator
+        self.filler = set(filler)
+        self.name = name
+        self._buffer = bytearray()
+        self._start = 0
+        self.records = 0
+        self.chunks = 0
+        self.resyncs = 0
+        self.bytes_dropped = 0
+        self.filler_bytes = 0
+        self.split_records = 0  # Records completed from more than one chunk
+
+    def feed(self, chunk):
+        """
+        Add a chunk of received bytes.
+
+        Returns:
+            list: Complete records (bytes) in stream order
+        """
+        self.chunks += 1
+        carried = len(self._buffer)  # Bytes left over from earlier chunks
+        self._buffer += chunk
+        records = []
+        resynced = 0
+        buffer = self._buffer
+        size = self.record_size
+
+        while len(buffer) - self._start >= 1:
+            if self.filler and buffer[self._start] in self.filler:
+                self._start += 1
+                self.filler_bytes += 1
+                continue
+            if len(buffer) - self._start < size:
+                break
+            record = bytes(buffer[self._start:self._start + size])
+            if self.validator is not None and not self.validator(record):
+                self._start += 1
+                self.resyncs += 1
+                self.bytes_dropped += 1
+                resynced += 1
+                continue
+            records.append(record)
+            if self._start < carried:
+                self.split_records += 1
+            self._start += size
+
+        if self._start:
+            # Compact in place; the bytearray is reused across calls
+            del buffer[:self._start]
+            self._start = 0
+        if resynced:
+            print(f"{self.name}: dropped {resynced} byte(s) to resynchronize the stream")
+
+        self.records += len(records)
+        return records
+
+    def reset(self):
+        """Discard any buffered partial record."""
+        self._buffer.clear()
+        self._start = 0
+
+    def stats(self):
+        return {
+            'record_size': self.record_size,
+            'records': self.records,
+            'chunks': self.chunks,
+            'resyncs': self.resyncs,
+            'bytes_dropped': self.bytes_dropped,
+            'filler_bytes': self.filler_bytes,
+            'split_records': self.split_records,
+            'buffered_bytes': len(self._buffer),
+        }
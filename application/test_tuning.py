@@ -0,0 +1,27 @@
+import sqlite3
+from tuning import collect_samples
+
+def make_db(path, cars):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE car_log (id INTEGER PRIMARY KEY, car_id TEXT, expected_part TEXT, "
+                 "actual_part TEXT, outcome TEXT, original_image TEXT)")
+    conn.executemany("INSERT INTO car_log (car_id, expected_part, actual_part, outcome, original_image) "
+                     "VALUES (?, 'Capo tipo 1', ?, ?, '')", cars)
+    conn.commit()
+    conn.close()
+
+def test_unreviewed_cars_without_a_verdict_are_excluded(tmp_path):
+    db_path = str(tmp_path / 'car_logs.db')
+    make_db(db_path, [
+        ('100-A0001-01-AAAA', 'Capo tipo 1', 'GOOD'),
+        ('100-A0002-01-AAAA', 'Capo tipo 2', 'NOGOOD'),
+        ('100-A0003-01-AAAA', 'Pendiente', 'Pendiente'),
+        ('100-A0004-01-AAAA', 'Error en detección', 'Error'),
+    ])
+
+    samples = [row for chunk in collect_samples([db_path]) for row in chunk]
+
+    assert {row['car_id']: row['truth'] for row in samples} == {
+        '100-A0001-01-AAAA': 'GOOD',
+        '100-A0002-01-AAAA': 'NOGOOD',
+    }
@@ -1,55 +1,341 @@
 import cv2
+import importlib
+import json
+import threading
+import weakref
 import numpy as np
-import base64
-from tensorflow.lite.python.interpreter import Interpreter
+from model_spec import ModelSpec
 import time
 
-def load_tflite_model(model_path):
+# Interpreter backends in order of preference: the standalone runtimes only
+# ship the interpreter, full TensorFlow costs seconds and hundreds of MB to import
+INTERPRETER_BACKENDS = (
+    ('tflite_runtime', 'tflite_runtime.interpreter'),
+    ('ai_edge_litert', 'ai_edge_litert.interpreter'),
+    ('tensorflow', 'tensorflow.lite.python.interpreter'),
+)
+
+def import_interpreter():
+    """
+    Import the TFLite Interpreter class from the lightest available backend.
+
+    Returns:
+    - (interpreter module, info dict with backend, module, version and import_time_ms)
+    """
+    errors = []
+    for backend, module_name in INTERPRETER_BACKENDS:
+        start_time = time.time()
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            errors.append(f"{backend}: {str(e)}")
+            continue
+        import_time_ms = (time.time() - start_time) * 1000
+        try:
+            version = importlib.import_module(backend).__version__
+        except (ImportError, AttributeError):
+            version = None
+        info = {
+            'backend': backend,
+            'module': module_name,
+            'version': version,
+            'import_time_ms': import_time_ms,
+        }
+        print(f"TFLite interpreter backend: {backend} {version or 'unknown version'} "
+              f"(imported in {import_time_ms:.2f}ms)")
+        return module, info
+    raise ImportError("No TFLite interpreter available (install tflite-runtime): " + "; ".join(errors))
+
+# The backend is imported on first use (model load on the warm-up thread), not at module import,
+# so the web server can start without waiting for it
+INTERPRETER_BACKEND = {'backend': None, 'module': None, 'version': None, 'import_time_ms': None}
+_interpreter_module = None
+_interpreter_lock = threading.Lock()
+
+def get_interpreter_module():
+    """Return the backend's interpreter module, importing it on the first call."""
+    global _interpreter_module
+    if _interpreter_module is None:
+        with _interpreter_lock:
+            if _interpreter_module is None:
+                module, info = import_interpreter()
+                INTERPRETER_BACKEND.update(info)
+                _interpreter_module = module
+    return _interpreter_module
+
+def get_interpreter_class():
+    """Return the TFLite Interpreter class, importing the backend on the first call."""
+    return get_interpreter_module().Interpreter
+
+# One row per detection above the confidence threshold
+DETECTION_DTYPE = np.dtype([
+    ('class_id', np.int32),
+    ('score', np.float32),
+    ('box', np.float32, (4,)),    # Normalized xmin, ymin, xmax, ymax
+    ('box_px', np.int32, (4,)),   # Pixel xmin, ymin, xmax, ymax in the source image
+])
+
+class InputWriter:
+    """
+    Writes a BGR image into an interpreter's input tensor without per-call allocations.
+    The image is resized into a preallocated scratch array, then color-converted
+    (and normalized or quantized through the model's lookup table) straight
+    into the interpreter's own input buffer obtained via interpreter.tensor().
+    Interpreters without tensor() fall back to set_tensor() from a reused
+    scratch array.
+
+    The buffer view is fetched and dropped on every write: TFLite refuses to
+    invoke() while numpy views of its internal buffers are alive.
+    """
+
+    def __init__(self, interpreter, spec):
+        self.interpreter = weakref.proxy(interpreter)
+        self.index = spec.input_index
+        self.height = spec.height
+        self.width = spec.width
+        self.dtype = spec.input_dtype
+        self.lut = spec.input_lut
+        self.zero_copy = hasattr(interpreter, 'tensor')
+        # Scratch arrays reused for every car
+        self.resized = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.rgb = np.empty((self.height, self.width, 3), dtype=np.uint8) if self.lut is not None else None
+        self.input_data = None if self.zero_copy else np.empty((1, self.height, self.width, 3), dtype=self.dtype)
+
+    def write(self, image):
+        """Resize, convert to RGB and normalize a BGR image into the input tensor."""
+        # Resizing first means the color conversion only touches model-sized pixels
+        cv2.resize(image, (self.width, self.height), dst=self.resized)
+        if self.zero_copy:
+            tensor_view = self.interpreter.tensor(self.index)
+            self._fill(tensor_view()[0])
+            del tensor_view  # Don't hold references to the interpreter's buffers across invoke()
+        else:
+            self._fill(self.input_data[0])
+            self.interpreter.set_tensor(self.index, self.input_data)
+
+    def _fill(self, target):
+        if self.lut is not None:
+            # Normalize (float) or quantize (int8, unusual uint8 ranges) each pixel value through the table
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+            cv2.LUT(self.rgb, self.lut, dst=target)
+        else:
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=target)
+
+# ModelSpec and InputWriter per interpreter, dropped together with the interpreter
+_model_specs = weakref.WeakKeyDictionary()
+_model_specs_lock = threading.Lock()
+
+def get_model_spec(interpreter, output_order=None):
+    """
+    Return the ModelSpec for an interpreter, reading it from the model on first use.
+
+    Args:
+        output_order (dict): Output positions to use instead of the detected ones (only on first use)
+    """
+    with _model_specs_lock:
+        spec = _model_specs.get(interpreter)
+        if spec is None:
+            spec = ModelSpec(interpreter, output_order=output_order)
+            spec.input_writer = InputWriter(interpreter, spec)
+            _model_specs[interpreter] = spec
+    return spec
+
+def get_input_writer(interpreter):
+    """Return the InputWriter for an interpreter, creating it on first use."""
+    return get_model_spec(interpreter).input_writer
+
+def load_tflite_model(model_path, num_threads=None, xnnpack=True, output_order=None):
     """
     Load a TFLite model and allocate tensors.
     
     Parameters:
     - model_path: Path to the TFLite model file.
+    - num_threads: Number of CPU threads the interpreter may use (None = runtime default).
+    - xnnpack: Whether the default XNNPACK delegate may be applied (False runs the builtin kernels only).
+    - output_order: {'boxes': i, 'classes': j, 'scores': k} to override the output order read from the model.
     
     Returns:
     - interpreter: TFLite interpreter with allocated tensors.
     """
+    module = get_interpreter_module()
     print(f"Loading TFLite model from {model_path}")
     start_time = time.time()
-    interpreter = Interpreter(model_path=model_path)
+    kwargs = {'model_path': model_path}
+    if num_threads:
+        kwargs['num_threads'] = int(num_threads)
+    if not xnnpack:
+        op_resolver_type = getattr(module, 'OpResolverType', None)
+        if op_resolver_type is not None:
+            kwargs['experimental_op_resolver_type'] = op_resolver_type.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        else:
+            print("WARNING: This TFLite backend can't disable XNNPACK, using its defaults")
+    interpreter = module.Interpreter(**kwargs)
     interpreter.allocate_tensors()
-    print(f"Model loaded and tensors allocated in {time.time() - start_time:.2f} seconds")
+    spec = get_model_spec(interpreter, output_order=output_order)
+    print(f"Model loaded and tensors allocated in {time.time() - start_time:.2f} seconds: {spec.describe()}")
     return interpreter
 
-def tflite_detect_image(interpreter, base64_image, labels, min_conf=0.5, early_exit=False):
+def postprocess_detections(boxes, classes, scores, min_conf, image_shape):
     """
-    Runs TFLite model on the given base64 encoded image and returns the image with detection results encoded as base64,
-    along with a list of detected objects.
+    Turn the detector's raw output tensors into a structured array.
+    Thresholding, box reordering, scaling and clipping are single NumPy
+    operations over all detections instead of a Python loop.
+
+    Parameters:
+    - boxes: (N, 4) normalized ymin, xmin, ymax, xmax
+    - classes: (N,) class indices
+    - scores: (N,) scores
+    - min_conf: Keep detections with score > min_conf
+    - image_shape: Shape of the source image (height, width, ...)
+
+    Returns:
+    - detections: Structured array with DETECTION_DTYPE
+    """
+    imH, imW = image_shape[:2]
+    keep = (scores > min_conf) & (scores <= 1.0)
+    detections = np.empty(int(np.count_nonzero(keep)), dtype=DETECTION_DTYPE)
+    if not len(detections):
+        return detections
+    detections['class_id'] = classes[keep]
+    detections['score'] = scores[keep]
+    detections['box'] = boxes[keep][:, [1, 0, 3, 2]]
+    box_px = detections['box'] * np.array([imW, imH, imW, imH], dtype=np.float32)
+    # Same clipping as the original drawing code: top-left at least 1, bottom-right inside the image
+    box_px = np.clip(box_px, [1, 1, -np.inf, -np.inf], [np.inf, np.inf, imW, imH])
+    detections['box_px'] = box_px.astype(np.int32)
+    return detections
+
+def render_detections(image, detections, names):
+    """
+    Draw detection boxes and labels on a BGR image (in place).
+
+    Parameters:
+    - image: BGR ndarray to draw on
+    - detections: Structured array with DETECTION_DTYPE
+    - names: Class name per detection
+    """
+    for (xmin, ymin, xmax, ymax), score, object_name in zip(detections['box_px'].tolist(), detections['score'].tolist(), names):
+        # Draw bounding box
+        cv2.rectangle(image, (xmin, ymin), (xmax, ymax), (10, 255, 0), 2)
+        
+        # Draw label background and text
+        label = f'{object_name}: {int(score * 100)}%'
+        labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+        label_ymin = max(ymin, labelSize[1] + 10)
+        cv2.rectangle(image, (xmin, label_ymin - labelSize[1] - 10), 
+                     (xmin + labelSize[0], label_ymin + baseLine - 10), 
+                     (255, 255, 255), cv2.FILLED)
+        cv2.putText(image, label, (xmin, label_ymin - 7), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+    return image
+
+class DetectionResult:
+    """
+    Detections for one frame.
+    The annotated image is only drawn (and later JPEG-encoded) when something
+    asks for it, e.g. the UI or ICS, and is cached after that, so a verdict
+    never waits for drawing or encoding.
+    """
+
+    def __init__(self, frame, detections, labels):
+        self.frame = frame
+        self.detections = detections
+        self.labels = list(labels)
+        self._objects = None
+        self._annotated = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def empty(cls, frame):
+        """Result for a frame the detector didn't run on."""
+        return cls(frame, np.empty(0, dtype=DETECTION_DTYPE), [])
+
+    @classmethod
+    def from_objects(cls, frame, objects):
+        """Rebuild a result from stored detected objects (see to_json)."""
+        labels = []
+        detections = np.empty(len(objects), dtype=DETECTION_DTYPE)
+        for i, obj in enumerate(objects):
+            if obj['class'] not in labels:
+                labels.append(obj['class'])
+            detections[i]['class_id'] = labels.index(obj['class'])
+            detections[i]['score'] = obj['score']
+            detections[i]['box'] = obj['box']
+        if len(detections):
+            imH, imW = frame.shape[:2]
+            box_px = detections['box'] * np.array([imW, imH, imW, imH], dtype=np.float32)
+            box_px = np.clip(box_px, [1, 1, -np.inf, -np.inf], [np.inf, np.inf, imW, imH])
+            detections['box_px'] = box_px.astype(np.int32)
+        return cls(frame, detections, labels)
+
+    def class_name(self, class_id):
+        return self.labels[class_id] if 0 <= class_id < len(self.labels) else str(class_id)
+
+    @property
+    def names(self):
+        return [self.class_name(class_id) for class_id in self.detections['class_id'].tolist()]
+
+    @property
+    def objects(self):
+        """Detections as a list of dicts (class, class_id, score, box), built once."""
+        if self._objects is None:
+            self._objects = [
+                {'class': name, 'class_id': class_id, 'score': score, 'box': box}
+                for name, class_id, score, box in zip(
+                    self.names,
+                    self.detections['class_id'].tolist(),
+                    self.detections['score'].tolist(),
+                    self.detections['box'].tolist()
+                )
+            ]
+        return self._objects
+
+    @property
+    def is_rendered(self):
+        return self._annotated is not None or not len(self.detections)
+
+    @property
+    def annotated(self):
+        """Frame with the detections drawn (the input frame itself when there is nothing to draw)."""
+        if not len(self.detections):
+            return self.frame
+        if self._annotated is None:
+            with self._lock:
+                if self._annotated is None:
+                    start_time = time.time()
+                    # Draw on a copy so the original frame stays untouched for storage
+                    annotated = self.frame.copy()
+                    render_detections(annotated.image, self.detections, self.names)
+                    self._annotated = annotated
+                    print(f"Annotation render time: {(time.time() - start_time) * 1000:.2f}ms")
+        return self._annotated
+
+    def to_json(self):
+        return json.dumps(self.objects)
+
+def tflite_detect(interpreter, frame, labels, min_conf=0.5, roi=None):
+    """
+    Runs TFLite model on an in-memory Frame.
+    Works on the frame's BGR ndarray directly; nothing is drawn, decoded twice or encoded here.
+    With a region of interest only that crop is resized to the model input and
+    the boxes are mapped back to full-frame coordinates.
 
     Parameters:
     - interpreter: TFLite interpreter with allocated tensors.
-    - base64_image: The input image as a base64 encoded string.
+    - frame: The input Frame.
     - labels: List of labels corresponding to the model's classes.
-    - min_conf: Minimum confidence threshold for displaying detected objects.
-    - early_exit: If True, will exit early after checking a few detections (for high gray % images)
+    - min_conf: Minimum confidence threshold for detected objects.
+    - roi: Fractional [xmin, ymin, xmax, ymax] region to run on (None for the full frame).
 
     Returns:
-    - encoded_image: The resulting image with detection results as a base64 encoded string.
-    - detected_objects: A list of dictionaries containing detected objects.
+    - result: DetectionResult (annotation is rendered lazily).
     """
     start_time = time.time()
     
-    # Decode the base64 image
+    # Get the decoded pixels (decoded at most once per frame), cropped to the ROI without copying
     try:
-        # Skip the data:image/jpeg;base64, prefix if present
-        if isinstance(base64_image, str) and ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
-            
-        image_data = base64.b64decode(base64_image)
-        np_arr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if image is None:
-            raise ValueError("Failed to decode image")
+        image = frame.image
+        region, (x0, y0, x1, y1) = frame.crop(roi)
     except Exception as e:
         print(f"Error decoding image: {str(e)}")
         raise
@@ -57,111 +343,34 @@ def tflite_detect_image(interpreter, base64_image, labels, min_conf=0.5, early_e
     decode_time = time.time()
     print(f"Image decode time: {(decode_time - start_time) * 1000:.2f}ms")
     
-    # Get model details
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    height = input_details[0]['shape'][1]
-    width = input_details[0]['shape'][2]
-    
-    # Store original image dimensions
-    imH, imW = image.shape[:2]
-    
-    # Prepare input data - optimize by doing operations in-place when possible
-    # Convert to RGB and resize in one step if possible
-    image_resized = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image_resized = cv2.resize(image_resized, (width, height))
+    spec = get_model_spec(interpreter)
     
-    # Check if model uses floating point input
-    float_input = (input_details[0]['dtype'] == np.float32)
-    
-    # Prepare input tensor
-    if float_input:
-        # Normalize pixel values if using a floating model (i.e. if model is non-quantized)
-        input_data = np.expand_dims(image_resized, axis=0).astype(np.float32)
-        input_data = (input_data - 127.5) / 127.5
-    else:
-        # For quantized models
-        input_data = np.expand_dims(image_resized, axis=0)
+    # Resize, convert and normalize/quantize straight into the interpreter's input buffer
+    spec.input_writer.write(region)
     
     preprocess_time = time.time()
     print(f"Preprocessing time: {(preprocess_time - decode_time) * 1000:.2f}ms")
     
     # Perform the actual detection
-    interpreter.set_tensor(input_details[0]['index'], input_data)
     interpreter.invoke()
     
     inference_time = time.time()
     print(f"Inference time: {(inference_time - preprocess_time) * 1000:.2f}ms")
     
-    # Retrieve detection results
-    boxes = interpreter.get_tensor(output_details[1]['index'])[0]
-    classes = interpreter.get_tensor(output_details[3]['index'])[0]
-    scores = interpreter.get_tensor(output_details[0]['index'])[0]
-    
-    # Process results
-    detected_objects = []
-    
-    # Pre-calculate scaling factors
-    y_scale, x_scale = imH, imW
+    # Retrieve detection results (located and dequantized as the model describes them)
+    boxes, classes, scores = spec.read_outputs(interpreter)
     
-    # Only process detections above threshold
-    valid_indices = np.where(scores > min_conf)[0]
+    if region is not image:
+        # Boxes are normalized to the crop; map them to the full frame (ymin, xmin, ymax, xmax order)
+        imH, imW = image.shape[:2]
+        offset = np.array([y0 / imH, x0 / imW, y0 / imH, x0 / imW], dtype=np.float32)
+        scale = np.array([(y1 - y0) / imH, (x1 - x0) / imW, (y1 - y0) / imH, (x1 - x0) / imW], dtype=np.float32)
+        boxes = boxes * scale + offset
     
-    # For early exit (high gray % images), just check if there are any valid detections
-    # and return quickly without drawing bounding boxes
-    if early_exit:
-        if len(valid_indices) == 0:
-            print("Early exit: No objects detected above threshold")
-            # Return original image and empty objects list
-            _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            encoded_image = base64.b64encode(buffer).decode('utf-8')
-            
-            end_time = time.time()
-            print(f"Early exit total time: {(end_time - start_time) * 1000:.2f}ms")
-            return encoded_image, []
-    
-    for i in valid_indices:
-        if scores[i] <= 1.0:  # Ensure score is valid
-            # Get bounding box coordinates
-            ymin = int(max(1, (boxes[i][0] * y_scale)))
-            xmin = int(max(1, (boxes[i][1] * x_scale)))
-            ymax = int(min(imH, (boxes[i][2] * y_scale)))
-            xmax = int(min(imW, (boxes[i][3] * x_scale)))
-            
-            # Draw bounding box
-            cv2.rectangle(image, (xmin, ymin), (xmax, ymax), (10, 255, 0), 2)
-            
-            # Get class name and prepare label
-            class_id = int(classes[i])
-            object_name = labels[class_id]
-            confidence = int(scores[i] * 100)
-            label = f'{object_name}: {confidence}%'
-            
-            # Draw label background and text
-            labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-            label_ymin = max(ymin, labelSize[1] + 10)
-            cv2.rectangle(image, (xmin, label_ymin - labelSize[1] - 10), 
-                         (xmin + labelSize[0], label_ymin + baseLine - 10), 
-                         (255, 255, 255), cv2.FILLED)
-            cv2.putText(image, label, (xmin, label_ymin - 7), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
-            
-            # Add to detected objects list
-            detected_objects.append({
-                'class': object_name,
-                'score': float(scores[i]),
-                'box': [float(boxes[i][1]), float(boxes[i][0]), float(boxes[i][3]), float(boxes[i][2])]
-            })
+    detections = postprocess_detections(boxes, classes, scores, min_conf, image.shape)
     
     postprocess_time = time.time()
     print(f"Postprocessing time: {(postprocess_time - inference_time) * 1000:.2f}ms")
+    print(f"Total processing time: {(postprocess_time - start_time) * 1000:.2f}ms")
     
-    # Encode result image - use higher JPEG quality for better results
-    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
-    encoded_image = base64.b64encode(buffer).decode('utf-8')
-    
-    encode_time = time.time()
-    print(f"Image encoding time: {(encode_time - postprocess_time) * 1000:.2f}ms")
-    print(f"Total processing time: {(encode_time - start_time) * 1000:.2f}ms")
-    
-    return encoded_image, detected_objects
\ No newline at end of file
+    return DetectionResult(frame, detections, labels)
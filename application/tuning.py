@@ -0,0 +1,332 @@
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from decision_engine import DecisionEngine
+from model_registry import ModelRegistry
+import reinference
+from reinference import (station_settings, load_saved_config, find_databases, iter_car_chunks,
+                         DEFAULT_DB_PATH, DEFAULT_IMAGE_STORE, DEFAULT_CHUNK_SIZE, APP_DIR)
+
+CACHE_PATH = os.path.join(APP_DIR, 'tuning_cache.npz')
+MAX_CACHED_DETECTIONS = 20  # Detections kept per image, highest scores first
+DEFAULT_MIN_CONFS = np.round(np.arange(0.3, 0.951, 0.05), 2)
+DEFAULT_GRAY_THRESHOLDS = np.arange(70.0, 98.1, 1.0)
+DEFAULT_FALSE_GOOD_WEIGHT = 1.0  # Cost of passing a wrong capo relative to stopping a good car
+VERDICTS = ('GOOD', 'NOGOOD')  # Stored outcomes usable as labels ('Pendiente' and 'Error' aren't)
+
+def cache_fingerprint(settings):
+    """
+    What the cached outputs depend on: the model file and the regions and
+    decode used for detection and the gray check. Score and gray thresholds
+    are left out, they are what gets swept.
+    """
+    registry = ModelRegistry(model_variant=settings['model_variant'])
+    try:
+        stat = os.stat(registry.model_path)
+        model_file = [os.path.basename(registry.model_path), stat.st_size, int(stat.st_mtime)]
+    except OSError:
+        model_file = [os.path.basename(registry.model_path), None, None]
+    return {
+        'model_file': model_file,
+        'model_output_order': settings['model_output_order'],
+        'detection_roi': list(settings['detection_roi']),
+        'gray_roi': list(settings['gray_roi']),
+        'gray_decode_reduction': settings['gray_decode_reduction'],
+    }
+
+class OutputCache:
+    """
+    Raw detector outputs (classes, scores, boxes) and gray percentage per stored image.
+    Kept in one .npz file, keyed by '<database>:<table>:<row id>', and thrown
+    away when the model or the regions change. Every image is run through the
+    detector regardless of its gray percentage, so gray thresholds below the
+    one in use can be evaluated too.
+    """
+
+    def __init__(self, fingerprint, keys=(), classes=None, scores=None, boxes=None, gray=None):
+        self.fingerprint = fingerprint
+        self.keys = list(keys)
+        self.classes = classes if classes is not None else np.zeros((0, MAX_CACHED_DETECTIONS), np.float32)
+        self.scores = scores if scores is not None else np.zeros((0, MAX_CACHED_DETECTIONS), np.float32)
+        self.boxes = boxes if boxes is not None else np.zeros((0, MAX_CACHED_DETECTIONS, 4), np.float32)
+        self.gray = gray if gray is not None else np.zeros(0, np.float64)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Load the cache, or return an empty one if it's missing or was built for other settings."""
+        if not os.path.exists(path):
+            return cls(fingerprint)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if json.loads(str(data['fingerprint'])) != fingerprint:
+                    print("Tuning cache was built for another model or region, rebuilding it")
+                    return cls(fingerprint)
+                return cls(fingerprint, data['keys'].tolist(), data['classes'], data['scores'],
+                           data['boxes'], data['gray'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading tuning cache {path}: {str(e)}")
+            return cls(fingerprint)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, fingerprint=json.dumps(self.fingerprint), keys=np.array(self.keys, dtype=str),
+                 classes=self.classes, scores=self.scores, boxes=self.boxes, gray=self.gray)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def extend(self, entries):
+        """Add (key, classes, scores, boxes, gray) entries computed by cache_chunk."""
+        if not entries:
+            return
+        keys, classes, scores, boxes, gray = zip(*entries)
+        start = len(self.keys)
+        self.keys.extend(keys)
+        self.index.update({key: start + i for i, key in enumerate(keys)})
+        self.classes = np.concatenate([self.classes, np.stack(classes)])
+        self.scores = np.concatenate([self.scores, np.stack(scores)])
+        self.boxes = np.concatenate([self.boxes, np.stack(boxes)])
+        self.gray = np.concatenate([self.gray, np.asarray(gray, dtype=np.float64)])
+
+def _pad(values, shape):
+    padded = np.zeros(shape, dtype=np.float32)
+    count = min(len(values), MAX_CACHED_DETECTIONS)
+    padded[:count] = values[:count]
+    return padded
+
+def cache_chunk(rows):
+    """
+    Worker task: gray percentage and raw detector outputs for a chunk of rows
+    (runs in a process set up by reinference.init_worker).
+
+    Returns:
+        tuple: (cache entries, [(key, error)] for rows that couldn't be read)
+    """
+    entries = []
+    errors = []
+    for row in rows:
+        try:
+            frame = reinference.load_row_frame(row)
+            gray_percentage = reinference.row_gray_percentage(frame)
+            boxes, classes, scores = reinference.run_detector(frame)
+            order = np.argsort(-scores, kind='stable')
+            entries.append((row['key'], _pad(classes[order], MAX_CACHED_DETECTIONS),
+                            _pad(scores[order], MAX_CACHED_DETECTIONS),
+                            _pad(boxes[order], (MAX_CACHED_DETECTIONS, 4)), gray_percentage))
+        except Exception as e:
+            errors.append((row['key'], str(e)))
+    return entries, errors
+
+def collect_samples(db_paths, include_unreviewed=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Labelled cars to tune on, each car once.
+    Cars with operator feedback are labelled with FeedbackLog.real_outcome;
+    with include_unreviewed the other cars count as correctly judged and are
+    labelled with their stored outcome, if it is a verdict (GOOD or NOGOOD):
+    cars still pending or whose inspection failed are left out.
+
+    Yields:
+        list: Row chunks with 'key' and 'truth' added
+    """
+    feedback = {}
+    for db_path in reversed(db_paths):
+        feedback.update(reinference.load_feedback(db_path))
+    seen = set()
+    tables = ['car_log', 'feedback_log']
+    for db_path in db_paths:
+        for table in tables:
+            for rows in iter_car_chunks(db_path, chunk_size, table=table):
+                chunk = []
+                for row in rows:
+                    if row['car_id'] in seen:
+                        continue
+                    truth = feedback.get(row['car_id'])
+                    if truth is None:
+                        if not include_unreviewed or row['outcome'] not in VERDICTS:
+                            continue
+                        truth = row['outcome']
+                    seen.add(row['car_id'])
+                    row['key'] = f"{os.path.basename(db_path)}:{table}:{row['id']}"
+                    row['truth'] = truth
+                    chunk.append(row)
+                if chunk:
+                    yield chunk
+
+def build_cache(settings, db_paths, cache_path=CACHE_PATH, image_store_root=DEFAULT_IMAGE_STORE,
+                include_unreviewed=True, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Bring the output cache up to date with the stored cars; only images not
+    cached yet go through the detector, on a process pool.
+
+    Returns:
+        tuple: (OutputCache, samples as dicts with key, car_id, expected_part, truth)
+    """
+    workers = workers or os.cpu_count() or 1
+    cache = OutputCache.load(cache_path, cache_fingerprint(settings))
+    cached_before = len(cache)
+    samples = []
+    errors = []
+    pending = set()
+    executor = None
+    start_time = time.time()
+
+    def collect(done):
+        for future in done:
+            pending.discard(future)
+            entries, chunk_errors = future.result()
+            cache.extend(entries)
+            errors.extend(chunk_errors)
+
+    try:
+        for rows in collect_samples(db_paths, include_unreviewed, chunk_size):
+            samples.extend({key: row[key] for key in ('key', 'car_id', 'expected_part', 'truth')} for row in rows)
+            missing = [row for row in rows if row['key'] not in cache]
+            if not missing:
+                continue
+            if executor is None:
+                # The pool (and a model load per worker) is only needed when something isn't cached yet
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=reinference.init_worker,
+                                               initargs=(settings, image_store_root))
+            pending.add(executor.submit(cache_chunk, missing))
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if len(cache) > cached_before or errors:
+        cache.save(cache_path)
+        print(f"Cached {len(cache) - cached_before} images in {time.time() - start_time:.2f}s "
+              f"({len(errors)} could not be read)")
+        for key, error in errors[:10]:
+            print(f"  {key}: {error}")
+
+    samples = [sample for sample in samples if sample['key'] in cache]
+    return cache, samples
+
+def sweep(cache, samples, labels, settings, min_confs=DEFAULT_MIN_CONFS, gray_thresholds=DEFAULT_GRAY_THRESHOLDS,
+          false_good_weight=DEFAULT_FALSE_GOOD_WEIGHT):
+    """
+    Error rates of every (min_conf_threshold, gray threshold) pair over the cached cars.
+    A false GOOD passes a car whose capo was wrong, a false NOGOOD stops a
+    good car; the cost is false_good_weight * false GOOD + false NOGOOD.
+    The station's current values are always part of the grid.
+
+    Returns:
+        dict: Per-setting results (lowest cost first), the current setting and the recommended config
+    """
+    engine = DecisionEngine(settings['decision_rules'])
+    current_conf = float(settings['min_conf_threshold'])
+    current_gray = engine.gray_threshold
+    min_confs = np.union1d(np.asarray(min_confs, dtype=np.float64), [current_conf])
+    gray_thresholds = np.union1d(np.asarray(gray_thresholds, dtype=np.float64), [current_gray])
+
+    rows = np.fromiter((cache.index[s['key']] for s in samples), dtype=np.intp, count=len(samples))
+    part_index = {part: i for i, part in enumerate(engine.parts)}
+    expected = np.fromiter((part_index.get(s['expected_part'], -1) for s in samples), dtype=np.int64,
+                           count=len(samples))
+    truth_good = np.fromiter((s['truth'] == 'GOOD' for s in samples), dtype=bool, count=len(samples))
+
+    start_time = time.perf_counter()
+    parts = engine.classify_sweep(cache.classes[rows], cache.scores[rows], labels, min_confs,
+                                  cache.gray[rows], gray_thresholds, settings['gray_detection_enabled'])
+    predicted_good = parts == expected
+    false_good = np.count_nonzero(predicted_good & ~truth_good, axis=2)
+    false_nogood = np.count_nonzero(~predicted_good & truth_good, axis=2)
+    cost = false_good_weight * false_good + false_nogood
+    sweep_ms = (time.perf_counter() - start_time) * 1000
+
+    cars = len(samples)
+    # Lowest cost first; ties go to the setting closest to the current one
+    distance = (np.abs(min_confs - current_conf)[:, None] * 100 + np.abs(gray_thresholds - current_gray)[None, :])
+    order = np.lexsort((distance.ravel(), cost.ravel()))
+    results = []
+    for flat in order.tolist():
+        i, j = divmod(flat, len(gray_thresholds))
+        results.append({
+            'min_conf_threshold': float(min_confs[i]),
+            'gray_threshold': float(gray_thresholds[j]),
+            'false_good': int(false_good[i, j]),
+            'false_nogood': int(false_nogood[i, j]),
+            'error_rate': (int(false_good[i, j]) + int(false_nogood[i, j])) / cars if cars else None,
+            'cost': float(cost[i, j]),
+        })
+    current = next(r for r in results
+                   if r['min_conf_threshold'] == current_conf and r['gray_threshold'] == current_gray)
+    best = results[0] if results else None
+    recommended = None
+    if best is not None:
+        rules = copy.deepcopy(engine.rules)
+        rules['gray_threshold'] = best['gray_threshold']
+        recommended = {'min_conf_threshold': best['min_conf_threshold'], 'decision_rules': rules}
+    return {
+        'cars': cars,
+        'good_cars': int(truth_good.sum()),
+        'settings_evaluated': len(results),
+        'sweep_ms': round(sweep_ms, 2),
+        'current': current,
+        'best': best,
+        'recommended_config': recommended,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune min_conf_threshold and the gray threshold on stored cars')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Station database (default: instance/car_logs.db)')
+    parser.add_argument('--no-backups', action='store_true', help='Skip the car_logs_backup_*.db files')
+    parser.add_argument('--feedback-only', action='store_true',
+                        help='Only use cars with operator feedback (default: other cars count as correct)')
+    parser.add_argument('--cache', default=CACHE_PATH, help='Output cache file')
+    parser.add_argument('--min-confs', nargs='+', type=float, help='Score thresholds to try')
+    parser.add_argument('--gray-thresholds', nargs='+', type=float, help='Gray thresholds to try')
+    parser.add_argument('--false-good-weight', type=float, default=DEFAULT_FALSE_GOOD_WEIGHT,
+                        help='Cost of a false GOOD relative to a false NOGOOD')
+    parser.add_argument('--workers', type=int, help='Worker processes for caching (default: CPU count)')
+    parser.add_argument('--top', type=int, default=10, help='Settings to list')
+    parser.add_argument('--output', help='Write the full sweep as JSON to this file')
+    args = parser.parse_args()
+
+    settings = station_settings(load_saved_config())
+    db_paths = find_databases(args.db, include_backups=not args.no_backups)
+    if not db_paths:
+        parser.error(f"No database found at {args.db}")
+    cache, samples = build_cache(settings, db_paths, cache_path=args.cache,
+                                 include_unreviewed=not args.feedback_only, workers=args.workers)
+    if not samples:
+        print("No labelled cars to tune on")
+        return
+    with open(ModelRegistry(model_variant=settings['model_variant']).label_path, 'r') as f:
+        labels = [line.strip() for line in f.readlines()]
+
+    report = sweep(cache, samples, labels, settings,
+                   min_confs=args.min_confs if args.min_confs else DEFAULT_MIN_CONFS,
+                   gray_thresholds=args.gray_thresholds if args.gray_thresholds else DEFAULT_GRAY_THRESHOLDS,
+                   false_good_weight=args.false_good_weight)
+    print(f"\n{report['cars']} cars ({report['good_cars']} GOOD), {report['settings_evaluated']} settings "
+          f"evaluated in {report['sweep_ms']:.2f}ms")
+    print(f"{'min_conf':>8} {'gray':>6} {'false GOOD':>10} {'false NOGOOD':>12} {'error rate':>10}")
+    for r in [report['current']] + report['results'][:args.top]:
+        marker = '  (current)' if r is report['current'] else ''
+        print(f"{r['min_conf_threshold']:>8.2f} {r['gray_threshold']:>6.1f} {r['false_good']:>10} "
+              f"{r['false_nogood']:>12} {r['error_rate'] * 100:>9.2f}%{marker}")
+    print(f"\nRecommended config (POST /config body):\n{json.dumps(report['recommended_config'], indent=2)}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Full sweep written to {args.output}")
+
+if __name__ == "__main__":
+    main()
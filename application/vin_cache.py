@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 600        # Seconds a VIN is reused; a body number maps to one car while it is on the line
+DEFAULT_MAX_SIZE = 256   # Body numbers kept, least recently used evicted first
+
+class VinCache:
+    """
+    VIN per body number, with a TTL and a bounded size (LRU).
+    The PLC reader calls prefetch() as soon as a message is parsed, so the
+    lookup runs in the background while the car is being inspected; a later
+    get() for the same body number returns the cached VIN or waits for the
+    lookup already in flight instead of starting another one. Failed lookups
+    (None) aren't cached, so the next get() asks ICS again.
+    """
+
+    def __init__(self, lookup_async, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        """
+        Args:
+            lookup_async (callable): lookup_async(body_num) -> Future with the VIN or None
+                (e.g. ICSIntegration.request_vin_async)
+            ttl (float): Seconds a VIN stays valid
+            max_size (int): Maximum number of cached body numbers
+        """
+        self.lookup_async = lookup_async
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.RLock()  # Reentrant: a lookup that is already done stores its VIN from add_done_callback
+        self._entries = OrderedDict()  # body_num -> (vin, expires_at)
+        self._in_flight = {}           # body_num -> Future
+        self._stats = {'hits': 0, 'misses': 0, 'waited_on_prefetch': 0, 'prefetches': 0,
+                       'lookups': 0, 'failed_lookups': 0, 'evictions': 0}
+
+    def _cached(self, body_num):
+        """Fresh cached VIN or None; call with the lock held."""
+        entry = self._entries.get(body_num)
+        if entry is None:
+            return None
+        vin, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[body_num]
+            return None
+        self._entries.move_to_end(body_num)
+        return vin
+
+    def _start_lookup(self, body_num):
+        """Start (or join) the lookup for a body number; call with the lock held."""
+        future = self._in_flight.get(body_num)
+        if future is None:
+            self._stats['lookups'] += 1
+            future = self.lookup_async(body_num)
+            self._in_flight[body_num] = future
+            future.add_done_callback(lambda f: self._store(body_num, f))
+        return future
+
+    def _store(self, body_num, future):
+        try:
+            vin = future.result()
+        except Exception as e:
+            print(f"VIN lookup for body {body_num} failed: {str(e)}")
+            vin = None
+        with self._lock:
+            self._in_flight.pop(body_num, None)
+            if not vin:
+                self._stats['failed_lookups'] += 1
+                return
+            self._entries[body_num] = (vin, time.monotonic() + self.ttl)
+            self._entries.move_to_end(body_num)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def prefetch(self, body_num):
+        """Start looking up a body number's VIN in the background, unless it's cached or in flight."""
+        if not body_num:
+            return
+        with self._lock:
+            if self._cached(body_num) is not None or body_num in self._in_flight:
+                return
+            self._stats['prefetches'] += 1
+            self._start_lookup(body_num)
+
+    def get(self, body_num, timeout=None):
+        """
+        Return the VIN for a body number: cached, from the lookup in flight, or from a new lookup.
+
+        Args:
+            body_num (str): Body number
+            timeout (float): Seconds to wait for a lookup (None: the ICS client's own timeouts apply)
+
+        Returns:
+            str or None: The VIN, or None if ICS doesn't know it or didn't answer
+        """
+        with self._lock:
+            vin = self._cached(body_num)
+            if vin is not None:
+                self._stats['hits'] += 1
+                return vin
+            if body_num in self._in_flight:
+                self._stats['waited_on_prefetch'] += 1
+            else:
+                self._stats['misses'] += 1
+            future = self._start_lookup(body_num)
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            print(f"Error waiting for VIN of body {body_num}: {str(e)}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['in_flight'] = len(self._in_flight)
+        stats['ttl'] = self.ttl
+        stats['max_size'] = self.max_size
+        return stats
@@ -0,0 +1,89 @@
+import threading
+import time
+import traceback
+
+class WarmupTracker:
+    """
+    Runs the station warm-up steps once at startup and records their outcome.
+    Each step (model load, dummy inferences, camera, database) is timed; the
+    station is ready when every required step has succeeded. Optional steps
+    (e.g. the camera when sample images are configured) are reported but
+    don't block readiness.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps = []
+        self._thread = None
+        self.started_at = None
+        self.finished_at = None
+
+    def run_step(self, name, fn, required=True):
+        """
+        Run one warm-up step and record its duration and result.
+
+        Args:
+            name (str): Step name, as reported by /ready
+            fn (callable): fn() -> optional detail (dict or str) for the report
+            required (bool): Whether the station is only ready if this step succeeds
+
+        Returns:
+            bool: True if the step succeeded
+        """
+        step = {'name': name, 'status': 'running', 'required': required,
+                'duration_ms': None, 'detail': None, 'error': None}
+        with self._lock:
+            self._steps.append(step)
+        start_time = time.time()
+        try:
+            step['detail'] = fn()
+            step['status'] = 'ok'
+        except Exception as e:
+            print(f"Warm-up step '{name}' failed: {str(e)}")
+            traceback.print_exc()
+            step['status'] = 'failed'
+            step['error'] = str(e)
+        step['duration_ms'] = (time.time() - start_time) * 1000
+        print(f"Warm-up step '{name}': {step['status']} in {step['duration_ms']:.2f}ms")
+        return step['status'] == 'ok'
+
+    def start(self, steps):
+        """
+        Run the steps on a background thread, so the server answers /ready while warming up.
+
+        Args:
+            steps (list): (name, fn, required) tuples, run in order
+        """
+        def run():
+            self.started_at = time.time()
+            print("=== Warm-up started ===")
+            for name, fn, required in steps:
+                self.run_step(name, fn, required)
+            self.finished_at = time.time()
+            print(f"=== Warm-up finished in {(self.finished_at - self.started_at) * 1000:.2f}ms "
+                  f"({'ready' if self.is_ready else 'NOT ready'}) ===")
+
+        self._thread = threading.Thread(target=run, name='warmup', daemon=True)
+        self._thread.start()
+
+    @property
+    def is_finished(self):
+        return self.finished_at is not None
+
+    @property
+    def is_ready(self):
+        with self._lock:
+            steps = list(self._steps)
+        return self.is_finished and all(step['status'] == 'ok' for step in steps if step['required'])
+
+    def status(self):
+        """Return readiness and the per-step report."""
+        with self._lock:
+            steps = [dict(step) for step in self._steps]
+        now = self.finished_at or time.time()
+        return {
+            'ready': self.is_ready,
+            'warming_up': self.started_at is not None and not self.is_finished,
+            'elapsed_ms': (now - self.started_at) * 1000 if self.started_at else None,
+            'steps': steps,
+        }
@@ -2,6 +2,7 @@ import socket
 import time
 import threading
 import random
+import argparse
 
 # Global variable to track the active connection
 active_connection = None
@@ -41,7 +42,19 @@ def create_galc_message(empty=False):
     return message
 
 
-def handle_client(conn, addr):
+def receive_responses(conn, count):
+    """Read `count` 26-byte responses, however TCP splits or coalesces them."""
+    expected = 26 * count
+    data = bytearray()
+    while len(data) < expected:
+        chunk = conn.recv(expected - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+def handle_client(conn, addr, burst_size=1):
     global active_connection
     if active_connection is not None:
         print(f"Connection attempt from {addr} rejected. Already connected to {active_connection}.")
@@ -61,30 +74,35 @@ def handle_client(conn, addr):
             try:
                 # Check if it's time to send car data
                 if current_time - last_car_time >= car_data_interval:
-                    # Send car data
-                    message = create_galc_message(empty=False)
-                    conn.sendall(message)
-                    readable_message = f"Sent car data - Receiver: {message[0:6].decode()}, Sender: {message[6:12].decode()}, Serial: {message[12:16].decode()}, Trigger: {message[44]:02d}"
-                    print(readable_message)
+                    # Send car data; in burst mode several telegrams go out back-to-back
+                    messages = [create_galc_message(empty=False) for _ in range(burst_size)]
+                    conn.sendall(b"".join(messages))
+                    for message in messages:
+                        readable_message = f"Sent car data - Receiver: {message[0:6].decode()}, Sender: {message[6:12].decode()}, Serial: {message[12:16].decode()}, Trigger: {message[44]:02d}"
+                        print(readable_message)
                     last_car_time = current_time
+                    expected_responses = len(messages)
                 else:
                     # Send keep-alive message
                     message = create_galc_message(empty=True)
                     conn.sendall(message)
                     print("Sent keep-alive message")
+                    expected_responses = 1
 
                 # Wait for response with timeout
-                conn.settimeout(2.0)  # Set timeout for receiving response
+                conn.settimeout(2.0 * expected_responses)  # Set timeout for receiving responses
                 try:
-                    data = conn.recv(26)
+                    data = receive_responses(conn, expected_responses)
                     if not data:
                         print("Client disconnected (no data)")
                         break
-                    if len(data) != 26:
-                        print(f"Warning: Unexpected response length: {len(data)}. Expected 26 bytes.")
+                    if len(data) != 26 * expected_responses:
+                        print(f"Warning: Unexpected response length: {len(data)}. Expected {26 * expected_responses} bytes.")
                         continue
                     
-                    print(f"Received client response: Terminal: {data[0:6].decode()}, Sender: {data[6:12].decode()}, Serial: {data[12:16].decode()}, Status: {data[25]}")
+                    for i in range(0, len(data), 26):
+                        response = data[i:i + 26]
+                        print(f"Received client response: Terminal: {response[0:6].decode()}, Sender: {response[6:12].decode()}, Serial: {response[12:16].decode()}, Status: {response[25]}")
                 except socket.timeout:
                     print("No response received within timeout, continuing...")
                     continue
@@ -113,10 +131,7 @@ def handle_client(conn, addr):
         active_connection = None  # Reset the active connection
 
 
-def start_fake_server():
-    host = "127.0.0.1"
-    port = 54321
-
+def start_fake_server(host="127.0.0.1", port=54321, burst_size=1):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((host, port))
@@ -125,8 +140,15 @@ def start_fake_server():
 
         while True:
             conn, addr = server_socket.accept()
-            threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+            threading.Thread(target=handle_client, args=(conn, addr, burst_size), daemon=True).start()
 
 
 if __name__ == "__main__":
-    start_fake_server()
+    parser = argparse.ArgumentParser(description='Fake GALC Server')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
+    parser.add_argument('--port', type=int, default=54321, help='Port to bind to')
+    parser.add_argument('--burst', type=int, default=1,
+                        help='Car telegrams sent back-to-back each time car data is due')
+    args = parser.parse_args()
+
+    start_fake_server(args.host, args.port, max(1, args.burst))
@@ -0,0 +1,232 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+VIN_PATH = '/icsQueryService/api/Query/Results/'
+DEFECT_PATH = '/icsexternalinterface/vehicledataservice.svc/AddDeviceDefectsWithImage'
+
+class FakeIcs:
+    """Behaviour and counters of the fake ICS server, shared by all request threads."""
+
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, hang_rate=0.0, hang_seconds=30,
+                 unknown_rate=0.0, max_rps=0, reject_over_limit=False, save_dir=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.unknown_rate = unknown_rate
+        self.max_rps = max_rps
+        self.reject_over_limit = reject_over_limit
+        self.save_dir = save_dir
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self.counts = {'vin': 0, 'vin_unknown': 0, 'defects': 0, 'errors': 0, 'hangs': 0,
+                       'throttled': 0, 'rejected': 0, 'bad_requests': 0}
+        self.vins = {}  # vin -> defects received
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def throttle(self):
+        """
+        Apply --max-rps: wait for this request's slot, or return False if it
+        should be rejected (--reject-over-limit) instead of queued.
+        """
+        if not self.max_rps:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            wait = slot - now
+            if wait > 0 and self.reject_over_limit:
+                self.counts['rejected'] += 1
+                return False
+            self._next_slot = slot + 1.0 / self.max_rps
+            if wait > 0:
+                self.counts['throttled'] += 1
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def delay(self):
+        """Sleep for the configured latency; returns True if this request should fail."""
+        if self.hang_rate and random.random() < self.hang_rate:
+            self.count('hangs')
+            time.sleep(self.hang_seconds)
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            self.count('errors')
+            return True
+        return False
+
+    @staticmethod
+    def vin_for(body_num):
+        """A stable 17-character VIN for a body number, so repeated lookups agree."""
+        digest = hashlib.sha1(body_num.encode()).hexdigest().upper()
+        return f"3VW{digest[:14]}"
+
+    def record_defect(self, payload):
+        vin = payload.get('Vin')
+        with self._lock:
+            self.counts['defects'] += 1
+            self.vins[vin] = self.vins.get(vin, 0) + 1
+            repeated = self.vins[vin] > 1
+        for i, defect in enumerate(payload.get('ToolDefectsWithImage') or []):
+            image = defect.get('DefectImageString') or ''
+            print(f"Defect for VIN {vin}: {defect.get('ToolId')} {defect.get('Discrepancy')} - "
+                  f"{defect.get('Comment')} ({len(image)} base64 chars)"
+                  f"{' [REPEATED VIN]' if repeated else ''}")
+            if self.save_dir and image:
+                path = os.path.join(self.save_dir, f"{vin}_{int(time.time() * 1000)}_{i}.jpg")
+                try:
+                    with open(path, 'wb') as f:
+                        f.write(base64.b64decode(image))
+                except (OSError, ValueError) as e:
+                    print(f"Could not save defect image: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'distinct_vins': len(self.vins),
+                    'repeated_vins': sum(1 for n in self.vins.values() if n > 1)}
+
+def make_handler(ics):
+    class IcsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real server, so client connection pooling is exercised
+
+        def log_message(self, format, *args):
+            pass  # Requests are summarised by the handlers instead
+
+        def send_body(self, status, body, content_type):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def gate(self):
+            """Throughput limit, latency and injected errors; returns False if the response was already sent."""
+            if not ics.throttle():
+                self.send_body(503, 'Too many requests', 'text/plain')
+                return False
+            if ics.delay():
+                self.send_body(500, 'Simulated ICS error', 'text/plain')
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                self.send_body(200, json.dumps(ics.stats()), 'application/json')
+                return
+            if url.path.rstrip('/') != VIN_PATH.rstrip('/'):
+                self.send_body(404, 'Not found', 'text/plain')
+                return
+            query = parse_qs(url.query)
+            body_num = (query.get('BODY_NUM') or [''])[0]
+            if query.get('query_name', [''])[0] != 'GET_VIN' or not body_num:
+                ics.count('bad_requests')
+                self.send_body(400, 'query_name=GET_VIN and BODY_NUM are required', 'text/plain')
+                return
+            if not self.gate():
+                return
+            if ics.unknown_rate and random.random() < ics.unknown_rate:
+                ics.count('vin_unknown')
+                print(f"VIN query for body {body_num}: unknown")
+                self.send_body(200, '<Results></Results>', 'application/xml')
+                return
+            ics.count('vin')
+            vin = ics.vin_for(body_num)
+            print(f"VIN query for body {body_num}: {vin}")
+            self.send_body(200, f'<Results><DATA><BODY_NUM>{body_num}</BODY_NUM><VIN>{vin}</VIN></DATA></Results>',
+                           'application/xml')
+
+        def do_POST(self):
+            if urlparse(self.path).path != DEFECT_PATH:
+                self.read_body()
+                self.send_body(404, 'Not found', 'text/plain')
+                return
+            try:
+                payload = json.loads(self.read_body() or b'{}')
+            except ValueError:
+                ics.count('bad_requests')
+                self.send_body(400, 'Invalid JSON', 'text/plain')
+                return
+            if not payload.get('Vin') or not payload.get('ToolDefectsWithImage'):
+                ics.count('bad_requests')
+                self.send_body(400, 'Vin and ToolDefectsWithImage are required', 'text/plain')
+                return
+            if not self.gate():
+                return
+            ics.record_defect(payload)
+            self.send_body(200, json.dumps({'Result': 'OK'}), 'application/json')
+
+    return IcsHandler
+
+def report_stats(ics, interval):
+    """Print the counters every `interval` seconds."""
+    while True:
+        time.sleep(interval)
+        print(f"Stats: {json.dumps(ics.stats())}")
+
+def start_fake_server(host='127.0.0.1', port=8090, stats_interval=30, **behaviour):
+    """Start a fake ICS server answering the VIN query and the defect service."""
+    ics = FakeIcs(**behaviour)
+    if ics.save_dir:
+        os.makedirs(ics.save_dir, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), make_handler(ics))
+    server.daemon_threads = True
+    print(f"Fake ICS server listening on http://{host}:{port}")
+    print(f"Point the application at it with ICS_BASE_URL=http://{host}:{port} or config ics_base_url")
+    print(f"Latency {ics.latency_ms}+-{ics.jitter_ms} ms, error rate {ics.error_rate:.0%}, "
+          f"hang rate {ics.hang_rate:.0%} ({ics.hang_seconds}s), unknown VIN rate {ics.unknown_rate:.0%}, "
+          f"max {ics.max_rps or 'unlimited'} requests/s{' (rejecting excess)' if ics.reject_over_limit else ''}")
+    if stats_interval:
+        threading.Thread(target=report_stats, args=(ics, stats_interval), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer shutdown requested")
+    finally:
+        server.server_close()
+        print(f"Final stats: {json.dumps(ics.stats())}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake ICS Server')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
+    parser.add_argument('--port', type=int, default=8090, help='Port to bind to')
+    parser.add_argument('--latency', type=float, default=50, help='Response latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0, help='Random +- variation of the latency in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0,
+                        help='Fraction of requests that stall for --hang-seconds (to trip client read timeouts)')
+    parser.add_argument('--hang-seconds', type=float, default=30, help='How long a stalled request waits')
+    parser.add_argument('--unknown-rate', type=float, default=0.0, help='Fraction of VIN queries that return no VIN')
+    parser.add_argument('--max-rps', type=float, default=0,
+                        help='Requests per second the server handles; excess requests queue (0: unlimited)')
+    parser.add_argument('--reject-over-limit', action='store_true',
+                        help='With --max-rps, answer excess requests with HTTP 503 instead of queueing them')
+    parser.add_argument('--save-dir', help='Directory to save received defect images to')
+    parser.add_argument('--stats-interval', type=int, default=30, help='Seconds between stats reports (0: off)')
+
+    args = parser.parse_args()
+
+    start_fake_server(args.host, args.port, args.stats_interval, latency_ms=args.latency, jitter_ms=args.jitter,
+                      error_rate=args.error_rate, hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                      unknown_rate=args.unknown_rate, max_rps=args.max_rps,
+                      reject_over_limit=args.reject_over_limit, save_dir=args.save_dir)
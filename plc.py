@@ -151,6 +151,59 @@ def send_periodic_messages(conn, interval=30):
             print(f"Error sending message: {e}")
             return
 
+def send_burst(conn, count=10, split=False, interval=5, repeat=True):
+    """
+    Send bursts of messages back-to-back to exercise the backend's stream framing.
+    With split=True the burst is written in random-sized chunks, so messages are
+    cut across TCP segments. Each response is a single byte, so they are counted
+    byte by byte no matter how TCP coalesces them.
+    """
+    while True:
+        messages = []
+        for _ in range(count):
+            messages.append(f"{generate_sequence()}{generate_body()}{random.choice(['01', '05', '08'])}")
+        payload = ''.join(messages).encode()
+
+        try:
+            if split:
+                pos = 0
+                while pos < len(payload):
+                    size = random.randint(1, 17)
+                    conn.sendall(payload[pos:pos + size])
+                    pos += size
+                    time.sleep(0.01)
+            else:
+                conn.sendall(payload)
+            print(f"Sent burst of {count} PLC messages ({len(payload)} bytes, {'split' if split else 'coalesced'})")
+
+            start_time = time.time()
+            responses = []
+            while len(responses) < count and time.time() - start_time < 30 + count * 5:
+                try:
+                    data = conn.recv(1024)
+                except socket.timeout:
+                    continue
+                if not data:
+                    print("Connection closed by server")
+                    return
+                responses.extend(data)
+
+            good = sum(1 for r in responses if r == 0b00000001)
+            nogood = sum(1 for r in responses if r == 0b00000010)
+            elapsed = time.time() - start_time
+            print(f"Burst result: {len(responses)}/{count} responses "
+                  f"({good} GOOD, {nogood} NOGOOD) in {elapsed:.2f}s")
+            if len(responses) < count:
+                print(f"WARNING: {count - len(responses)} car(s) were not answered")
+        except (ConnectionResetError, BrokenPipeError) as e:
+            print(f"Connection lost: {e}")
+            return
+
+        if not repeat:
+            return
+        print(f"Next burst in {interval} seconds")
+        time.sleep(interval)
+
 def run_button_simulator(conn):
     """Simulate button presses to send car messages"""
     print("\n=== BUTTON SIMULATOR MODE ===")
@@ -283,11 +336,13 @@ def run_button_simulator(conn):
     except:
         pass
 
-def handle_client(conn, addr, interval, manual_mode):
+def handle_client(conn, addr, interval, manual_mode, burst_size=0, split=False):
     """Handle a client connection."""
     print(f"Connected by {addr}")
     try:
-        if manual_mode:
+        if burst_size:
+            send_burst(conn, burst_size, split=split, interval=interval)
+        elif manual_mode:
             while True:
                 print("\nPress Enter to send a message, or type a capot type (1, 2, 3) and press Enter:")
                 user_input = input()
@@ -313,7 +368,7 @@ def handle_client(conn, addr, interval, manual_mode):
         except:
             pass
 
-def start_fake_server(host='127.0.0.1', port=12345, interval=5, mode='auto'):
+def start_fake_server(host='127.0.0.1', port=12345, interval=5, mode='auto', burst_size=10, split=False):
     """Start a fake PLC server that sends messages."""
     print(f"Starting fake PLC server on {host}:{port}")
     server_socket = None
@@ -324,6 +379,9 @@ def start_fake_server(host='127.0.0.1', port=12345, interval=5, mode='auto'):
         print("Manual mode: You will need to trigger messages manually")
     elif mode == 'button':
         print("Button simulator mode: Press keys to simulate button presses")
+    elif mode == 'burst':
+        print(f"Burst mode: {burst_size} messages back-to-back every {interval} seconds"
+              f"{' (split across segments)' if split else ''}")
     
     try:
         # Create a socket object
@@ -351,7 +409,8 @@ def start_fake_server(host='127.0.0.1', port=12345, interval=5, mode='auto'):
                     # Handle client in a separate thread for auto/manual modes
                     client_thread = threading.Thread(
                         target=handle_client, 
-                        args=(conn, addr, interval, mode == 'manual'),
+                        args=(conn, addr, interval, mode == 'manual',
+                              burst_size if mode == 'burst' else 0, split),
                         daemon=True
                     )
                     client_thread.start()
@@ -386,10 +445,13 @@ if __name__ == '__main__':
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
     parser.add_argument('--port', type=int, default=12345, help='Port to bind to')
     parser.add_argument('--interval', type=int, default=5, help='Interval between messages in seconds')
-    parser.add_argument('--mode', choices=['auto', 'manual', 'button'], default='auto',
-                        help='Operation mode: auto (periodic messages), manual (type to send), or button (simulate buttons)')
+    parser.add_argument('--mode', choices=['auto', 'manual', 'button', 'burst'], default='auto',
+                        help='Operation mode: auto (periodic messages), manual (type to send), button (simulate buttons), '
+                             'or burst (several messages back-to-back)')
+    parser.add_argument('--burst-size', type=int, default=10, help='Messages per burst in burst mode')
+    parser.add_argument('--split', action='store_true', help='In burst mode, split messages across TCP segments')
     
     args = parser.parse_args()
     
     # Start the server with the specified mode
-    start_fake_server(args.host, args.port, args.interval, args.mode)
+    start_fake_server(args.host, args.port, args.interval, args.mode, args.burst_size, args.split)
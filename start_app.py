@@ -5,6 +5,11 @@ import platform
 import sys
 import shutil
 import json
+import urllib.request
+import urllib.error
+
+BACKEND_READY_URL = 'http://localhost:5000/ready'
+BACKEND_READY_TIMEOUT = 180  # Seconds; model load and warm-up are slow on a Raspberry Pi
 
 def get_available_memory_mb():
     """Get available memory in MB"""
@@ -72,6 +77,38 @@ def start_backend():
     threading.Thread(target=print_output, daemon=True).start()
     return backend_process
 
+def wait_for_backend_ready(backend_process, url=BACKEND_READY_URL, timeout=BACKEND_READY_TIMEOUT, interval=1.0):
+    """
+    Poll the backend's /ready endpoint until the station is warmed up.
+    
+    Returns:
+        bool: True when the backend reported ready, False on timeout or if it exited
+    """
+    deadline = time.time() + timeout
+    last_status = None
+    while time.time() < deadline:
+        if backend_process.poll() is not None:
+            print(f"Backend exited with code {backend_process.returncode}")
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except urllib.error.HTTPError as e:
+            # 503 while warming up; show which step it is on
+            try:
+                steps = json.loads(e.read().decode('utf-8')).get('steps', [])
+                status = ', '.join(f"{step['name']}: {step['status']}" for step in steps) or 'starting'
+            except (ValueError, AttributeError):
+                status = f"HTTP {e.code}"
+            if status != last_status:
+                print(f"Backend warming up ({status})")
+                last_status = status
+        except (urllib.error.URLError, OSError):
+            pass  # Not listening yet
+        time.sleep(interval)
+    return False
+
 def start_frontend(dev_mode=True, skip_build=False):
     # Store the original directory
     original_dir = os.getcwd()
@@ -299,8 +336,11 @@ def main():
         print("Build process will be skipped (--skip-build flag detected)")
 
     backend_process = start_backend()
-    print("Waiting for backend to start...")
-    time.sleep(5)  # Wait for the backend to start
+    print("Waiting for backend to be ready...")
+    if wait_for_backend_ready(backend_process):
+        print("Backend is ready")
+    else:
+        print(f"WARNING: Backend not ready after {BACKEND_READY_TIMEOUT} seconds, check {BACKEND_READY_URL}")
 
     frontend_process = start_frontend(dev_mode, skip_build)
     print("Waiting for frontend to start...")